@@ -0,0 +1,44 @@
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from typing import List, Optional
+
+from src.postprocess.remux import RemuxPipeline
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+_pipeline: RemuxPipeline | None = None
+
+class JobInfo(BaseModel):
+    channel_id: str
+    video_id: str
+    kind: str
+    path: str
+    state: str
+    attempts: int
+    output: Optional[str] = None
+    error: Optional[str] = None
+    created_at: Optional[float] = None
+    updated_at: Optional[float] = None
+
+@router.get("", response_model=List[JobInfo])
+async def list_jobs(state: Optional[str] = None, channel: Optional[str] = None, limit: int = Query(1000, ge=1, le=10000)):
+    if _pipeline is None:
+        return []
+    return [JobInfo(**j) for j in _pipeline.jobs(state, channel, limit)]
+
+@router.post("/{channel_id}/{video_id}", response_model=JobInfo)
+async def enqueue(channel_id: str, video_id: str):
+    if _pipeline is None:
+        raise HTTPException(503, "Post-processing is disabled")
+    session = _pipeline.catalog.get(channel_id, video_id)
+    if session is None:
+        raise HTTPException(404, "Unknown session")
+    if session["ended_at"] is None:
+        raise HTTPException(409, "Session is still recording")
+    _pipeline.submit(channel_id, video_id, session["path"])
+    job = next(j for j in _pipeline.jobs(channel_id=channel_id) if j["video_id"] == video_id and j["kind"] == _pipeline.fmt)
+    return JobInfo(**job)
+
+def set_pipeline(pipeline: RemuxPipeline):
+    global _pipeline
+    _pipeline = pipeline
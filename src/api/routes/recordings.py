@@ -1,15 +1,31 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+import asyncio
+import mimetypes
+import os
 import pathlib
+import re
+import zlib
 
 from src.config.settings import settings
 from src.recording.recorder import Recorder
+from src.storage.catalog import Catalog
+from src.storage.playlist import journal_records, render_playlist
+from src.storage.seek_index import plan_clip, read_clip
 from src.metrics.registry import active_recordings
 
 router = APIRouter(prefix="/recordings", tags=["recordings"])
 
+# files a session directory may serve: parts, remux output, chat logs; never hidden/state files
+MEDIA_NAME = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]*$")
+MEDIA_TYPES = {".ts": "video/mp2t", ".mp4": "video/mp4", ".mkv": "video/x-matroska", ".ndjson": "application/x-ndjson", ".gz": "application/gzip"}
+# reads run in worker threads; bigger chunks mean fewer thread hops per viewer
+MEDIA_CHUNK = 1 << 20
+
 _recorder: Recorder | None = None
+_catalog: Catalog | None = None
 
 class RecordingInfo(BaseModel):
     channel_id: str
@@ -18,31 +34,61 @@ class RecordingInfo(BaseModel):
     bytes: int
     path: str
     state: str
+    started_at: Optional[float] = None
+    ended_at: Optional[float] = None
+    bitrate_kbps: Optional[float] = None
+    speed: Optional[float] = None
+    out_time_sec: Optional[float] = None
+    output_bytes: Optional[int] = None
 
 class RestartResponse(BaseModel):
     status: str
     channel_id: str
 
 @router.get("", response_model=List[RecordingInfo])
-async def list_recordings():
-    if _recorder is None:
+async def list_recordings(
+    request: Request,
+    response: Response,
+    channel: Optional[str] = None,
+    state: Optional[str] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    offset: int = Query(0, ge=0),
+):
+    if _recorder is None or _catalog is None:
         return []
-    root = pathlib.Path(settings.recording_root)
+    states = _recorder.channel_states()
+    active_recordings.set(sum(1 for st in states.values() if st == 'recording'))
+    # live rows carry ingest progress, so it is part of the representation the ETag covers
+    progress_by_channel = {c: p for c in states if (p := _recorder.get_progress(c)) is not None}
+    snapshot = (sorted(states.items()), sorted((c, sorted(p.to_dict().items())) for c, p in progress_by_channel.items()))
+    etag = f'"{_catalog.epoch}-{_catalog.revision()}-{zlib.crc32(repr(snapshot).encode()):x}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    channels_in = channels_not_in = None
+    if state == 'idle':
+        channels_not_in = list(states)
+    elif state:
+        channels_in = [c for c, st in states.items() if st == state]
+    rows, total = _catalog.query(channel, channels_in, channels_not_in, since, until, limit, offset)
+    response.headers["ETag"] = etag
+    response.headers["X-Total-Count"] = str(total)
     out: List[RecordingInfo] = []
-    active = 0
-    for channel_dir in root.glob('*'):
-        if not channel_dir.is_dir():
-            continue
-        for video_dir in channel_dir.glob('*'):
-            if not video_dir.is_dir():
-                continue
-            segs = len(list(video_dir.glob('part_*.ts')))
-            size = sum(f.stat().st_size for f in video_dir.glob('part_*.ts'))
-            state = _recorder.get_channel_state(channel_dir.name)
-            out.append(RecordingInfo(channel_id=channel_dir.name, video_id=video_dir.name, segments=segs, bytes=size, path=str(video_dir), state=state))
-            if state == 'recording':
-                active += 1
-    active_recordings.set(active)
+    for r in rows:
+        live = r["ended_at"] is None and r["channel_id"] in states
+        progress = progress_by_channel.get(r["channel_id"]) if live else None
+        out.append(RecordingInfo(
+            channel_id=r["channel_id"],
+            video_id=r["video_id"],
+            segments=r["segments"],
+            bytes=r["bytes"],
+            path=r["path"],
+            state=states[r["channel_id"]] if live else 'idle',
+            started_at=r["started_at"],
+            ended_at=r["ended_at"],
+            **(progress.to_dict() if progress else {}),
+        ))
     return out
 
 @router.post("/restart/{channel_id}", response_model=RestartResponse)
@@ -66,6 +112,59 @@ async def start_manual(channel_id: str, video_id: str):
     await _recorder.start(channel_id, video_id)
     return RestartResponse(status="started", channel_id=channel_id)
 
+def _session_dir(channel_id: str, video_id: str) -> pathlib.Path:
+    session = _catalog.get(channel_id, video_id) if _catalog else None
+    if session is None:
+        raise HTTPException(404, "Unknown session")
+    return pathlib.Path(session["path"])
+
+def _live(channel_id: str, video_id: str) -> bool:
+    return _recorder is not None and _recorder.is_recording(channel_id, video_id)
+
+@router.get("/{channel_id}/{video_id}/playlist.m3u8")
+async def playlist(channel_id: str, video_id: str):
+    session_dir = _session_dir(channel_id, video_id)
+    records = await asyncio.to_thread(journal_records, session_dir)
+    live = _live(channel_id, video_id)
+    body = render_playlist(records, ended=not live, default_duration=settings.segment_time_sec)
+    # a live playlist grows with every closed part; players must re-fetch it
+    cache = "no-cache" if live else "public, max-age=60"
+    return Response(body, media_type="application/vnd.apple.mpegurl", headers={"Cache-Control": cache})
+
+@router.get("/{channel_id}/{video_id}/clip.ts")
+async def clip(channel_id: str, video_id: str, start: float, end: float, wall: bool = False):
+    # start/end are seconds from the session start, or unix time with wall=true
+    session_dir = _session_dir(channel_id, video_id)
+    try:
+        ranges = await asyncio.to_thread(plan_clip, session_dir, start, end, wall)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    filename = f"{video_id}_{start:g}-{end:g}.ts"
+    # a sync iterator is consumed in a worker thread, so copying never blocks the loop
+    return StreamingResponse(read_clip(ranges), media_type="video/mp2t", headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@router.get("/{channel_id}/{video_id}/{name:path}")
+async def media_file(channel_id: str, video_id: str, name: str):
+    session_dir = _session_dir(channel_id, video_id)
+    parts = name.split("/")
+    # chat/part_NNN.ndjson is the only nesting a session has
+    if len(parts) > 2 or (len(parts) == 2 and parts[0] != "chat") or not all(MEDIA_NAME.match(p) for p in parts):
+        raise HTTPException(404, "Not found")
+    path = session_dir.joinpath(*parts)
+    if not await asyncio.to_thread(path.is_file):
+        raise HTTPException(404, "Not found")
+    media_type = MEDIA_TYPES.get(path.suffix) or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    root = os.path.join(os.path.abspath(settings.recording_root), "")
+    if settings.media_accel_redirect and str(path.absolute()).startswith(root):
+        # the fronting proxy serves the file itself (sendfile, ranges); no bytes pass through Python
+        internal = settings.media_accel_redirect.rstrip("/") + "/" + str(path.absolute())[len(root):]
+        return Response(headers={"X-Accel-Redirect": internal, "Content-Type": media_type})
+    # Range/If-Range handling comes with FileResponse; reads happen off the event loop
+    response = FileResponse(path, media_type=media_type)
+    response.chunk_size = MEDIA_CHUNK
+    return response
+
 def set_recorder(recorder: Recorder):
-    global _recorder
+    global _recorder, _catalog
     _recorder = recorder
+    _catalog = recorder.catalog
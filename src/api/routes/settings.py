@@ -1,14 +1,26 @@
 from fastapi import APIRouter
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import Any, Callable, List, Optional, Dict
 from src.config.settings import settings
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
 dynamic_overrides: Dict[str, str] = {}
 
+# called with the fields a PATCH changed; with --workers N it forwards them to the workers,
+# which hold their own copy of the settings
+_on_change: Optional[Callable[[Dict[str, Any]], None]] = None
+
+def set_on_change(callback: Callable[[Dict[str, Any]], None]):
+    global _on_change
+    _on_change = callback
+
 class SettingsView(BaseModel):
     poll_interval_sec: int
+    poll_adaptive: bool
+    poll_min_interval_sec: int
+    poll_max_interval_sec: int
+    websub_poll_interval_sec: int
     channel_ids: List[str]
     video_quality: str
     segment_time_sec: int
@@ -22,6 +34,10 @@ class SettingsView(BaseModel):
 
 class SettingsPatch(BaseModel):
     poll_interval_sec: Optional[int] = Field(None, ge=5, le=3600)
+    poll_adaptive: Optional[bool] = None
+    poll_min_interval_sec: Optional[int] = Field(None, ge=1, le=3600)
+    poll_max_interval_sec: Optional[int] = Field(None, ge=5, le=86400)
+    websub_poll_interval_sec: Optional[int] = Field(None, ge=5, le=86400)
     video_quality: Optional[str]
     segment_time_sec: Optional[int] = Field(None, ge=30, le=3600)
     # Future: add channel add/remove
@@ -30,6 +46,10 @@ class SettingsPatch(BaseModel):
 async def get_settings():
     return SettingsView(
         poll_interval_sec=settings.poll_interval_sec,
+        poll_adaptive=settings.poll_adaptive,
+        poll_min_interval_sec=settings.poll_min_interval_sec,
+        poll_max_interval_sec=settings.poll_max_interval_sec,
+        websub_poll_interval_sec=settings.websub_poll_interval_sec,
         channel_ids=settings.channel_ids,
         video_quality=settings.video_quality,
         segment_time_sec=settings.segment_time_sec,
@@ -44,14 +64,27 @@ async def get_settings():
 
 @router.patch("", response_model=SettingsView)
 async def patch_settings(patch: SettingsPatch):
+    changed: Dict[str, Any] = {}
     if patch.poll_interval_sec is not None:
         settings.poll_interval_sec = patch.poll_interval_sec  # type: ignore[attr-defined]
         dynamic_overrides["poll_interval_sec"] = str(patch.poll_interval_sec)
+        changed["poll_interval_sec"] = patch.poll_interval_sec
+    # the poller reads these on every scheduling decision
+    for name in ("poll_adaptive", "poll_min_interval_sec", "poll_max_interval_sec", "websub_poll_interval_sec"):
+        value = getattr(patch, name)
+        if value is not None:
+            setattr(settings, name, value)
+            dynamic_overrides[name] = str(value)
+            changed[name] = value
     if patch.video_quality is not None:
         settings.video_quality = patch.video_quality  # type: ignore[attr-defined]
         dynamic_overrides["video_quality"] = patch.video_quality
+        changed["video_quality"] = patch.video_quality
     if patch.segment_time_sec is not None:
         settings.segment_time_sec = patch.segment_time_sec  # type: ignore[attr-defined]
         dynamic_overrides["segment_time_sec"] = str(patch.segment_time_sec)
+        changed["segment_time_sec"] = patch.segment_time_sec
+    if changed and _on_change is not None:
+        _on_change(changed)
     return await get_settings()
 
@@ -1,12 +1,22 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
+import asyncio
 import shutil
 import pathlib
 from src.config.settings import settings
+from src.metrics import sampler
+from src.metrics.loop_monitor import LoopMonitor
 from src.metrics.registry import disk_used_bytes, disk_free_bytes, channels_total
 
 router = APIRouter(prefix="/system", tags=["system"])
 
+_loop_monitor: LoopMonitor | None = None
+# Governor, or the sharded parent's view over its workers' governors
+_governor = None
+# one profile at a time; two samplers would only measure each other
+_profiling = asyncio.Lock()
+
 class DiskUsage(BaseModel):
     total: int
     used: int
@@ -35,3 +45,38 @@ async def channels():
     channels_total.set(len(settings.channel_ids))
     return {'channels': settings.channel_ids}
 
+
+@router.get('/loop')
+async def loop():
+    if _loop_monitor is None:
+        raise HTTPException(404, "Event loop monitor is disabled (LOOP_BLOCK_THRESHOLD_MS=0)")
+    return _loop_monitor.report()
+
+@router.get('/governor')
+async def governor():
+    if _governor is None:
+        raise HTTPException(404, "No resource governor in this process")
+    return _governor.report()
+
+@router.get('/profile')
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=300),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    format: str = Query("folded", pattern="^(folded|top)$"),
+    idle: bool = False,
+):
+    if _profiling.locked():
+        raise HTTPException(409, "A profile is already being captured")
+    async with _profiling:
+        result = await sampler.capture(seconds, interval_ms / 1000, idle)
+    if format == "top":
+        return sampler.top(result)
+    return PlainTextResponse(sampler.folded(result))
+
+def set_loop_monitor(monitor: LoopMonitor):
+    global _loop_monitor
+    _loop_monitor = monitor
+
+def set_governor(governor):
+    global _governor
+    _governor = governor
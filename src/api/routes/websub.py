@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse
+from src.youtube.websub import MAX_BODY, WebSubSubscriber
+
+router = APIRouter(prefix="/websub", tags=["websub"])
+
+_subscriber: WebSubSubscriber | None = None
+
+def set_subscriber(subscriber: WebSubSubscriber):
+    global _subscriber
+    _subscriber = subscriber
+
+def _get() -> WebSubSubscriber:
+    if _subscriber is None:
+        raise HTTPException(404, "WebSub is disabled (WEBSUB_CALLBACK_URL is not set)")
+    return _subscriber
+
+@router.get('')
+async def subscriptions():
+    sub = _get()
+    return {'callback_url': sub.callback_url, 'hub_url': sub.hub_url, 'subscriptions': sub.report()}
+
+# Intent verification from the hub: echo the challenge for requests we made, 404 otherwise
+@router.get('/{channel_id}')
+async def verify(
+    channel_id: str,
+    mode: str = Query(..., alias="hub.mode"),
+    topic: str = Query("", alias="hub.topic"),
+    challenge: str = Query("", alias="hub.challenge"),
+    lease_seconds: int | None = Query(None, alias="hub.lease_seconds"),
+    reason: str = Query("", alias="hub.reason"),
+):
+    sub = _get()
+    if mode == "denied":
+        sub.denied(channel_id, reason)
+        return Response(status_code=204)
+    answer = sub.verify(channel_id, mode, topic, challenge, lease_seconds) if challenge else None
+    if answer is None:
+        raise HTTPException(404, "Unknown subscription")
+    return PlainTextResponse(answer)
+
+# Content distribution: always 2xx, even for bodies that fail the signature check, as the
+# spec asks, so the hub cannot probe which signatures are accepted
+@router.post('/{channel_id}', status_code=204)
+async def notify(channel_id: str, request: Request):
+    sub = _get()
+    body = await request.body()
+    if len(body) <= MAX_BODY:
+        sub.notify(channel_id, body, request.headers.get("x-hub-signature"))
+    return Response(status_code=204)
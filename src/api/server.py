@@ -2,14 +2,33 @@ from fastapi import FastAPI
 from src.api.routes import settings as settings_routes
 from src.api.routes import recordings as recordings_routes
 from src.api.routes import system as system_routes
+from src.api.routes import jobs as jobs_routes
+from src.api.routes import websub as websub_routes
 
 app = FastAPI(title="StreamRecorder API", version="0.2.0")
 
 app.include_router(settings_routes.router)
 app.include_router(recordings_routes.router)
 app.include_router(system_routes.router)
+app.include_router(jobs_routes.router)
+app.include_router(websub_routes.router)
 
 # Recorder injection proxy
 
 def set_recorder(recorder):
     recordings_routes.set_recorder(recorder)
+
+def set_pipeline(pipeline):
+    jobs_routes.set_pipeline(pipeline)
+
+def set_loop_monitor(monitor):
+    system_routes.set_loop_monitor(monitor)
+
+def set_governor(governor):
+    system_routes.set_governor(governor)
+
+def set_subscriber(subscriber):
+    websub_routes.set_subscriber(subscriber)
+
+def set_settings_listener(callback):
+    settings_routes.set_on_change(callback)
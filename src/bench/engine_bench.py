@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+import json
+import pathlib
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from src.bench.hls_origin import stream_url
+from src.recording.ffmpeg_runner import FFmpegRunner
+from src.recording.hls_downloader import HlsDownloader
+
+# Records N synthetic live streams from a local origin (run in its own process so it is not
+# measured) with either engine, and reports CPU per stream and streams per core.
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+
+
+async def run(engine: str, streams: int, duration: float, port: int, variant: str) -> dict:
+    out_root = pathlib.Path(tempfile.mkdtemp(prefix=f"bench-{engine}-"))
+    origin = subprocess.Popen([sys.executable, "-m", "src.bench.hls_origin", "--port", str(port)], stderr=subprocess.DEVNULL)
+    try:
+        await asyncio.sleep(1.0)
+        runner = HlsDownloader() if engine == "native" else FFmpegRunner()
+        cpu0, wall0 = _cpu_seconds(), time.monotonic()
+        procs = []
+        for i in range(streams):
+            # ffmpeg does not create its output directory
+            (out_root / f"s{i}").mkdir(parents=True, exist_ok=True)
+            procs.append(await runner.record(stream_url("127.0.0.1", port, f"s{i}", variant), str(out_root / f"s{i}"), 10))
+        await asyncio.sleep(duration)
+        for p in procs:
+            p.terminate()
+        await asyncio.gather(*(p.wait() for p in procs))
+        cpu, wall = _cpu_seconds() - cpu0, time.monotonic() - wall0
+        written = sum(f.stat().st_size for f in out_root.rglob("part_*.ts"))
+        if isinstance(runner, HlsDownloader):
+            await runner.aclose()
+        cores_used = cpu / wall if wall else 0.0
+        return {
+            "engine": engine,
+            "streams": streams,
+            "duration_sec": round(wall, 2),
+            "cpu_sec": round(cpu, 2),
+            "cores_used": round(cores_used, 3),
+            "streams_per_core": round(streams / cores_used, 1) if cores_used else None,
+            "bytes_written": written,
+        }
+    finally:
+        origin.terminate()
+        origin.wait()
+        shutil.rmtree(out_root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare recording engines against a local HLS origin")
+    parser.add_argument("--engine", choices=["native", "ffmpeg"], default="native")
+    parser.add_argument("--streams", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--variant", default="720p")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.engine, args.streams, args.duration, args.port, args.variant)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import logging
+import pathlib
+import random
+import struct
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# Local stand-in for a live HLS origin: every stream name is live from server start,
+# with a sliding window of segments and optional master playlist with several variants.
+
+TS_PACKET = 188
+PAT_PID = 0x0000
+PMT_PID = 0x1000
+VIDEO_PID = 0x0100
+FPS = 25
+VARIANTS: Dict[str, Tuple[int, int]] = {"720p": (720, 2_500_000), "480p": (480, 1_200_000), "360p": (360, 700_000)}
+
+
+def _crc32_mpeg2(data: bytes) -> int:
+    crc = 0xFFFFFFFF
+    for b in data:
+        crc ^= b << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) & 0xFFFFFFFF if crc & 0x80000000 else (crc << 1) & 0xFFFFFFFF
+    return crc
+
+
+def _psi_packet(pid: int, section: bytes, cc: int) -> bytes:
+    section = section + struct.pack(">I", _crc32_mpeg2(section))
+    payload = b"\x00" + section
+    return bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10 | (cc & 0x0F)]) + payload + b"\xff" * (TS_PACKET - 4 - len(payload))
+
+
+@lru_cache(maxsize=None)
+def _pat() -> bytes:
+    body = struct.pack(">HBBB", 1, 0xC1, 0, 0) + struct.pack(">HH", 1, 0xE000 | PMT_PID)
+    return bytes([0x00]) + struct.pack(">H", 0xB000 | (len(body) + 4)) + body
+
+
+@lru_cache(maxsize=None)
+def _pmt() -> bytes:
+    body = struct.pack(">HBBB", 1, 0xC1, 0, 0) + struct.pack(">HH", 0xE000 | VIDEO_PID, 0xF000)
+    body += bytes([0x1B]) + struct.pack(">HH", 0xE000 | VIDEO_PID, 0xF000)
+    return bytes([0x02]) + struct.pack(">H", 0xB000 | (len(body) + 4)) + body
+
+
+def _pts_bytes(pts: int) -> bytes:
+    return bytes([
+        0x21 | ((pts >> 29) & 0x0E),
+        (pts >> 22) & 0xFF,
+        0x01 | ((pts >> 14) & 0xFE),
+        (pts >> 7) & 0xFF,
+        0x01 | ((pts << 1) & 0xFE),
+    ])
+
+
+def _pcr_bytes(pcr_base: int) -> bytes:
+    return struct.pack(">IH", (pcr_base >> 1) & 0xFFFFFFFF, ((pcr_base & 1) << 15) | 0x7E00)
+
+
+# MPEG-TS with PAT/PMT, one H.264-typed PID, PTS/PCR and keyframe flags; the payload is filler.
+# Continuity counters and timestamps carry on across sequence numbers like a real live stream.
+def synth_segment(seq: int, duration: float, bitrate: int) -> bytes:
+    out = bytearray()
+    out += _psi_packet(PAT_PID, _pat(), seq)
+    out += _psi_packet(PMT_PID, _pmt(), seq)
+    frames = max(1, int(duration * FPS))
+    frame_bytes = max(TS_PACKET, int(bitrate * duration / 8 / frames))
+    packets_per_frame = 1 + -(-max(0, frame_bytes - 176) // 184)
+    cc = (seq * frames * packets_per_frame) & 0x0F
+    rng = random.Random(seq)
+    for i in range(frames):
+        pts = int((seq * duration + i / FPS) * 90000) & ((1 << 33) - 1)
+        pes = b"\x00\x00\x01\xe0\x00\x00\x80\x80\x05" + _pts_bytes(pts) + b"\x00\x00\x00\x01\x09\xf0"
+        pes += rng.randbytes(frame_bytes - len(pes))
+        first = True
+        pos = 0
+        while pos < len(pes):
+            if first:
+                # adaptation field with PCR (and random access on the segment's first frame)
+                flags = 0x10 | (0x40 if i == 0 else 0)
+                af = bytes([flags]) + _pcr_bytes(pts)
+                room = TS_PACKET - 4 - 1 - len(af)
+                chunk = pes[pos:pos + room]
+                stuffing = room - len(chunk)
+                af_field = bytes([len(af) + stuffing]) + af + b"\xff" * stuffing
+                header = bytes([0x47, 0x40 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0x30 | cc])
+                first = False
+            else:
+                room = TS_PACKET - 4
+                chunk = pes[pos:pos + room]
+                if len(chunk) < room:
+                    stuffing = room - len(chunk) - 1
+                    af_field = bytes([stuffing]) + (bytes([0x00]) + b"\xff" * (stuffing - 1) if stuffing else b"")
+                    header = bytes([0x47, VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0x30 | cc])
+                else:
+                    af_field = b""
+                    header = bytes([0x47, VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0x10 | cc])
+            out += header + af_field + chunk
+            pos += len(chunk)
+            cc = (cc + 1) & 0x0F
+    return bytes(out)
+
+
+class Origin:
+    def __init__(self, segment_duration: float = 2.0, window: int = 6, source_dir: Optional[str] = None, error_rate: float = 0.0):
+        self.segment_duration = segment_duration
+        self.window = window
+        self.error_rate = error_rate
+        self.started = time.time()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._source: List[bytes] = []
+        if source_dir:
+            # loop real .ts files (e.g. made with ffmpeg -f lavfi testsrc) so ffmpeg can probe them
+            self._source = [p.read_bytes() for p in sorted(pathlib.Path(source_dir).glob("*.ts"))]
+        self._cache: Dict[Tuple[str, int], bytes] = {}
+
+    def live_sequence(self) -> int:
+        return int((time.time() - self.started) / self.segment_duration)
+
+    def master(self, stream: str) -> str:
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+        for name, (height, bw) in VARIANTS.items():
+            lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bw},RESOLUTION={height * 16 // 9}x{height}")
+            lines.append(f"{name}/index.m3u8")
+        return "\n".join(lines) + "\n"
+
+    def media(self, stream: str, variant: str) -> str:
+        last = self.live_sequence()
+        first = max(0, last - self.window + 1)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{int(self.segment_duration + 0.999)}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first}",
+        ]
+        for seq in range(first, last + 1):
+            lines.append(f"#EXTINF:{self.segment_duration:.3f},")
+            lines.append(f"{seq}.ts")
+        return "\n".join(lines) + "\n"
+
+    def segment(self, variant: str, seq: int) -> Optional[bytes]:
+        if seq > self.live_sequence():
+            return None
+        if self._source:
+            return self._source[seq % len(self._source)]
+        # every stream serves the same content, so one small cache covers all of them
+        key = (variant, seq)
+        data = self._cache.get(key)
+        if data is None:
+            bitrate = VARIANTS.get(variant, VARIANTS["720p"])[1]
+            data = self._cache[key] = synth_segment(seq, self.segment_duration, bitrate)
+            while len(self._cache) > len(VARIANTS) * (self.window + 2):
+                self._cache.pop(next(iter(self._cache)))
+        return data
+
+    def route(self, path: str) -> Tuple[int, str, bytes]:
+        parts = [p for p in path.split("?", 1)[0].split("/") if p]
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, "text/plain", b"injected failure"
+        # /live/<stream>/master.m3u8, /live/<stream>/<variant>/index.m3u8, /live/<stream>/<variant>/<seq>.ts
+        if len(parts) == 3 and parts[0] == "live" and parts[2] == "master.m3u8":
+            return 200, "application/vnd.apple.mpegurl", self.master(parts[1]).encode()
+        if len(parts) == 4 and parts[0] == "live" and parts[3] == "index.m3u8":
+            return 200, "application/vnd.apple.mpegurl", self.media(parts[1], parts[2]).encode()
+        if len(parts) == 4 and parts[0] == "live" and parts[3].endswith(".ts"):
+            data = self.segment(parts[2], int(parts[3][:-3]))
+            if data is not None:
+                return 200, "video/mp2t", data
+        return 404, "text/plain", b"not found"
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await reader.readuntil(b"\r\n\r\n")
+                line = request.split(b"\r\n", 1)[0].decode()
+                method, path, _ = line.split(" ", 2)
+                status, ctype, body = self.route(path)
+                self.requests += 1
+                self.bytes_sent += len(body)
+                head = f"HTTP/1.1 {status} X\r\nContent-Type: {ctype}\r\nContent-Length: {len(body)}\r\nCache-Control: no-cache\r\n\r\n"
+                writer.write(head.encode())
+                if method != "HEAD":
+                    writer.write(body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str, port: int, origin: Origin) -> asyncio.AbstractServer:
+    server = await asyncio.start_server(origin.handle, host, port)
+    log.info("HLS origin on http://%s:%d/live/<stream>/master.m3u8", host, port)
+    return server
+
+
+def stream_url(host: str, port: int, stream: str, variant: Optional[str] = None) -> str:
+    if variant:
+        return f"http://{host}:{port}/live/{stream}/{variant}/index.m3u8"
+    return f"http://{host}:{port}/live/{stream}/master.m3u8"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local live HLS origin for tests and benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--segment-duration", type=float, default=2.0)
+    parser.add_argument("--window", type=int, default=6)
+    parser.add_argument("--source-dir", help="directory of real .ts files to loop instead of synthetic segments")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    async def _run():
+        origin = Origin(args.segment_duration, args.window, args.source_dir, args.error_rate)
+        server = await serve(args.host, args.port, origin)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
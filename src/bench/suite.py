@@ -0,0 +1,522 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import inspect
+import json
+import logging
+import os
+import pathlib
+import platform
+import random
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.bench.hls_origin import stream_url
+from src.config.settings import settings
+
+# End-to-end scenarios against the real Poller, Recorder and API app. yt-dlp is replaced by
+# FakeYouTube (live checks answer from a table, manifests resolve to the local origin), so
+# nothing leaves the machine. Every run writes a JSON report; --baseline prints the change
+# against an earlier report.
+
+ORIGIN_READY_SEC = 10.0
+REPORT_VERSION = 1
+
+
+def _cpu_seconds() -> float:
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + kids.ru_utime + kids.ru_stime
+
+
+def percentiles(values: List[float], scale: float = 1.0, digits: int = 3) -> Dict[str, Any]:
+    if not values:
+        return {"count": 0}
+    s = sorted(values)
+
+    def at(q: float) -> float:
+        return round(s[min(len(s) - 1, int(q * len(s)))] * scale, digits)
+
+    return {"count": len(s), "mean": round(sum(s) / len(s) * scale, digits), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99), "max": round(s[-1] * scale, digits)}
+
+
+class LoopLag:
+    # how late a periodic wakeup fires; a busy or blocked event loop shows up here first
+    def __init__(self, period: float = 0.05):
+        self.period = period
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t = loop.time()
+            await asyncio.sleep(self.period)
+            self.samples.append(max(0.0, loop.time() - t - self.period))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, Any]:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return percentiles(self.samples, scale=1000)
+
+
+@contextlib.contextmanager
+def _patched(obj: Any, **values: Any) -> Iterator[None]:
+    saved = {k: getattr(obj, k) for k in values}
+    for k, v in values.items():
+        setattr(obj, k, v)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            setattr(obj, k, v)
+
+
+class FakeYouTube:
+    # Stands in for the extractor pool: `live` maps channel -> video id, answers come after
+    # a yt-dlp-like delay, and every video resolves to a stream on the local origin.
+    def __init__(self, live: Dict[str, str], port: int, latency: Tuple[float, float] = (0.2, 1.5), variant: str = "720p"):
+        self.live = live
+        self.port = port
+        self.latency = latency
+        self.variant = variant
+        self.checks: Dict[str, List[float]] = {}
+        self.resolves = 0
+
+    async def extract_live_video_id(self, url: str) -> Optional[str]:
+        # https://www.youtube.com/<channel>/live
+        cid = url.rstrip("/").rsplit("/", 2)[-2]
+        self.checks.setdefault(cid, []).append(asyncio.get_running_loop().time())
+        await asyncio.sleep(random.uniform(*self.latency))
+        return self.live.get(cid)
+
+    async def extract_hls_url(self, url: str, height: Optional[int] = None, headers: Optional[Dict[str, str]] = None) -> Optional[str]:
+        self.resolves += 1
+        await asyncio.sleep(random.uniform(*self.latency))
+        return stream_url("127.0.0.1", self.port, url.rsplit("v=", 1)[-1], self.variant)
+
+    @contextlib.contextmanager
+    def installed(self) -> Iterator[None]:
+        from src.recording import recorder
+        from src.youtube import extractor_pool
+        # the recorder only checks that yt-dlp imported before resolving
+        with _patched(extractor_pool, extract_live_video_id=self.extract_live_video_id, extract_hls_url=self.extract_hls_url), _patched(recorder, yt_dlp=object()):
+            yield
+
+
+@contextlib.contextmanager
+def origin_process(port: int, segment_duration: float) -> Iterator[None]:
+    # a separate process so serving the streams is not measured as recorder CPU
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "src.bench.hls_origin", "--port", str(port), "--segment-duration", str(segment_duration)],
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + ORIGIN_READY_SEC
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or proc.poll() is not None:
+                    raise RuntimeError(f"HLS origin did not come up on port {port}")
+                time.sleep(0.1)
+        yield
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _channels(n: int) -> List[str]:
+    return [f"@bench{i:05d}" for i in range(n)]
+
+
+class Fleet:
+    # a Recorder and Poller over a temporary recording root, as the service wires them
+    def __init__(self, channels: List[str], youtube: FakeYouTube):
+        from src.recording.recorder import Recorder
+        from src.orchestration.service import build_governor, build_runner
+        from src.storage.catalog import Catalog
+        from src.youtube.live_detector import LiveDetector
+        from src.youtube.poller import Poller
+
+        self.root = pathlib.Path(settings.recording_root)
+        self.channels = channels
+        self.youtube = youtube
+        self.catalog = Catalog(str(self.root / ".state" / "catalog.sqlite3"), str(self.root))
+        self.recorder = Recorder(build_runner(), str(self.root), catalog=self.catalog, governor=build_governor())
+        self.poller = Poller(None, self.recorder, LiveDetector(), channels=lambda: self.channels)
+        self._poll_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._poll_task = asyncio.create_task(self.poller.run())
+
+    async def wait_recording(self, channels: List[str], timeout: float) -> Dict[str, float]:
+        # channel -> seconds until its ingest first wrote media
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first: Dict[str, float] = {}
+        while len(first) < len(channels) and loop.time() - start < timeout:
+            for cid in channels:
+                p = self.recorder.get_progress(cid)
+                if cid not in first and p is not None and (p.output_bytes > 0 or p.out_time_sec > 0):
+                    first[cid] = loop.time() - start
+            await asyncio.sleep(0.05)
+        return first
+
+    async def close(self) -> float:
+        # returns how long stopping every open session took
+        if self._poll_task:
+            self._poll_task.cancel()
+            await asyncio.gather(self._poll_task, return_exceptions=True)
+        t = time.monotonic()
+        await asyncio.gather(*(self.recorder.stop(c) for c in list(self.recorder.processes)), return_exceptions=True)
+        elapsed = time.monotonic() - t
+        aclose = getattr(self.recorder.ffmpeg, "aclose", None)
+        if aclose:
+            await aclose()
+        return elapsed
+
+    def recorded(self) -> Dict[str, int]:
+        parts = list(self.root.glob("*/*/part_*.ts"))
+        return {"segments": len(parts), "bytes": sum(p.stat().st_size for p in parts)}
+
+
+@contextlib.contextmanager
+def bench_settings(root: pathlib.Path, **values: Any) -> Iterator[None]:
+    base = dict(recording_root=str(root), catalog_path=None, chat_enabled=False, detach_ingests=False, postprocess_format="off")
+    base.update(values)
+    with _patched(settings, **base):
+        yield
+
+
+# ---- scenarios ----
+
+async def scenario_poll(channels: int = 1000, live: int = 0, interval: int = 30, concurrency: int = 64, duration: float = 120.0, port: int = 8091) -> Dict[str, Any]:
+    # live detection only (live=0): checks/s, how evenly each channel is revisited and how
+    # long the first full cycle takes
+    ids = _channels(channels)
+    youtube = FakeYouTube({cid: f"v{cid[1:]}" for cid in ids[:live]}, port)
+    root = pathlib.Path(tempfile.mkdtemp(prefix="bench-poll-"))
+    try:
+        with bench_settings(root, poll_interval_sec=interval, poll_concurrency=concurrency, recording_engine="native"), youtube.installed():
+            fleet = Fleet(ids, youtube)
+            lag = LoopLag()
+            lag.start()
+            cpu0, t0 = _cpu_seconds(), time.monotonic()
+            loop_t0 = asyncio.get_running_loop().time()
+            fleet.start()
+            await asyncio.sleep(duration)
+            wall, cpu = time.monotonic() - t0, _cpu_seconds() - cpu0
+            await fleet.close()
+            loop_lag = await lag.stop()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    gaps = [b - a for times in youtube.checks.values() for a, b in zip(times, times[1:])]
+    firsts = [times[0] - loop_t0 for times in youtube.checks.values()]
+    checks = sum(len(t) for t in youtube.checks.values())
+    return {
+        "checks": checks,
+        "checks_per_sec": round(checks / wall, 2),
+        "channels_checked": len(youtube.checks),
+        "first_cycle_sec": round(max(firsts), 3) if len(firsts) == channels else None,
+        "revisit_sec": percentiles(gaps),
+        "cpu_sec": round(cpu, 2),
+        "loop_lag_ms": loop_lag,
+    }
+
+
+def _recording_fleet(streams: int, youtube: FakeYouTube) -> Tuple[Fleet, List[str]]:
+    ids = _channels(streams)
+    youtube.live.update({cid: f"v{cid[1:]}" for cid in ids})
+    fleet = Fleet(ids, youtube)
+    fleet.start()
+    return fleet, ids
+
+
+async def scenario_record(streams: int = 200, engine: str = "native", duration: float = 60.0, segment_time: int = 10, port: int = 8091) -> Dict[str, Any]:
+    # streams found live by the poller and recorded side by side: startup latency, what
+    # reached disk, CPU per stream and how long a full stop takes
+    root = pathlib.Path(tempfile.mkdtemp(prefix="bench-record-"))
+    youtube = FakeYouTube({}, port)
+    try:
+        with origin_process(port, 2.0), bench_settings(root, recording_engine=engine, segment_time_sec=segment_time, poll_interval_sec=30, poll_concurrency=64), youtube.installed():
+            lag = LoopLag()
+            lag.start()
+            cpu0, t0 = _cpu_seconds(), time.monotonic()
+            fleet, ids = _recording_fleet(streams, youtube)
+            first = await fleet.wait_recording(ids, timeout=duration)
+            await asyncio.sleep(max(0.0, duration - (time.monotonic() - t0)))
+            wall, cpu = time.monotonic() - t0, _cpu_seconds() - cpu0
+            stop_sec = await fleet.close()
+            loop_lag = await lag.stop()
+            recorded = fleet.recorded()
+            journaled = sum(s["segments"] for s in fleet.catalog.sessions_oldest_first())
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    cores = cpu / wall if wall else 0.0
+    return {
+        "streams_recording": len(first),
+        "time_to_first_media_sec": percentiles(list(first.values())),
+        "segments_written": recorded["segments"],
+        "segments_journaled": journaled,
+        "bytes_written": recorded["bytes"],
+        "hls_resolves": youtube.resolves,
+        "cpu_sec": round(cpu, 2),
+        "cores_used": round(cores, 3),
+        "streams_per_core": round(len(first) / cores, 1) if cores else None,
+        "stop_all_sec": round(stop_sec, 3),
+        "loop_lag_ms": loop_lag,
+    }
+
+
+async def scenario_restart_storm(streams: int = 200, engine: str = "native", warmup: float = 15.0, timeout: float = 60.0, port: int = 8091) -> Dict[str, Any]:
+    # every ingest dies at once; measures how fast each channel is writing media again
+    # (restart backoff, cached manifest URLs, the origin taking all reconnects together)
+    root = pathlib.Path(tempfile.mkdtemp(prefix="bench-storm-"))
+    youtube = FakeYouTube({}, port)
+    try:
+        with origin_process(port, 2.0), bench_settings(root, recording_engine=engine, segment_time_sec=10, poll_interval_sec=30, poll_concurrency=64), youtube.installed():
+            fleet, ids = _recording_fleet(streams, youtube)
+            await fleet.wait_recording(ids, timeout=warmup)
+            await asyncio.sleep(max(0.0, warmup - 2.0))
+            resolves_before = youtube.resolves
+            killed = {cid: fleet.recorder.processes.get(cid) for cid in ids}
+            killed = {cid: p for cid, p in killed.items() if p is not None}
+            lag = LoopLag()
+            lag.start()
+            loop = asyncio.get_running_loop()
+            t0 = loop.time()
+            for proc in killed.values():
+                proc.kill()
+            recovered: Dict[str, float] = {}
+            while len(recovered) < len(killed) and loop.time() - t0 < timeout:
+                for cid, old in killed.items():
+                    proc, p = fleet.recorder.processes.get(cid), fleet.recorder.get_progress(cid)
+                    if cid not in recovered and proc is not None and proc is not old and p is not None and (p.output_bytes > 0 or p.out_time_sec > 0):
+                        recovered[cid] = loop.time() - t0
+                await asyncio.sleep(0.05)
+            loop_lag = await lag.stop()
+            resolves = youtube.resolves - resolves_before
+            await fleet.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        "killed": len(killed),
+        "recovered": len(recovered),
+        "recovery_sec": percentiles(list(recovered.values())),
+        "hls_resolves_during_storm": resolves,
+        "restart_backoff_initial_sec": settings.restart_backoff_initial_sec,
+        "loop_lag_ms": loop_lag,
+    }
+
+
+def build_archive(root: pathlib.Path, sessions: int, segments: int, channels: int = 100, segment_sec: float = 10.0) -> float:
+    # closed sessions as the recorder leaves them: manifest, journal and (empty) parts
+    from src.storage.journal import JOURNAL_NAME, SegmentRecord
+    from src.storage.manifest import SessionManifest
+
+    t0 = time.monotonic()
+    now = time.time()
+    for s in range(sessions):
+        cid, vid = f"@bench{s % channels:05d}", f"v{s:07d}"
+        d = root / cid / vid
+        d.mkdir(parents=True)
+        started = now - (sessions - s) * segments * segment_sec
+        lines = []
+        for i in range(segments):
+            name = f"part_{i:03d}.ts"
+            (d / name).touch()
+            pts = int(i * segment_sec * 90000)
+            lines.append(json.dumps(SegmentRecord(i, name, started + i * segment_sec, segment_sec, 0, pts, pts + int(segment_sec * 90000) - 3600, 0).to_dict(), separators=(",", ":")))
+        (d / JOURNAL_NAME).write_text("\n".join(lines) + "\n", encoding="utf-8")
+        manifest = SessionManifest(cid, vid, "best", started, started + segments * segment_sec, segments, 0, segments * segment_sec)
+        (d / "manifest.json").write_text(json.dumps(manifest.to_dict()), encoding="utf-8")
+    return time.monotonic() - t0
+
+
+async def scenario_api(sessions: int = 1000, segments: int = 100, requests: int = 2000, concurrency: int = 32, live: int = 0, port: int = 8091) -> Dict[str, Any]:
+    # /recordings and playlists over an archive of sessions*segments parts, through the ASGI
+    # app in-process (no socket), with a catalog rebuilt from disk like at startup
+    import httpx
+    from src.api.server import app, set_recorder
+    from src.api.routes import recordings
+    from src.recording.recorder import Recorder
+    from src.recording.hls_downloader import HlsDownloader
+    from src.storage.catalog import Catalog
+
+    root = pathlib.Path(tempfile.mkdtemp(prefix="bench-api-"))
+    try:
+        with bench_settings(root):
+            build_sec = build_archive(root, sessions, segments)
+            catalog = Catalog(str(root / ".state" / "catalog.sqlite3"), str(root))
+            t = time.monotonic()
+            catalog.rebuild()
+            rebuild_cold = time.monotonic() - t
+            t = time.monotonic()
+            catalog.rebuild()
+            rebuild_warm = time.monotonic() - t
+            recorder = Recorder(HlsDownloader(), str(root), catalog=catalog)
+            set_recorder(recorder)
+            rows, _ = catalog.query(limit=sessions)
+            for r in rows[:live]:
+                # open sessions the list has to merge live state into
+                recorder._channel_states[r["channel_id"]] = "recording"
+            targets = {
+                "list": lambda i: "/recordings",
+                "list_channel": lambda i: f"/recordings?channel=@bench{i % 100:05d}",
+                "list_page": lambda i: f"/recordings?limit=50&offset={(i * 50) % max(1, sessions)}",
+                "playlist": lambda i: f"/recordings/{rows[i % len(rows)]['channel_id']}/{rows[i % len(rows)]['video_id']}/playlist.m3u8",
+            }
+            lag = LoopLag()
+            lag.start()
+            results: Dict[str, Any] = {}
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                etag = (await client.get("/recordings")).headers.get("etag")
+                targets["list_revalidate"] = lambda i: "/recordings"
+                for name, path_for in targets.items():
+                    headers = {"If-None-Match": etag} if name == "list_revalidate" else {}
+                    results[name] = await _load(client, path_for, headers, requests, concurrency)
+            loop_lag = await lag.stop()
+            recordings._recorder = recordings._catalog = None
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return {
+        "archive_segments": sessions * segments,
+        "archive_build_sec": round(build_sec, 2),
+        "catalog_rebuild_cold_sec": round(rebuild_cold, 3),
+        "catalog_rebuild_warm_sec": round(rebuild_warm, 3),
+        "endpoints": results,
+        "loop_lag_ms": loop_lag,
+    }
+
+
+async def _load(client, path_for: Callable[[int], str], headers: Dict[str, str], requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker():
+        for i in counter:
+            t = time.perf_counter()
+            r = await client.get(path_for(i), headers=headers)
+            latencies.append(time.perf_counter() - t)
+            statuses[str(r.status_code)] = statuses.get(str(r.status_code), 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    return {"requests_per_sec": round(requests / wall, 1), "latency_ms": percentiles(latencies, scale=1000), "status": statuses}
+
+
+SCENARIOS: Dict[str, Callable[..., Any]] = {
+    "poll": scenario_poll,
+    "record": scenario_record,
+    "restart_storm": scenario_restart_storm,
+    "api": scenario_api,
+}
+
+
+# ---- reports ----
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def _flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    if isinstance(data, dict):
+        for k, v in data.items():
+            out.update(_flatten(v, f"{prefix}{k}."))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        out[prefix[:-1]] = data
+    return out
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    # numeric results present in both, as "scenario.metric old -> new (+x%)"
+    lines = []
+    for name, run in report["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        before, after = _flatten(old["results"]), _flatten(run["results"])
+        for key in sorted(before.keys() & after.keys()):
+            a, b = before[key], after[key]
+            change = f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+            lines.append(f"{name}.{key}: {a} -> {b} ({change})")
+    return lines
+
+
+def _parse_params(items: List[str]) -> Dict[str, Any]:
+    params: Dict[str, Any] = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        try:
+            params[key.replace("-", "_")] = json.loads(value)
+        except ValueError:
+            params[key.replace("-", "_")] = value
+    return params
+
+
+async def run(names: List[str], params: Dict[str, Any]) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"version": REPORT_VERSION, "environment": environment(), "scenarios": {}}
+    for name in names:
+        fn = SCENARIOS[name]
+        accepted = inspect.signature(fn).parameters
+        kwargs = {k: v for k, v in params.items() if k in accepted}
+        t = time.monotonic()
+        results = await fn(**kwargs)
+        defaults = {k: p.default for k, p in accepted.items()}
+        report["scenarios"][name] = {"params": {**defaults, **kwargs}, "wall_sec": round(time.monotonic() - t, 2), "results": results}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmarks with stubbed YouTube resolution and a local HLS origin")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--set", dest="params", action="append", default=[], metavar="KEY=VALUE", help="scenario parameter, e.g. channels=1000 (repeatable)")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="an earlier report to compare against")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+    logging.basicConfig(level=logging.WARNING)
+    report = asyncio.run(run(args.scenarios or list(SCENARIOS), _parse_params(args.params)))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        pathlib.Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.baseline:
+        for line in compare(report, json.loads(pathlib.Path(args.baseline).read_text(encoding="utf-8"))):
+            print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+
+from src.youtube.websub import channel_of
+
+log = logging.getLogger(__name__)
+
+# Local stand-in for the YouTube WebSub hub: accepts (un)subscriptions, verifies them
+# against the subscriber's callback like the real hub does, and publishes signed Atom
+# entries when /publish is called.
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">
+  <link rel="hub" href="https://pubsubhubbub.appspot.com"/>
+  <link rel="self" href="{topic}"/>
+  <title>YouTube video feed</title>
+  <updated>{now}</updated>
+  <entry>
+    <id>yt:video:{video_id}</id>
+    <yt:videoId>{video_id}</yt:videoId>
+    <yt:channelId>{channel_id}</yt:channelId>
+    <title>Live</title>
+    <link rel="alternate" href="https://www.youtube.com/watch?v={video_id}"/>
+    <published>{now}</published>
+    <updated>{now}</updated>
+  </entry>
+</feed>
+"""
+
+
+@dataclass
+class HubSubscription:
+    callback: str
+    secret: Optional[str]
+    expires_at: float
+
+
+class Hub:
+    def __init__(self):
+        # (topic, callback) -> subscription
+        self.subscriptions: Dict[Tuple[str, str], HubSubscription] = {}
+        self.delivered = 0
+        self.http = httpx.AsyncClient(timeout=10)
+
+    async def verify(self, mode: str, topic: str, callback: str, lease: int, secret: Optional[str]):
+        challenge = secrets.token_urlsafe(16)
+        params = {"hub.mode": mode, "hub.topic": topic, "hub.challenge": challenge, "hub.lease_seconds": str(lease)}
+        try:
+            r = await self.http.get(callback, params=params)
+        except httpx.HTTPError as e:
+            log.warning("Verification of %s failed: %s", callback, e)
+            return
+        if r.status_code // 100 != 2 or r.text != challenge:
+            log.warning("Callback %s did not confirm %s of %s", callback, mode, topic)
+            return
+        if mode == "subscribe":
+            self.subscriptions[(topic, callback)] = HubSubscription(callback, secret, time.time() + lease)
+        else:
+            self.subscriptions.pop((topic, callback), None)
+        log.info("%s verified for %s", mode, topic)
+
+    async def publish(self, channel_id: str, video_id: str) -> int:
+        now = time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+        sent = 0
+        for (topic, _), sub in list(self.subscriptions.items()):
+            if channel_of(topic) != channel_id or sub.expires_at < time.time():
+                continue
+            body = FEED.format(topic=topic, now=now, video_id=video_id, channel_id=channel_id).encode()
+            headers = {"Content-Type": "application/atom+xml"}
+            if sub.secret:
+                headers["X-Hub-Signature"] = "sha1=" + hmac.new(sub.secret.encode(), body, hashlib.sha1).hexdigest()
+            try:
+                await self.http.post(sub.callback, content=body, headers=headers)
+                sent += 1
+            except httpx.HTTPError as e:
+                log.warning("Delivery to %s failed: %s", sub.callback, e)
+        self.delivered += sent
+        return sent
+
+
+def build_app(hub: Hub) -> FastAPI:
+    app = FastAPI(title="Fake WebSub hub")
+    tasks = set()
+
+    @app.post("/subscribe", status_code=202)
+    async def subscribe(request: Request):
+        # urlencoded form, parsed here so the hub needs nothing beyond FastAPI
+        form = {k: v[0] for k, v in parse_qs((await request.body()).decode()).items()}
+        mode, topic, callback = form.get("hub.mode"), form.get("hub.topic", ""), form.get("hub.callback")
+        lease = int(form.get("hub.lease_seconds") or 432000)
+        secret = form.get("hub.secret")
+        if mode not in ("subscribe", "unsubscribe") or not callback or channel_of(topic) is None:
+            raise HTTPException(400, "bad request")
+        # verification happens after the 202, as with the real hub
+        task = asyncio.create_task(hub.verify(mode, topic, callback, lease, secret))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        return Response(status_code=202)
+
+    @app.post("/publish")
+    async def publish(channel_id: str, video_id: str):
+        return {"delivered": await hub.publish(channel_id, video_id)}
+
+    @app.get("/subscriptions")
+    async def subscriptions():
+        return [{"topic": t, "callback": c, "expires_at": s.expires_at} for (t, c), s in hub.subscriptions.items()]
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local WebSub hub for tests and benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8092)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    uvicorn.run(build_app(Hub()), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
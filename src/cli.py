@@ -1,7 +1,9 @@
 import asyncio
 import argparse
+import importlib.util
 import logging
-from src.orchestration.service import main as service_main
+import os
+import shutil
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
@@ -19,10 +21,9 @@ async def _oneshot():
 
 async def _formats():
     from src.youtube.poller import resolve_live_video_id_from_handle
+    from src.youtube.extractor_pool import extract_hls_heights
     from src.config.settings import settings
-    try:
-        import yt_dlp
-    except Exception:
+    if importlib.util.find_spec("yt_dlp") is None:
         print("yt-dlp not installed")
         return
     if not settings.channel_ids:
@@ -34,14 +35,7 @@ async def _formats():
         print(f"No live detected for {cid}")
         return
     url = f"https://www.youtube.com/watch?v={vid}"
-    def _extract():
-        ydl_opts = {"quiet": True, "no_warnings": True, "skip_download": True}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            formats = [f for f in (info.get("formats") or []) if f.get("protocol") in ("m3u8", "m3u8_native")]
-            heights = sorted(set(f.get("height") for f in formats if f.get("height")), reverse=True)
-            return heights
-    heights = await asyncio.to_thread(_extract)
+    heights = await extract_hls_heights(url)
     print(f"Live {vid} HLS heights: {heights}")
 
 
@@ -68,10 +62,60 @@ async def _stop_channel(channel_id: str):
         print(resp.json())
 
 
+def _session_dir(channel_id: str, video_id: str):
+    import pathlib
+    from src.config.settings import settings
+    from src.storage.catalog import Catalog
+    # the catalog knows sessions retention moved to the cold tier
+    catalog = Catalog(settings.catalog_path or f"{settings.recording_root}/.state/catalog.sqlite3", settings.recording_root)
+    session = catalog.get(channel_id, video_id)
+    catalog.close()
+    return pathlib.Path(session["path"] if session else os.path.join(settings.recording_root, channel_id, video_id))
+
+
+def _clip(channel_id: str, video_id: str, start: float, end: float, out, wall: bool):
+    from src.storage.seek_index import plan_clip, read_clip
+    ranges = plan_clip(_session_dir(channel_id, video_id), start, end, wall)
+    out = out or f"{video_id}_{start:g}-{end:g}.ts"
+    size = 0
+    with open(out, "wb") as f:
+        for chunk in read_clip(ranges):
+            f.write(chunk)
+            size += len(chunk)
+    print(f"Wrote {out} ({size} bytes from {len(ranges)} part(s))")
+
+
+def _verify(session, recheck: bool, loop: int):
+    from src.storage.ts_verify import verify_session, integrity_summary, read_checks, ArchiveVerifier
+    if session:
+        session_dir = _session_dir(*session)
+        for check in verify_session(session_dir, recheck):
+            print(f"{check.name}: {'ok' if check.ok else 'CORRUPT'} packets={check.packets} sync={check.sync_errors} cc={check.cc_errors} pcr_gaps={check.pcr_gaps} truncated={check.truncated_bytes} duration={check.duration} kbps={check.bitrate_kbps}")
+        print(integrity_summary(read_checks(session_dir).values()))
+        return
+    from src.orchestration.service import open_catalog
+    verifier = ArchiveVerifier(open_catalog(), interval=loop)
+    if loop:
+        asyncio.run(verifier.run())
+    else:
+        print(f"Checked {verifier.run_once()} segment(s)")
+
+
+def _index(channel_id: str, video_id: str):
+    from src.storage.seek_index import build_index
+    added = build_index(_session_dir(channel_id, video_id))
+    print(f"Indexed {added} part(s)")
+
+
 def main():
     parser = argparse.ArgumentParser(description="YouTube live recorder POC")
-    parser.add_argument("command", nargs="?", default="run", choices=["run", "check", "formats", "ps", "stop"], help="run service or run a single live check")
-    parser.add_argument("arg", nargs="?", help="channel id for stop command")
+    parser.add_argument("command", nargs="?", default="run", choices=["run", "check", "formats", "ps", "stop", "clip", "index", "verify"], help="run service or run a single live check")
+    parser.add_argument("arg", nargs="*", help="stop: channel id; clip: channel video start end; index/verify: channel video")
+    parser.add_argument("-o", "--out", help="clip: output file (default: <video>_<start>-<end>.ts)")
+    parser.add_argument("--wall", action="store_true", help="clip: start/end are unix times instead of seconds into the session")
+    parser.add_argument("--recheck", action="store_true", help="verify: check parts that were already verified again")
+    parser.add_argument("--loop", type=int, default=0, metavar="SEC", help="verify: keep sweeping the archive every SEC seconds")
+    parser.add_argument("--workers", type=int, default=1, help="run: number of recorder worker processes")
     args = parser.parse_args()
 
     if args.command == "check":
@@ -84,9 +128,34 @@ def main():
         if not args.arg:
             print("Missing channel id")
         else:
-            asyncio.run(_stop_channel(args.arg))
+            asyncio.run(_stop_channel(args.arg[0]))
+    elif args.command == "clip":
+        if len(args.arg) != 4:
+            print("Usage: clip <channel> <video> <start> <end>")
+        else:
+            _clip(*args.arg[:2], float(args.arg[2]), float(args.arg[3]), args.out, args.wall)
+    elif args.command == "verify":
+        if args.arg and len(args.arg) != 2:
+            print("Usage: verify [<channel> <video>]")
+        else:
+            _verify(args.arg, args.recheck, args.loop)
+    elif args.command == "index":
+        if len(args.arg) != 2:
+            print("Usage: index <channel> <video>")
+        else:
+            _index(*args.arg)
+    elif args.workers > 1:
+        from src.config.settings import settings
+        # must be set before prometheus_client is imported here or in any worker
+        prom_dir = os.path.join(settings.recording_root, ".state", "prometheus")
+        shutil.rmtree(prom_dir, ignore_errors=True)
+        os.makedirs(prom_dir, exist_ok=True)
+        os.environ["PROMETHEUS_MULTIPROC_DIR"] = prom_dir
+        from src.orchestration.sharding import run_sharded
+        asyncio.run(run_sharded(args.workers))
     else:
         # Start the long-running service (poller + API server)
+        from src.orchestration.service import main as service_main
         asyncio.run(service_main())
 if __name__ == "__main__":
     main()
@@ -5,14 +5,72 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     youtube_api_key: Optional[str] = Field(default=None, alias="API_KEY")
+    youtube_quota_daily: int = Field(default=10000, alias="YOUTUBE_QUOTA_DAILY")
+    youtube_quota_reserve: int = Field(default=500, alias="YOUTUBE_QUOTA_RESERVE")
+    youtube_recent_uploads: int = Field(default=5, alias="YOUTUBE_RECENT_UPLOADS")
     poll_interval_sec: int = Field(default=30, alias="POLL_INTERVAL_SEC")
+    poll_concurrency: int = Field(default=16, alias="POLL_CONCURRENCY")
+    poll_check_timeout_sec: int = Field(default=45, alias="POLL_CHECK_TIMEOUT_SEC")
+    poll_jitter_ratio: float = Field(default=0.1, alias="POLL_JITTER_RATIO")
+    poll_adaptive: bool = Field(default=True, alias="POLL_ADAPTIVE")
+    poll_min_interval_sec: int = Field(default=10, alias="POLL_MIN_INTERVAL_SEC")
+    poll_max_interval_sec: int = Field(default=900, alias="POLL_MAX_INTERVAL_SEC")
+    websub_callback_url: Optional[str] = Field(default=None, alias="WEBSUB_CALLBACK_URL")
+    websub_hub_url: str = Field(default="https://pubsubhubbub.appspot.com/subscribe", alias="WEBSUB_HUB_URL")
+    websub_secret: Optional[str] = Field(default=None, alias="WEBSUB_SECRET")
+    websub_lease_sec: int = Field(default=432000, alias="WEBSUB_LEASE_SEC")
+    websub_poll_interval_sec: int = Field(default=900, alias="WEBSUB_POLL_INTERVAL_SEC")
     channel_ids_raw: str = Field(default="@FRANCE24", alias="CHANNEL_IDS")
+    extractor_workers: int = Field(default=2, alias="EXTRACTOR_WORKERS")
+    extractor_max_jobs: int = Field(default=200, alias="EXTRACTOR_MAX_JOBS")
+    extractor_max_rss_mb: int = Field(default=512, alias="EXTRACTOR_MAX_RSS_MB")
+    extractor_timeout_sec: int = Field(default=30, alias="EXTRACTOR_TIMEOUT_SEC")
     recording_root: str = Field(default="data/recordings", alias="RECORDING_ROOT")
+    catalog_path: Optional[str] = Field(default=None, alias="CATALOG_PATH")
     video_quality: str = Field(default="best", alias="VIDEO_QUALITY")
+    recording_engine: str = Field(default="ffmpeg", alias="RECORDING_ENGINE")
+    native_fetch_concurrency: int = Field(default=64, alias="NATIVE_FETCH_CONCURRENCY")
+    native_max_connections: int = Field(default=200, alias="NATIVE_MAX_CONNECTIONS")
+    native_segment_retries: int = Field(default=3, alias="NATIVE_SEGMENT_RETRIES")
     segment_time_sec: int = Field(default=300, alias="SEGMENT_TIME_SEC")
+    manifest_compact_sec: int = Field(default=60, alias="MANIFEST_COMPACT_SEC")
+    seek_index: bool = Field(default=True, alias="SEEK_INDEX")
+    verify_segments: bool = Field(default=True, alias="VERIFY_SEGMENTS")
+    verify_archive_interval_sec: int = Field(default=0, alias="VERIFY_ARCHIVE_INTERVAL_SEC")
+    segment_events: str = Field(default="auto", alias="SEGMENT_EVENTS")
+    hls_refresh_margin_sec: int = Field(default=300, alias="HLS_REFRESH_MARGIN_SEC")
+    hls_default_ttl_sec: int = Field(default=3600, alias="HLS_DEFAULT_TTL_SEC")
+    stall_timeout_sec: int = Field(default=60, alias="STALL_TIMEOUT_SEC")
+    restart_overlap: bool = Field(default=False, alias="RESTART_OVERLAP")
+    detach_ingests: bool = Field(default=False, alias="DETACH_INGESTS")
+    chat_enabled: bool = Field(default=True, alias="CHAT_ENABLED")
+    chat_compress: bool = Field(default=False, alias="CHAT_COMPRESS")
+    chat_queue_size: int = Field(default=10000, alias="CHAT_QUEUE_SIZE")
+    chat_flush_sec: float = Field(default=1.0, alias="CHAT_FLUSH_SEC")
+    postprocess_format: str = Field(default="off", alias="POSTPROCESS_FORMAT")
+    postprocess_concurrency: int = Field(default=1, alias="POSTPROCESS_CONCURRENCY")
+    postprocess_nice: int = Field(default=10, alias="POSTPROCESS_NICE")
+    postprocess_pause_after_sec: int = Field(default=15, alias="POSTPROCESS_PAUSE_AFTER_SEC")
+    # unset: no watermark eviction (it deletes recordings, so it is opt-in)
+    retention_high_watermark: Optional[float] = Field(default=None, alias="RETENTION_HIGH_WATERMARK")
+    retention_low_watermark: Optional[float] = Field(default=None, alias="RETENTION_LOW_WATERMARK")
+    retention_policies: str = Field(default="", alias="RETENTION_POLICIES")
+    retention_cold_dir: Optional[str] = Field(default=None, alias="RETENTION_COLD_DIR")
+    retention_interval_sec: int = Field(default=60, alias="RETENTION_INTERVAL_SEC")
+    governor_max_ingests: int = Field(default=0, alias="GOVERNOR_MAX_INGESTS")
+    governor_max_resolves: int = Field(default=4, alias="GOVERNOR_MAX_RESOLVES")
+    governor_max_background: int = Field(default=2, alias="GOVERNOR_MAX_BACKGROUND")
+    governor_max_chats: int = Field(default=0, alias="GOVERNOR_MAX_CHATS")
+    governor_bandwidth_mbps: float = Field(default=0.0, alias="GOVERNOR_BANDWIDTH_MBPS")
+    governor_min_quality: str = Field(default="360p", alias="GOVERNOR_MIN_QUALITY")
+    governor_priorities: str = Field(default="", alias="GOVERNOR_PRIORITIES")
+    quality_adaptive: bool = Field(default=True, alias="QUALITY_ADAPTIVE")
+    share_ingests: bool = Field(default=True, alias="SHARE_INGESTS")
     restart_max_retries: int = Field(default=10, alias="RESTART_MAX_RETRIES")
     restart_backoff_initial_sec: int = Field(default=3, alias="RESTART_BACKOFF_INITIAL_SEC")
     restart_backoff_max_sec: int = Field(default=60, alias="RESTART_BACKOFF_MAX_SEC")
+    media_accel_redirect: Optional[str] = Field(default=None, alias="MEDIA_ACCEL_REDIRECT")
+    loop_block_threshold_ms: int = Field(default=100, alias="LOOP_BLOCK_THRESHOLD_MS")
     log_format: str = Field(default="plain", alias="LOG_FORMAT")
     metrics_port: int = Field(default=9100, alias="METRICS_PORT")
     api_port: int = Field(default=8000, alias="API_PORT")
@@ -0,0 +1,107 @@
+import asyncio
+import collections
+import heapq
+import logging
+import os
+import pathlib
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.metrics.registry import event_loop_lag_seconds, event_loop_blocks_total, event_loop_longest_block_seconds
+
+log = logging.getLogger(__name__)
+
+ROOT_DIR = pathlib.Path(__file__).resolve().parents[2]
+SRC_DIR = str(ROOT_DIR / "src")
+HEARTBEAT_SEC = 0.05
+STACK_DEPTH = 12
+KEEP_LONGEST = 10
+KEEP_RECENT = 50
+
+
+def _where(stack: traceback.StackSummary) -> str:
+    # the innermost frame of our own code; a stall inside a library is blamed on its caller
+    for frame in reversed(stack):
+        if frame.filename.startswith(SRC_DIR):
+            return f"{os.path.relpath(frame.filename, ROOT_DIR)}:{frame.lineno} {frame.name}"
+    if stack:
+        frame = stack[-1]
+        return f"{pathlib.Path(frame.filename).name}:{frame.lineno} {frame.name}"
+    return "unknown"
+
+
+# A heartbeat task measures how late the loop wakes up. A watchdog thread notices while a
+# wakeup is overdue and grabs the loop thread's stack then, so a stall is reported with the
+# code that was holding the loop, not with whatever ran after it.
+class LoopMonitor:
+    def __init__(self, threshold_sec: float = 0.1):
+        self.threshold = threshold_sec
+        self.longest: List[Tuple[float, int, Dict[str, Any]]] = []
+        self.recent: Deque[Dict[str, Any]] = collections.deque(maxlen=KEEP_RECENT)
+        self.blocks = 0
+        self._loop_thread: Optional[int] = None
+        self._beat = time.monotonic()
+        self._sample: Optional[Tuple[float, traceback.StackSummary]] = None
+        self._stop = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-monitor", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(HEARTBEAT_SEC)
+            now = time.monotonic()
+            lag = max(0.0, now - before - HEARTBEAT_SEC)
+            self._beat = now
+            event_loop_lag_seconds.observe(lag)
+            sample, self._sample = self._sample, None
+            if lag >= self.threshold:
+                self._record(lag, sample[1] if sample and sample[0] >= before else None)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            overdue = time.monotonic() - self._beat - HEARTBEAT_SEC
+            if overdue < self.threshold / 2 or self._sample is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._sample = (time.monotonic(), traceback.extract_stack(frame, limit=STACK_DEPTH))
+
+    def _record(self, seconds: float, stack: Optional[traceback.StackSummary]):
+        where = _where(stack) if stack else "unknown"
+        block = {
+            "seconds": round(seconds, 4),
+            "at": time.time(),
+            "where": where,
+            "stack": [f"{f.filename}:{f.lineno} {f.name}" for f in stack] if stack else [],
+        }
+        self.blocks += 1
+        self.recent.append(block)
+        event_loop_blocks_total.labels(where=where).inc()
+        if len(self.longest) < KEEP_LONGEST:
+            heapq.heappush(self.longest, (seconds, self.blocks, block))
+        elif seconds > self.longest[0][0]:
+            heapq.heapreplace(self.longest, (seconds, self.blocks, block))
+        event_loop_longest_block_seconds.set(max(b[0] for b in self.longest))
+        log.warning("Event loop blocked for %.0f ms in %s", seconds * 1000, where)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": round(self.threshold * 1000),
+            "blocks": self.blocks,
+            "longest": [b for _, _, b in sorted(self.longest, key=lambda x: -x[0])],
+            "recent": list(self.recent),
+        }
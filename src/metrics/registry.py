@@ -1,17 +1,68 @@
 from prometheus_client import Counter, Gauge, Histogram
 
-poll_duration_seconds = Histogram('poll_duration_seconds', 'Duration of a polling cycle')
+poll_check_duration_seconds = Histogram('poll_check_duration_seconds', 'Duration of a single channel live check', ['channel'])
+poll_schedule_lag_seconds = Histogram('poll_schedule_lag_seconds', 'Delay between a channel check being due and starting', buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+poll_checks_inflight = Gauge('poll_checks_inflight', 'Number of channel checks currently running')
 poll_errors_total = Counter('poll_errors_total', 'Number of poll errors')
 last_poll_timestamp = Gauge('last_poll_timestamp', 'Unix timestamp of last successful poll')
+poll_delay_seconds = Histogram('poll_delay_seconds', 'Delay chosen until a channel is checked again, by the reason for it', ['reason'], buckets=(5, 10, 15, 30, 60, 120, 300, 600, 900, 1800, 3600))
+
+# recording lifecycle, stage by stage: detect -> resolve -> spawn -> first segment (-> restart gap)
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+live_detection_seconds = Histogram('live_detection_seconds', 'Time to find out whether a channel is live', ['method'], buckets=STAGE_BUCKETS)
+hls_resolve_seconds = Histogram('hls_resolve_seconds', 'Time to resolve a video to its HLS manifest URL (cache misses only)', ['result'], buckets=STAGE_BUCKETS)
+ingest_spawn_seconds = Histogram('ingest_spawn_seconds', 'Time to start an ingest process or native session', ['engine'], buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5))
+ingest_first_segment_seconds = Histogram('ingest_first_segment_seconds', 'Time from an ingest starting to its first closed segment', ['engine'], buckets=(1, 2, 5, 10, 30, 60, 120, 300, 600, 900))
+
+event_loop_lag_seconds = Histogram('event_loop_lag_seconds', 'How late a periodic event loop wakeup ran', buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+event_loop_blocks_total = Counter('event_loop_blocks_total', 'Event loop stalls over LOOP_BLOCK_THRESHOLD_MS, by the code that was running', ['where'])
+event_loop_longest_block_seconds = Gauge('event_loop_longest_block_seconds', 'Longest event loop stall since startup')
+
+websub_notifications_total = Counter('websub_notifications_total', 'WebSub feed notifications received', ['result'])
+websub_verifications_total = Counter('websub_verifications_total', 'WebSub hub verification requests', ['mode', 'result'])
+websub_subscriptions = Gauge('websub_subscriptions', 'WebSub channel subscriptions by state', ['state'])
+
+governor_decisions_total = Counter('governor_decisions_total', 'Admission decisions of the resource governor', ['kind', 'decision'])
+governor_queue_depth = Gauge('governor_queue_depth', 'Work waiting for a governor budget', ['kind'])
+governor_in_use = Gauge('governor_in_use', 'Governor budget slots in use', ['kind'])
+governor_wait_seconds = Histogram('governor_wait_seconds', 'Time deferred work waited for admission', ['kind'], buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600))
+governor_bandwidth_kbps = Gauge('governor_bandwidth_kbps', 'Ingest bandwidth budget and measured use', ['measure'])
+
+youtube_api_requests_total = Counter('youtube_api_requests_total', 'YouTube Data API requests', ['endpoint', 'status'])
+youtube_quota_used = Gauge('youtube_quota_used_units', 'YouTube Data API quota units spent since the last daily reset')
+youtube_quota_pace_factor = Gauge('youtube_quota_pace_factor', 'Multiplier applied to the poll interval of API-checked channels to stay within quota')
 
 active_recordings = Gauge('active_recordings', 'Number of currently active recording sessions')
-channel_state = Gauge('channel_state', 'State of channel (0=idle,1=recording,2=stopping,3=error,4=waiting)', ['channel'])
+channel_state = Gauge('channel_state', 'State of channel (0=idle,1=recording,2=stopping,3=error,4=waiting,5=queued,6=shared)', ['channel'])
 recording_segments_total = Counter('recording_segments_total', 'Total segments produced', ['channel', 'video'])
 recording_bytes_total = Counter('recording_bytes_total', 'Total bytes recorded', ['channel', 'video'])
 recording_restarts_total = Counter('recording_restarts_total', 'Number of ffmpeg restarts', ['channel', 'video'])
+recording_restart_gap_seconds = Histogram('recording_restart_gap_seconds', 'Time between an ingest exiting and its replacement starting', buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120))
+native_segments_fetched_total = Counter('native_segments_fetched_total', 'HLS media segments fetched by the native engine')
+native_segments_lost_total = Counter('native_segments_lost_total', 'HLS media segments the native engine could not fetch or fell behind on')
+recording_stalls_total = Counter('recording_stalls_total', 'Ingests killed by the stall watchdog', ['channel'])
+recording_handoffs_total = Counter('recording_handoffs_total', 'Overlapping ingest handoffs', ['channel', 'reason', 'result'])
+chat_messages_total = Counter('chat_messages_total', 'Live chat messages written', ['channel'])
+chat_messages_dropped_total = Counter('chat_messages_dropped_total', 'Live chat messages not written', ['channel', 'reason'])
+ingest_bitrate_kbps = Gauge('ingest_bitrate_kbps', 'Current ingest output bitrate', ['channel'])
+ingest_speed = Gauge('ingest_speed', 'Ingest speed relative to realtime', ['channel'])
+ingest_output_bytes = Gauge('ingest_output_bytes', 'Bytes written by the current ingest', ['channel'])
+ingest_out_time_seconds = Gauge('ingest_out_time_seconds', 'Media time written by the current ingest', ['channel'])
+ingest_headroom = Gauge('ingest_headroom', 'Segment duration over the time taken to fetch and write it (native engine)', ['channel'])
+ingest_shared_segments_total = Counter('ingest_shared_segments_total', 'Parts of a shared ingest added to the session of another channel', ['channel', 'method'])
+quality_switches_total = Counter('quality_switches_total', 'HLS variant switches within a session', ['direction', 'reason'])
+postprocess_jobs_total = Counter('postprocess_jobs_total', 'Post-processing jobs finished', ['result'])
+postprocess_queue_depth = Gauge('postprocess_queue_depth', 'Post-processing jobs waiting for a worker')
+postprocess_paused = Gauge('postprocess_paused', '1 while post-processing is held back for live ingests')
+segments_verified_total = Counter('segments_verified_total', 'Segments checked by the MPEG-TS verifier', ['channel', 'result'])
+segment_stream_errors_total = Counter('segment_stream_errors_total', 'MPEG-TS errors found in recorded segments', ['channel', 'kind'])
+verify_bytes_total = Counter('verify_bytes_total', 'Bytes checked by the MPEG-TS verifier')
+hls_cache_requests_total = Counter('hls_cache_requests_total', 'HLS URL cache lookups and maintenance', ['result'])
 
 disk_used_bytes = Gauge('disk_used_bytes', 'Used disk bytes for recording root')
 disk_free_bytes = Gauge('disk_free_bytes', 'Free disk bytes for recording root')
+retention_evictions_total = Counter('retention_evictions_total', 'Sessions evicted by retention', ['channel', 'reason', 'action'])
+retention_bytes_freed_total = Counter('retention_bytes_freed_total', 'Bytes removed from the recording root by retention')
 
 channels_total = Gauge('channels_total', 'Total number of channels monitored')
 
@@ -21,4 +72,6 @@ CHANNEL_STATE_CODES = {
     'stopping': 2,
     'error': 3,
     'waiting': 4,
+    'queued': 5,
+    'shared': 6,
 }
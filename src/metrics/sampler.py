@@ -0,0 +1,117 @@
+import asyncio
+import collections
+import os
+import signal
+import sys
+import threading
+from typing import Any, Counter, Dict, Optional
+
+from src.metrics.loop_monitor import ROOT_DIR
+
+# leaf frames that mean a thread is waiting, not running: selector polls, locks, queues
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("connection.py", "_poll"),
+    ("connection.py", "wait"),
+    ("subprocess.py", "_try_wait"),
+}
+
+
+def _label(code) -> str:
+    path = code.co_filename
+    path = os.path.relpath(path, ROOT_DIR) if path.startswith(str(ROOT_DIR)) else os.path.basename(path)
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class Profile:
+    def __init__(self, seconds: float, interval: float, idle: bool):
+        self.seconds = seconds
+        self.interval = interval
+        self.idle = idle
+        self.samples = 0
+        self.idle_samples = 0
+        self.stacks: Counter[str] = collections.Counter()
+
+    def add(self, thread: str, frame):
+        self.samples += 1
+        leaf = frame.f_code
+        if (os.path.basename(leaf.co_filename), leaf.co_name) in IDLE_LEAVES:
+            self.idle_samples += 1
+            if not self.idle:
+                return
+        labels = []
+        f: Optional[Any] = frame
+        while f is not None:
+            labels.append(_label(f.f_code))
+            f = f.f_back
+        labels.append(thread)
+        self.stacks[";".join(reversed(labels))] += 1
+
+    def sample_threads(self, main_frame=None):
+        # every thread's Python stack at this instant; the main thread's from the signal
+        # handler's interrupted frame, so the handler itself is not counted
+        names = {t.ident: t.name for t in threading.enumerate()}
+        main, me = threading.main_thread().ident, threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == main and main_frame is not None:
+                frame = main_frame
+            elif ident == me:
+                continue
+            self.add(names.get(ident, str(ident)), frame)
+
+
+async def capture(seconds: float, interval: float = 0.01, idle: bool = False) -> Profile:
+    # Statistical profile of this process. On the main thread a SIGPROF timer drives the
+    # sampling, so samples follow CPU time and a loop that mostly waits yields few of them;
+    # elsewhere a thread samples on wall-clock time. Stacks parked in a wait are dropped
+    # unless `idle`.
+    profile = Profile(seconds, interval, idle)
+    if threading.current_thread() is not threading.main_thread():
+        await asyncio.to_thread(_sample_wall, profile)
+        return profile
+    previous = signal.signal(signal.SIGPROF, lambda signum, frame: profile.sample_threads(frame))
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, previous)
+    return profile
+
+
+def _sample_wall(profile: Profile):
+    stop = threading.Event()
+    timer = threading.Timer(profile.seconds, stop.set)
+    timer.start()
+    while not stop.wait(profile.interval):
+        profile.sample_threads()
+
+
+def folded(profile: Profile) -> str:
+    # "thread;outer;...;inner count" lines, as read by flamegraph.pl and speedscope
+    return "".join(f"{stack} {count}\n" for stack, count in profile.stacks.most_common())
+
+
+def top(profile: Profile, limit: int = 30) -> Dict[str, Any]:
+    # functions by samples spent in them (self) and under them (total)
+    own: Counter[str] = collections.Counter()
+    under: Counter[str] = collections.Counter()
+    for stack, count in profile.stacks.items():
+        frames = stack.split(";")[1:]
+        if frames:
+            own[frames[-1]] += count
+        for name in set(frames):
+            under[name] += count
+    busy = sum(profile.stacks.values()) or 1
+    return {
+        "seconds": profile.seconds,
+        "interval": profile.interval,
+        "samples": profile.samples,
+        "idle_samples": profile.idle_samples,
+        "self": [{"function": n, "samples": c, "percent": round(c * 100 / busy, 1)} for n, c in own.most_common(limit)],
+        "total": [{"function": n, "samples": c, "percent": round(c * 100 / busy, 1)} for n, c in under.most_common(limit)],
+    }
@@ -1,20 +1,30 @@
 import logging
 import asyncio
+from typing import Optional
 from prometheus_client import start_http_server, Counter
 from src.youtube.api_client import YouTubeClient
 from src.youtube.poller import Poller
 from src.youtube.live_detector import LiveDetector
+from src.youtube.websub import WebSubSubscriber
 from src.recording.recorder import Recorder
 from src.recording.ffmpeg_runner import FFmpegRunner
+from src.recording.hls_downloader import HlsDownloader
+from src.recording.governor import Governor, parse_priorities
+from src.storage.catalog import Catalog
+from src.storage.retention import RetentionEngine, parse_policies
+from src.storage.ts_verify import ArchiveVerifier
+from src.metrics.loop_monitor import LoopMonitor
+from src.postprocess.remux import RemuxPipeline
 from src.config.settings import settings
-from src.api.server import app, set_recorder
+from src.api.server import app, set_recorder, set_pipeline, set_loop_monitor, set_subscriber, set_governor
 import uvicorn
 
 RECORDINGS_STARTED = Counter('recordings_started_total', 'Number of recording sessions started')
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
-async def main():
+
+def setup_logging():
     if settings.log_format == 'json':
         import json, sys
         class JsonFormatter(logging.Formatter):
@@ -33,18 +43,152 @@ async def main():
         handler.setFormatter(JsonFormatter())
         root.addHandler(handler)
         root.setLevel(logging.INFO)
+
+
+def build_client() -> Optional[YouTubeClient]:
+    if not settings.youtube_api_key:
+        return None
+    return YouTubeClient(
+        settings.youtube_api_key,
+        daily_quota=settings.youtube_quota_daily,
+        quota_reserve=settings.youtube_quota_reserve,
+        recent_uploads=settings.youtube_recent_uploads,
+    )
+
+
+def build_runner():
+    if settings.recording_engine == "native":
+        return HlsDownloader(
+            fetch_concurrency=settings.native_fetch_concurrency,
+            max_connections=settings.native_max_connections,
+            retries=settings.native_segment_retries,
+        )
+    return FFmpegRunner(copyts=settings.restart_overlap, detach=settings.detach_ingests)
+
+
+def build_governor(workers: int = 1) -> Governor:
+    # sharded workers each get an equal share of the ingest, resolve, chat and bandwidth
+    # budgets; background work only runs in the parent, which keeps the whole budget
+    def share(limit: int) -> int:
+        return -(-limit // workers) if limit > 0 else 0
+    return Governor(
+        limits={
+            "ingest": share(settings.governor_max_ingests),
+            "resolve": share(settings.governor_max_resolves),
+            "chat": share(settings.governor_max_chats),
+            "background": settings.governor_max_background,
+        },
+        bandwidth_kbps=settings.governor_bandwidth_mbps * 1000 / workers,
+        priorities=parse_priorities(settings.governor_priorities),
+        min_quality=settings.governor_min_quality,
+    )
+
+
+def open_catalog() -> Catalog:
+    return Catalog(settings.catalog_path or f"{settings.recording_root}/.state/catalog.sqlite3", settings.recording_root)
+
+
+async def open_rebuilt_catalog() -> Catalog:
+    catalog = open_catalog()
+    rescanned = await asyncio.to_thread(catalog.rebuild)
+    logging.getLogger(__name__).info("Recordings catalog ready (%d sessions rescanned)", rescanned)
+    return catalog
+
+
+def build_pipeline(catalog: Catalog, live_lagging, governor: Optional[Governor] = None) -> Optional[RemuxPipeline]:
+    if settings.postprocess_format == "off":
+        return None
+    pipeline = RemuxPipeline(
+        catalog,
+        fmt=settings.postprocess_format,
+        concurrency=settings.postprocess_concurrency,
+        niceness=settings.postprocess_nice,
+        live_lagging=live_lagging,
+        governor=governor,
+    )
+    pipeline.start()
+    set_pipeline(pipeline)
+    return pipeline
+
+
+def build_retention(catalog: Catalog, recorder, pipeline: Optional[RemuxPipeline]) -> RetentionEngine:
+    return RetentionEngine(
+        catalog,
+        settings.recording_root,
+        high=settings.retention_high_watermark,
+        low=settings.retention_low_watermark,
+        policies=parse_policies(settings.retention_policies),
+        cold_dir=settings.retention_cold_dir,
+        is_active=lambda c, v: recorder.is_recording(c, v) or (pipeline is not None and pipeline.is_running(c, v)),
+        interval=settings.retention_interval_sec,
+    )
+
+
+def start_loop_monitor() -> Optional[LoopMonitor]:
+    if settings.loop_block_threshold_ms <= 0:
+        return None
+    monitor = LoopMonitor(settings.loop_block_threshold_ms / 1000)
+    monitor.start()
+    set_loop_monitor(monitor)
+    return monitor
+
+
+def build_subscriber() -> Optional[WebSubSubscriber]:
+    if not settings.websub_callback_url:
+        return None
+    subscriber = WebSubSubscriber(
+        settings.websub_callback_url,
+        settings.websub_hub_url,
+        f"{settings.recording_root}/.state",
+        lease_sec=settings.websub_lease_sec,
+        secret=settings.websub_secret,
+        channels=lambda: settings.channel_ids,
+    )
+    set_subscriber(subscriber)
+    return subscriber
+
+
+async def run_subscriber(subscriber: Optional[WebSubSubscriber]):
+    if subscriber is not None:
+        try:
+            await subscriber.run()
+        finally:
+            await subscriber.aclose()
+
+
+async def run_archive_verifier(catalog: Catalog, governor: Optional[Governor] = None):
+    if settings.verify_archive_interval_sec > 0:
+        await ArchiveVerifier(catalog, settings.verify_archive_interval_sec, governor=governor).run()
+
+
+async def run_api():
+    config = uvicorn.Config(app, host="0.0.0.0", port=settings.api_port, log_level="info", lifespan="on")
+    server = uvicorn.Server(config)
+    await server.serve()
+
+
+async def main():
+    setup_logging()
     if settings.metrics_port:
         start_http_server(settings.metrics_port)
-    yt = YouTubeClient(settings.youtube_api_key) if settings.youtube_api_key else None
-    recorder = Recorder(FFmpegRunner(), settings.recording_root)
+    start_loop_monitor()
+    catalog = await open_rebuilt_catalog()
+    governor = build_governor()
+    set_governor(governor)
+    recorder = Recorder(build_runner(), settings.recording_root, catalog=catalog, governor=governor)
     set_recorder(recorder)
-    poller = Poller(yt, recorder, LiveDetector())
+    pipeline = build_pipeline(catalog, recorder.ingest_lagging, governor)
+    recorder.postprocess = pipeline
+    retention = build_retention(catalog, recorder, pipeline)
+    detector = LiveDetector()
+    for channel_id, video_id in (await recorder.adopt()).items():
+        detector.seed(channel_id, video_id)
+    subscriber = build_subscriber()
+    poller = Poller(build_client(), recorder, detector, pushed=subscriber.covers if subscriber else None)
+    if subscriber is not None:
+        subscriber.on_notify = lambda channel_id, video_id: poller.check_now(channel_id)
     # Run poller and API server concurrently
-    async def run_api():
-        config = uvicorn.Config(app, host="0.0.0.0", port=settings.api_port, log_level="info", lifespan="on")
-        server = uvicorn.Server(config)
-        await server.serve()
-    await asyncio.gather(poller.run(), run_api())
+    await asyncio.gather(poller.run(), run_api(), retention.run(), run_archive_verifier(catalog, governor), run_subscriber(subscriber))
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,424 @@
+import asyncio
+import bisect
+import dataclasses
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from src.config.settings import settings
+from src.recording.ffmpeg_runner import IngestProgress
+
+log = logging.getLogger(__name__)
+
+VNODES = 64
+STATE_INTERVAL_SEC = 1.0
+WATCH_INTERVAL_SEC = 1.0
+RESPAWN_BACKOFF_SEC = (1, 2, 5, 10, 30)
+CALL_TIMEOUT_SEC = 30.0
+SHUTDOWN_TIMEOUT_SEC = 20.0
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    # consistent hashing: removing a worker only moves the channels that worker owned
+    def __init__(self, vnodes: int = VNODES):
+        self.vnodes = vnodes
+        self._points: List[Tuple[int, int]] = []
+
+    def add(self, node: int):
+        for i in range(self.vnodes):
+            bisect.insort(self._points, (_hash(f"{node}:{i}"), node))
+
+    def remove(self, node: int):
+        self._points = [p for p in self._points if p[1] != node]
+
+    def nodes(self) -> Set[int]:
+        return {n for _, n in self._points}
+
+    def owner(self, key: str) -> Optional[int]:
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, (_hash(key), -1)) % len(self._points)
+        return self._points[i][1]
+
+
+# ---- worker process ----
+
+class _ForwardPostprocess:
+    # closed sessions are remuxed by the parent's single pipeline
+    def __init__(self, conn):
+        self._conn = conn
+
+    def submit(self, channel_id: str, video_id: str, path: str):
+        self._conn.send(("closed", channel_id, video_id, path))
+
+
+def worker_main(index: int, conn, workers: int = 1):
+    try:
+        asyncio.run(_worker(index, conn, workers))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker(index: int, conn, workers: int):
+    from src.orchestration.service import setup_logging, build_client, build_runner, build_governor, open_catalog, start_loop_monitor
+    from src.recording.recorder import Recorder
+    from src.youtube.poller import Poller
+    from src.youtube.live_detector import LiveDetector
+
+    # the parent handles SIGINT and tells workers to shut down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging()
+    start_loop_monitor()
+    loop = asyncio.get_running_loop()
+    governor = build_governor(workers)
+    recorder = Recorder(build_runner(), settings.recording_root, catalog=open_catalog(), postprocess=_ForwardPostprocess(conn), governor=governor)
+    assigned: Set[str] = set()
+    # channels the parent's WebSub subscription covers
+    pushed: Set[str] = set()
+    detector = LiveDetector()
+    poller = Poller(build_client(), recorder, detector, channels=lambda: assigned, pushed=pushed.__contains__)
+    done = asyncio.Event()
+    tasks: List[asyncio.Task] = []
+
+    async def adopt_then_poll(channels: Set[str]):
+        # resume what this worker owned before a restart, then start polling
+        for channel_id, video_id in (await recorder.adopt(channels)).items():
+            detector.seed(channel_id, video_id)
+        await poller.run()
+
+    async def call(call_id: int, method: str, args: List[Any]):
+        try:
+            await getattr(recorder, method)(*args)
+            conn.send(("reply", call_id, None))
+        except Exception as e:
+            conn.send(("reply", call_id, str(e)))
+
+    def on_message():
+        try:
+            while conn.poll():
+                msg = conn.recv()
+                if msg[0] == "assign":
+                    if not tasks:
+                        tasks.append(asyncio.create_task(adopt_then_poll(set(msg[1]))))
+                    assigned.clear()
+                    assigned.update(msg[1])
+                elif msg[0] == "pushed":
+                    pushed.clear()
+                    pushed.update(msg[1])
+                elif msg[0] == "check" and tasks:
+                    poller.check_now(msg[1])
+                elif msg[0] == "settings":
+                    # PATCH /settings in the parent; the poller re-reads these as it schedules
+                    for name, value in msg[1].items():
+                        setattr(settings, name, value)
+                elif msg[0] == "call" and msg[2] in ("start", "stop"):
+                    asyncio.create_task(call(msg[1], msg[2], msg[3]))
+                elif msg[0] == "shutdown":
+                    done.set()
+        except (EOFError, OSError):
+            # parent went away
+            done.set()
+
+    async def report():
+        while True:
+            progress = {c: recorder.get_progress(c) for c in recorder.sessions()}
+            try:
+                conn.send(("state", {
+                    "states": recorder.channel_states(),
+                    "sessions": recorder.sessions(),
+                    "progress": {c: dataclasses.asdict(p) for c, p in progress.items() if p is not None},
+                    "governor": governor.report(),
+                }))
+            except OSError:
+                done.set()
+                return
+            await asyncio.sleep(STATE_INTERVAL_SEC)
+
+    loop.add_reader(conn.fileno(), on_message)
+    reporter = asyncio.create_task(report())
+    log.info("Worker %d started (pid %d)", index, os.getpid())
+    try:
+        await done.wait()
+    finally:
+        loop.remove_reader(conn.fileno())
+        for t in tasks + [reporter]:
+            t.cancel()
+        await asyncio.gather(*tasks, reporter, return_exceptions=True)
+        if settings.detach_ingests:
+            await recorder.release()
+        else:
+            await asyncio.gather(*(recorder.stop(c) for c in list(recorder.processes)), return_exceptions=True)
+        log.info("Worker %d stopped", index)
+
+
+# ---- parent process ----
+
+@dataclasses.dataclass
+class _Worker:
+    index: int
+    process: Any = None
+    conn: Any = None
+    assigned: Tuple[str, ...] = ()
+    pushed: Tuple[str, ...] = ()
+    state: Dict[str, Any] = dataclasses.field(default_factory=dict)
+    failures: int = 0
+    respawn_at: Optional[float] = None
+
+
+class ShardSupervisor:
+    # Spawns `count` worker processes, each running a poller and recorder for the channels
+    # the hash ring gives it. A dead worker leaves the ring (its channels move to the
+    # others) and rejoins once respawned. Workers report their state every second.
+    def __init__(self, count: int, pipeline=None):
+        self.count = count
+        self.pipeline = pipeline
+        # set when the parent runs a WebSub subscriber
+        self.subscriber = None
+        # settings changed through the API, replayed to respawned workers
+        self.overrides: Dict[str, Any] = {}
+        self.ring = HashRing()
+        self._ctx = multiprocessing.get_context("spawn")
+        self._workers: Dict[int, _Worker] = {i: _Worker(i) for i in range(count)}
+        self._calls: Dict[int, asyncio.Future] = {}
+        self._call_ids = itertools.count()
+
+    def start(self):
+        for w in self._workers.values():
+            self._spawn(w)
+        self.rebalance()
+
+    def _spawn(self, w: _Worker):
+        parent_conn, child_conn = self._ctx.Pipe()
+        w.process = self._ctx.Process(target=worker_main, args=(w.index, child_conn, self.count), name=f"recorder-worker-{w.index}")
+        w.process.start()
+        child_conn.close()
+        w.conn = parent_conn
+        w.assigned = ()
+        w.pushed = ()
+        w.state = {}
+        w.respawn_at = None
+        asyncio.get_running_loop().add_reader(parent_conn.fileno(), self._on_message, w)
+        self.ring.add(w.index)
+        if self.overrides:
+            self._send_settings(w, self.overrides)
+
+    def _on_message(self, w: _Worker):
+        try:
+            while w.conn.poll():
+                msg = w.conn.recv()
+                if msg[0] == "state":
+                    w.state = msg[1]
+                    w.failures = 0
+                elif msg[0] == "reply":
+                    fut = self._calls.pop(msg[1], None)
+                    if fut and not fut.done():
+                        fut.set_result(msg[2])
+                elif msg[0] == "closed" and self.pipeline:
+                    self.pipeline.submit(msg[1], msg[2], msg[3])
+        except (EOFError, OSError):
+            self._detach(w)
+
+    def _detach(self, w: _Worker):
+        if w.conn is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(w.conn.fileno())
+        except (ValueError, OSError):
+            pass
+        w.conn.close()
+        w.conn = None
+
+    def _reap(self, w: _Worker, now: float):
+        pid = w.process.pid
+        log.warning("Worker %d (pid %s) exited with %s; moving its channels", w.index, pid, w.process.exitcode)
+        self._detach(w)
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid)
+        self.ring.remove(w.index)
+        w.process = None
+        w.state = {}
+        w.respawn_at = now + RESPAWN_BACKOFF_SEC[min(w.failures, len(RESPAWN_BACKOFF_SEC) - 1)]
+        w.failures += 1
+        self.rebalance()
+
+    def rebalance(self):
+        # re-read every time so channel list changes are picked up too
+        plan: Dict[int, List[str]] = {i: [] for i in self.ring.nodes()}
+        for cid in settings.channel_ids:
+            owner = self.ring.owner(cid)
+            if owner is not None:
+                plan[owner].append(cid)
+        for index, channels in plan.items():
+            w = self._workers[index]
+            wanted = tuple(sorted(channels))
+            if w.conn is not None and wanted != w.assigned:
+                w.conn.send(("assign", list(wanted)))
+                w.assigned = wanted
+            covered = self.subscriber.covered() if self.subscriber is not None else set()
+            pushed = tuple(c for c in wanted if c in covered)
+            if w.conn is not None and pushed != w.pushed:
+                w.conn.send(("pushed", list(pushed)))
+                w.pushed = pushed
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.start()
+        try:
+            while True:
+                await asyncio.sleep(WATCH_INTERVAL_SEC)
+                now = loop.time()
+                for w in self._workers.values():
+                    if w.process is not None and not w.process.is_alive():
+                        self._reap(w, now)
+                    elif w.process is None and w.respawn_at is not None and now >= w.respawn_at:
+                        log.info("Respawning worker %d", w.index)
+                        self._spawn(w)
+                self.rebalance()
+        finally:
+            await self.shutdown()
+
+    async def shutdown(self):
+        for w in self._workers.values():
+            if w.conn is not None:
+                try:
+                    w.conn.send(("shutdown",))
+                except OSError:
+                    pass
+        for w in self._workers.values():
+            if w.process is not None:
+                await asyncio.to_thread(w.process.join, SHUTDOWN_TIMEOUT_SEC)
+                if w.process.is_alive():
+                    w.process.kill()
+            self._detach(w)
+
+    # --- views used by the API through ShardedRecorder ---
+
+    def owner_of(self, channel_id: str) -> Optional[_Worker]:
+        index = self.ring.owner(channel_id)
+        return self._workers.get(index) if index is not None else None
+
+    def merged(self, key: str) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for w in self._workers.values():
+            out.update(w.state.get(key, {}))
+        return out
+
+    def update_settings(self, values: Dict[str, Any]):
+        self.overrides.update(values)
+        for w in self._workers.values():
+            self._send_settings(w, values)
+
+    def _send_settings(self, w: _Worker, values: Dict[str, Any]):
+        if w.conn is not None:
+            try:
+                w.conn.send(("settings", dict(values)))
+            except OSError:
+                pass
+
+    def check(self, channel_id: str):
+        # a WebSub notification: the owning worker checks the channel now
+        w = self.owner_of(channel_id)
+        if w is not None and w.conn is not None:
+            try:
+                w.conn.send(("check", channel_id))
+            except OSError:
+                pass
+
+    async def call(self, channel_id: str, method: str, *args):
+        w = self.owner_of(channel_id)
+        if w is None or w.conn is None:
+            raise RuntimeError(f"no worker available for {channel_id}")
+        call_id = next(self._call_ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._calls[call_id] = fut
+        w.conn.send(("call", call_id, method, list(args)))
+        try:
+            error = await asyncio.wait_for(fut, CALL_TIMEOUT_SEC)
+        finally:
+            self._calls.pop(call_id, None)
+        if error:
+            raise RuntimeError(error)
+
+
+class ShardedGovernor:
+    # /system/governor in the parent: its own (background) budget and each worker's report
+    def __init__(self, shards: ShardSupervisor, local):
+        self.shards = shards
+        self.local = local
+
+    def report(self) -> Dict[str, Any]:
+        out = self.local.report()
+        out["workers"] = {w.index: w.state.get("governor") for w in self.shards._workers.values()}
+        return out
+
+
+class ShardedRecorder:
+    # stands in for Recorder in the parent's API routes, answering from worker reports
+    def __init__(self, shards: ShardSupervisor, catalog):
+        self.shards = shards
+        self.catalog = catalog
+
+    def channel_states(self) -> Dict[str, str]:
+        return self.shards.merged("states")
+
+    def get_channel_state(self, channel_id: str) -> str:
+        return self.channel_states().get(channel_id, 'idle')
+
+    def get_progress(self, channel_id: str) -> Optional[IngestProgress]:
+        data = self.shards.merged("progress").get(channel_id)
+        return IngestProgress(**data) if data else None
+
+    def ingest_lagging(self) -> bool:
+        limit = settings.postprocess_pause_after_sec
+        now = time.monotonic()
+        return any(now - p["last_advance"] > limit for p in self.shards.merged("progress").values())
+
+    def is_recording(self, channel_id: str, video_id: str) -> bool:
+        return self.shards.merged("sessions").get(channel_id) == video_id
+
+    async def start(self, channel_id: str, video_id: str):
+        await self.shards.call(channel_id, "start", channel_id, video_id)
+
+    async def stop(self, channel_id: str):
+        await self.shards.call(channel_id, "stop", channel_id)
+
+
+async def run_sharded(workers: int):
+    from prometheus_client import CollectorRegistry, start_http_server
+    from src.orchestration.service import setup_logging, open_rebuilt_catalog, build_pipeline, build_retention, run_api, run_archive_verifier, start_loop_monitor, build_subscriber, run_subscriber, build_governor
+    from src.api.server import set_recorder, set_governor, set_settings_listener
+
+    setup_logging()
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # the value class is picked when prometheus_client is imported, too late to set it here
+        raise RuntimeError("PROMETHEUS_MULTIPROC_DIR must be set before startup; use `python -m src.cli run --workers N`")
+    if settings.metrics_port:
+        # one endpoint for the parent and every worker
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        start_http_server(settings.metrics_port, registry=registry)
+    start_loop_monitor()
+    catalog = await open_rebuilt_catalog()
+    shards = ShardSupervisor(workers)
+    recorder = ShardedRecorder(shards, catalog)
+    set_recorder(recorder)
+    set_settings_listener(shards.update_settings)
+    governor = build_governor(workers)
+    set_governor(ShardedGovernor(shards, governor))
+    shards.pipeline = build_pipeline(catalog, recorder.ingest_lagging, governor)
+    retention = build_retention(catalog, recorder, shards.pipeline)
+    shards.subscriber = build_subscriber()
+    if shards.subscriber is not None:
+        shards.subscriber.on_notify = lambda channel_id, video_id: shards.check(channel_id)
+    log.info("Running %d recorder workers", workers)
+    await asyncio.gather(shards.run(), run_api(), retention.run(), run_archive_verifier(catalog, governor), run_subscriber(shards.subscriber))
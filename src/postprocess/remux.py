@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import pathlib
+import shutil
+import signal
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.storage.catalog import Catalog
+from src.storage.journal import JOURNAL_NAME, read_journal
+from src.metrics.registry import postprocess_jobs_total, postprocess_queue_depth, postprocess_paused
+
+log = logging.getLogger(__name__)
+
+FORMATS = {
+    # fragmented MP4 stays playable if the job is interrupted and needs no moov rewrite pass
+    "mp4": (".mp4", ["-bsf:a", "aac_adtstoasc", "-movflags", "+frag_keyframe+empty_moov+default_base_moof", "-f", "mp4"]),
+    "mkv": (".mkv", ["-f", "matroska"]),
+}
+MAX_ATTEMPTS = 3
+GATE_POLL_SEC = 2.0
+LIST_NAME = ".remux.txt"
+
+
+def session_parts(session_dir: pathlib.Path) -> List[pathlib.Path]:
+    # journal order when there is one; it also skips parts that were trimmed away
+    records = read_journal(session_dir / JOURNAL_NAME)
+    if records:
+        parts = [session_dir / r.name for r in sorted(records, key=lambda r: r.index)]
+    else:
+        parts = sorted(session_dir.glob("part_*.ts"))
+    return [p for p in parts if p.exists()]
+
+
+def priority_prefix(niceness: int) -> List[str]:
+    prefix: List[str] = []
+    if niceness and shutil.which("nice"):
+        prefix += ["nice", "-n", str(niceness)]
+    if shutil.which("ionice"):
+        # idle class: only gets disk time nobody else wants
+        prefix += ["ionice", "-c", "3"]
+    return prefix
+
+
+# Concatenates and remuxes closed sessions without re-encoding. Jobs are stored in the
+# catalog, so queued or interrupted ones are picked up again on the next start. Running
+# ffmpeg processes are SIGSTOPped while `live_lagging()` reports a live ingest falling behind.
+class RemuxPipeline:
+    def __init__(
+        self,
+        catalog: Catalog,
+        fmt: str = "mp4",
+        concurrency: int = 1,
+        niceness: int = 10,
+        live_lagging: Optional[Callable[[], bool]] = None,
+        governor=None,
+    ):
+        if fmt not in FORMATS:
+            raise ValueError(f"unsupported post-processing format: {fmt}")
+        self.catalog = catalog
+        self.fmt = fmt
+        self.concurrency = max(1, concurrency)
+        self.niceness = niceness
+        self.live_lagging = live_lagging or (lambda: False)
+        # Governor (or None); each job holds a background slot while it runs
+        self.governor = governor
+        self._queue: "asyncio.Queue[Tuple[str, str]]" = asyncio.Queue()
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[Tuple[str, str], asyncio.subprocess.Process] = {}
+
+    def start(self):
+        for job in self.catalog.jobs(state="running") + self.catalog.jobs(state="queued"):
+            if job["kind"] == self.fmt:
+                self.catalog.job_update(job["channel_id"], job["video_id"], self.fmt, "queued")
+                self._queue.put_nowait((job["channel_id"], job["video_id"]))
+        postprocess_queue_depth.set(self._queue.qsize())
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def submit(self, channel_id: str, video_id: str, path: str):
+        self.catalog.job_enqueue(channel_id, video_id, self.fmt, path)
+        self._queue.put_nowait((channel_id, video_id))
+        postprocess_queue_depth.set(self._queue.qsize())
+
+    def is_running(self, channel_id: str, video_id: str) -> bool:
+        return (channel_id, video_id) in self._running
+
+    def jobs(self, state: Optional[str] = None, channel_id: Optional[str] = None, limit: int = 1000):
+        return self.catalog.jobs(state, channel_id, limit)
+
+    async def _wait_for_capacity(self):
+        while self.live_lagging():
+            postprocess_paused.set(1)
+            await asyncio.sleep(GATE_POLL_SEC)
+        postprocess_paused.set(0)
+
+    async def _worker(self):
+        while True:
+            channel_id, video_id = await self._queue.get()
+            postprocess_queue_depth.set(self._queue.qsize())
+            job = next(iter(j for j in self.catalog.jobs(channel_id=channel_id) if j["video_id"] == video_id and j["kind"] == self.fmt), None)
+            if job is None or job["state"] != "queued":
+                continue
+            await self._wait_for_capacity()
+            grant = await self.governor.acquire("background", channel_id) if self.governor else None
+            self.catalog.job_update(channel_id, video_id, self.fmt, "running", attempt=True)
+            try:
+                output = await self._remux(channel_id, video_id, pathlib.Path(job["path"]))
+            except asyncio.CancelledError:
+                # shutdown: leave it queued for the next start
+                self.catalog.job_update(channel_id, video_id, self.fmt, "queued")
+                raise
+            except Exception as e:
+                failed = job["attempts"] + 1 >= MAX_ATTEMPTS
+                log.warning("Remux of %s/%s failed%s: %s", channel_id, video_id, "" if failed else "; will retry", e)
+                self.catalog.job_update(channel_id, video_id, self.fmt, "failed" if failed else "queued", error=str(e)[-500:])
+                postprocess_jobs_total.labels(result="failed").inc()
+                if not failed:
+                    self._queue.put_nowait((channel_id, video_id))
+                continue
+            finally:
+                if grant is not None:
+                    self.governor.release(grant)
+            self.catalog.job_update(channel_id, video_id, self.fmt, "done", output=str(output))
+            postprocess_jobs_total.labels(result="done").inc()
+            log.info("Remuxed %s/%s into %s", channel_id, video_id, output)
+
+    async def _remux(self, channel_id: str, video_id: str, session_dir: pathlib.Path) -> pathlib.Path:
+        parts = await asyncio.to_thread(session_parts, session_dir)
+        if not parts:
+            raise RuntimeError("no segments to remux")
+        ext, fmt_args = FORMATS[self.fmt]
+        output = session_dir / f"{video_id}{ext}"
+        partial = session_dir / f"{video_id}{ext}.partial"
+        listing = session_dir / LIST_NAME
+        listing.write_text("".join(f"file '{p.name}'\n" for p in parts), encoding="utf-8")
+        args = priority_prefix(self.niceness) + [
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-y",
+            "-f", "concat", "-safe", "0", "-i", str(listing),
+            "-map", "0", "-c", "copy", *fmt_args, str(partial),
+        ]
+        proc = await asyncio.create_subprocess_exec(*args, stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE)
+        key = (channel_id, video_id)
+        self._running[key] = proc
+        gate = asyncio.create_task(self._gate(proc))
+        try:
+            _, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
+        finally:
+            gate.cancel()
+            self._running.pop(key, None)
+            listing.unlink(missing_ok=True)
+        if proc.returncode != 0:
+            partial.unlink(missing_ok=True)
+            raise RuntimeError(stderr.decode(errors="replace").strip() or f"ffmpeg exited with {proc.returncode}")
+        os.replace(partial, output)
+        return output
+
+    async def _gate(self, proc: asyncio.subprocess.Process):
+        # nice/ionice lower the priority; this stops the job outright while an ingest lags
+        paused = False
+        try:
+            while proc.returncode is None:
+                lagging = self.live_lagging()
+                if lagging != paused:
+                    proc.send_signal(signal.SIGSTOP if lagging else signal.SIGCONT)
+                    paused = lagging
+                    postprocess_paused.set(int(paused))
+                await asyncio.sleep(GATE_POLL_SEC)
+        except ProcessLookupError:
+            pass
+        finally:
+            if paused and proc.returncode is None:
+                try:
+                    proc.send_signal(signal.SIGCONT)
+                except ProcessLookupError:
+                    pass
+                postprocess_paused.set(0)
+
+    async def close(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
@@ -0,0 +1,177 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import pathlib
+import queue
+import threading
+from collections import OrderedDict
+from typing import IO, Any, Dict, List, Optional
+
+from src.metrics.registry import chat_messages_total, chat_messages_dropped_total
+
+log = logging.getLogger(__name__)
+
+try:
+    import pytchat
+except Exception:
+    pytchat = None
+
+CHAT_DIR = "chat"
+CURRENT_NAME = "current.ndjson"
+TAIL_STEM = "tail"
+DEDUP_WINDOW = 20000
+MIN_POLL_SEC = 1.0
+MAX_POLL_SEC = 10.0
+STOP_JOIN_SEC = 15.0
+
+
+def chat_record(c: Any) -> Dict[str, Any]:
+    author = getattr(c, "author", None)
+    return {
+        "id": getattr(c, "id", None),
+        "ts": getattr(c, "timestamp", None),
+        "author_id": getattr(author, "channelId", None),
+        "author": getattr(author, "name", None),
+        "type": getattr(c, "type", None),
+        "message": getattr(c, "message", None),
+        "amount": getattr(c, "amountString", None) or None,
+    }
+
+
+# Live chat for one session. A pytchat thread polls at the interval YouTube asks for and
+# hands whole batches to a bounded queue; an asyncio task drains it every `flush_sec`,
+# drops re-polled ids and writes one NDJSON block per flush into chat/current.ndjson[.gz].
+# rotate() closes that file under the name of the segment that just closed, so
+# chat/part_NNN.ndjson[.gz] covers the wall-clock span of part_NNN.ts.
+class ChatCapture:
+    def __init__(self, channel_id: str, video_id: str, out_dir: pathlib.Path, compress: bool = False, queue_size: int = 10000, flush_sec: float = 1.0):
+        self.channel_id = channel_id
+        self.video_id = video_id
+        self.dir = out_dir / CHAT_DIR
+        self.compress = compress
+        self.flush_sec = flush_sec
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._chat = None
+        self._task: Optional[asyncio.Task] = None
+        self._fh: Optional[IO[bytes]] = None
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    @property
+    def suffix(self) -> str:
+        return ".ndjson.gz" if self.compress else ".ndjson"
+
+    @property
+    def current_path(self) -> pathlib.Path:
+        return self.dir / (CURRENT_NAME + (".gz" if self.compress else ""))
+
+    def start(self):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._poll, name=f"chat-{self.video_id}", daemon=True)
+        self._thread.start()
+        self._task = asyncio.create_task(self._drain_loop())
+
+    def _poll(self):
+        dropped = chat_messages_dropped_total.labels(channel=self.channel_id, reason="overflow")
+        try:
+            # interruptable=True installs a SIGINT handler, which fails outside the main thread
+            self._chat = pytchat.create(video_id=self.video_id, interruptable=False)
+            while not self._stop.is_set() and self._chat.is_alive():
+                data = self._chat.get()
+                for c in getattr(data, "items", ()):
+                    try:
+                        self._queue.put_nowait(chat_record(c))
+                    except queue.Full:
+                        dropped.inc()
+                interval = getattr(data, "interval", MIN_POLL_SEC) or MIN_POLL_SEC
+                self._stop.wait(min(max(interval, MIN_POLL_SEC), MAX_POLL_SEC))
+        except Exception as e:
+            log.warning("Chat capture for %s ended: %s", self.video_id, e)
+        finally:
+            if self._chat is not None:
+                self._chat.terminate()
+
+    def _take(self) -> List[Dict[str, Any]]:
+        batch: List[Dict[str, Any]] = []
+        dupes = 0
+        while True:
+            try:
+                rec = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            mid = rec.get("id")
+            if mid:
+                if mid in self._seen:
+                    dupes += 1
+                    continue
+                self._seen[mid] = None
+                if len(self._seen) > DEDUP_WINDOW:
+                    self._seen.popitem(last=False)
+            batch.append(rec)
+        if dupes:
+            chat_messages_dropped_total.labels(channel=self.channel_id, reason="duplicate").inc(dupes)
+        return batch
+
+    async def flush(self):
+        async with self._lock:
+            batch = self._take()
+            if not batch:
+                return
+            data = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in batch).encode()
+            if self._fh is None:
+                self._fh = gzip.open(self.current_path, "ab") if self.compress else self.current_path.open("ab")
+            self._fh.write(data)
+            self._fh.flush()
+            chat_messages_total.labels(channel=self.channel_id).inc(len(batch))
+
+    async def _drain_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_sec)
+            try:
+                await self.flush()
+            except OSError as e:
+                log.warning("Chat write failed for %s: %s", self.video_id, e)
+
+    def _close_current(self, stem: str):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        if self.current_path.exists():
+            target = self.dir / (stem + self.suffix)
+            if target.exists():
+                # the same segment name again (e.g. a retry): keep both halves
+                target = self.dir / f"{stem}.{int(os.path.getmtime(self.current_path))}{self.suffix}"
+            os.replace(self.current_path, target)
+
+    async def rotate(self, segment_name: str):
+        await self.flush()
+        async with self._lock:
+            self._close_current(pathlib.Path(segment_name).stem)
+
+    async def stop(self):
+        # stops polling; the file stays open so the final segment rotation still picks it up
+        self._stop.set()
+        if self._chat is not None:
+            self._chat.terminate()
+        if self._thread is not None:
+            await asyncio.to_thread(self._thread.join, STOP_JOIN_SEC)
+            if self._thread.is_alive():
+                log.warning("Chat thread for %s did not exit", self.video_id)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def close(self):
+        await self.stop()
+        async with self._lock:
+            # whatever arrived after the last segment closed
+            self._close_current(TAIL_STEM)
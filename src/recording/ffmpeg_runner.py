@@ -1,22 +1,271 @@
 import asyncio
 import logging
+import os
+import pathlib
 import shlex
-from typing import Dict, Optional
+import signal
+import subprocess
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .segment_tracker import segment_list_name
 
 log = logging.getLogger(__name__)
 
+TAIL_POLL_SEC = 0.5
+EXIT_POLL_SEC = 1.0
+# detached runs write -progress to a file; a slower cadence keeps it small on long streams
+DETACHED_STATS_PERIOD = "2"
+HEADROOM_SMOOTHING = 0.2
+
+
+@dataclass
+class IngestProgress:
+    bitrate_kbps: Optional[float] = None
+    speed: Optional[float] = None
+    total_size: int = 0
+    segment_bytes: int = 0
+    out_time_sec: float = 0.0
+    updated_at: Optional[float] = None
+    # monotonic time of the last update where output actually moved forward
+    last_advance: float = field(default_factory=time.monotonic)
+    # native engine only: segment duration / time taken to fetch and write it, smoothed
+    headroom: Optional[float] = None
+
+    @property
+    def output_bytes(self) -> int:
+        # the segment muxer often reports total_size=N/A; fall back to completed segments
+        return max(self.total_size, self.segment_bytes)
+
+    def update(self, values: Dict[str, str]):
+        advanced = False
+        out_time = values.get("out_time_us") or values.get("out_time_ms")
+        if out_time and out_time.lstrip("-").isdigit():
+            sec = int(out_time) / 1_000_000
+            advanced |= sec > self.out_time_sec
+            self.out_time_sec = max(self.out_time_sec, sec)
+        size = values.get("total_size", "")
+        if size.isdigit():
+            advanced |= int(size) > self.total_size
+            self.total_size = int(size)
+        bitrate = values.get("bitrate", "").strip()
+        self.bitrate_kbps = float(bitrate[:-len("kbits/s")]) if bitrate.endswith("kbits/s") else self.bitrate_kbps
+        speed = values.get("speed", "").strip()
+        self.speed = float(speed[:-1]) if speed.endswith("x") and speed[:-1].replace(".", "", 1).isdigit() else self.speed
+        self.updated_at = time.time()
+        if advanced:
+            self.last_advance = time.monotonic()
+
+    def note_segment(self, duration: float, seconds: float):
+        sample = duration / max(seconds, 1e-3)
+        self.headroom = sample if self.headroom is None else self.headroom + HEADROOM_SMOOTHING * (sample - self.headroom)
+
+    def to_dict(self) -> Dict[str, Optional[float]]:
+        return {
+            "bitrate_kbps": self.bitrate_kbps,
+            "speed": self.speed,
+            "output_bytes": self.output_bytes,
+            "out_time_sec": self.out_time_sec,
+            "headroom": round(self.headroom, 2) if self.headroom is not None else None,
+        }
+
+
+async def read_progress(stream: AsyncIterator[bytes], progress: IngestProgress, on_update: Optional[Callable[[IngestProgress], None]] = None):
+    # -progress emits key=value lines in blocks terminated by progress=continue|end
+    block: Dict[str, str] = {}
+    async for raw in stream:
+        key, _, value = raw.decode(errors="replace").strip().partition("=")
+        if not key:
+            continue
+        block[key] = value.strip()
+        if key == "progress":
+            progress.update(block)
+            if on_update:
+                on_update(progress)
+            block = {}
+
+
+async def tail_lines(path: pathlib.Path, alive: Callable[[], bool], from_end: bool = False) -> AsyncIterator[bytes]:
+    # follows a file another process appends to; ends once that process has exited and the rest is read
+    with open(path, "rb") as f:
+        if from_end:
+            f.seek(0, os.SEEK_END)
+        buf = b""
+        while True:
+            exited = not alive()
+            chunk = f.read(64 * 1024)
+            if chunk:
+                lines = (buf + chunk).split(b"\n")
+                buf = lines.pop()
+                for line in lines:
+                    yield line + b"\n"
+                continue
+            if exited:
+                break
+            await asyncio.sleep(TAIL_POLL_SEC)
+        if buf:
+            yield buf
+
+
+def detached_files(out_dir: str, start_number: int) -> Tuple[pathlib.Path, pathlib.Path]:
+    # -progress output and stderr of a detached run, next to its parts
+    base = pathlib.Path(out_dir) / f".ingest_{start_number:03d}"
+    return base.with_suffix(".progress"), base.with_suffix(".log")
+
+
+# An ffmpeg in its own session whose progress and stderr go to files instead of pipes, so
+# it keeps recording when the service exits. A later instance adopts it by pid; that one is
+# not its parent, so the exit status is unknown and reported as 0.
+class DetachedProcess:
+    def __init__(self, pid: int, progress_path: pathlib.Path, log_path: pathlib.Path, popen: Optional[subprocess.Popen] = None):
+        self.pid = pid
+        self.progress_path = progress_path
+        self.log_path = log_path
+        self._popen = popen
+        self._code: Optional[int] = None
+        self._exit: Optional[asyncio.Task] = None
+        self.stderr: Optional[AsyncIterator[bytes]] = None
+        self.progress_task: Optional[asyncio.Task] = None
+
+    @property
+    def returncode(self) -> Optional[int]:
+        if self._code is None:
+            if self._popen is not None:
+                self._code = self._popen.poll()
+            else:
+                try:
+                    os.kill(self.pid, 0)
+                except ProcessLookupError:
+                    self._code = 0
+                except PermissionError:
+                    pass
+        return self._code
+
+    def follow(self, progress: IngestProgress, on_progress: Optional[Callable[[IngestProgress], None]] = None, from_end: bool = False):
+        alive = lambda: self.returncode is None
+        self.stderr = tail_lines(self.log_path, alive, from_end)
+        self.progress_task = asyncio.create_task(read_progress(tail_lines(self.progress_path, alive, from_end), progress, on_progress))
+
+    async def wait(self) -> int:
+        if self.returncode is None:
+            if self._exit is None:
+                self._exit = asyncio.create_task(self._wait_exit())
+            await asyncio.shield(self._exit)
+        return self.returncode
+
+    async def _wait_exit(self):
+        fd = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                fd = os.pidfd_open(self.pid)
+            except OSError:
+                pass
+        if fd is not None:
+            # a pidfd turns readable when the process exits, child or not
+            loop = asyncio.get_running_loop()
+            exited = loop.create_future()
+            loop.add_reader(fd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(fd)
+                os.close(fd)
+        while self.returncode is None:
+            await asyncio.sleep(EXIT_POLL_SEC)
+
+    def send_signal(self, sig: int):
+        if self.returncode is None:
+            try:
+                os.kill(self.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def discard_files(self):
+        self.progress_path.unlink(missing_ok=True)
+        self.log_path.unlink(missing_ok=True)
+
+
+def adopt_detached(pid: int, out_dir: str, start_number: int) -> Optional[DetachedProcess]:
+    # only a live ffmpeg still writing into out_dir is taken over, never a recycled pid
+    try:
+        cmdline = pathlib.Path(f"/proc/{pid}/cmdline").read_bytes().split(b"\0")
+    except OSError:
+        return None
+    # the output pattern is specific enough: no other process has this session's path on its command line
+    if os.fsencode(f"{out_dir}/part_%03d.ts") not in cmdline:
+        return None
+    progress_path, log_path = detached_files(out_dir, start_number)
+    if not progress_path.exists() or not log_path.exists():
+        return None
+    return DetachedProcess(pid, progress_path, log_path)
+
+
 class FFmpegRunner:
-    async def record(self, hls_url: str, out_dir: str, segment_time: int = 300, headers: Optional[Dict[str, str]] = None):
-        header_arg = ""
+    def __init__(self, copyts: bool = False, detach: bool = False):
+        # source timestamps are kept when overlapping runs must be trimmed against each other by PTS
+        self.copyts = copyts
+        # detached runs survive a service restart and are adopted by the next instance
+        self.detach = detach
+
+    def command(self, hls_url: str, out_dir: str, segment_time: int = 300, headers: Optional[Dict[str, str]] = None, start_number: int = 0, progress_to: str = "pipe:1") -> List[str]:
+        args = ["ffmpeg", "-hide_banner", "-loglevel", "warning", "-nostats", "-progress", progress_to, "-y"]
+        if progress_to != "pipe:1":
+            args += ["-stats_period", DETACHED_STATS_PERIOD]
         if headers:
-            header_block = "".join(f"{k}: {v}\r\n" for k, v in headers.items())
-            header_arg = f"-headers {shlex.quote(header_block)} "
-        cmd = (
-            f"ffmpeg -hide_banner -loglevel warning -y "
-            f"{header_arg}"
-            f"-i {shlex.quote(hls_url)} "
-            f"-c copy -f segment -segment_time {int(segment_time)} -reset_timestamps 1 "
-            f"{out_dir}/part_%03d.ts"
+            args += ["-headers", "".join(f"{k}: {v}\r\n" for k, v in headers.items())]
+        if self.copyts:
+            args += ["-copyts"]
+        args += ["-i", hls_url, "-c", "copy", "-f", "segment", "-segment_time", str(int(segment_time))]
+        if not self.copyts:
+            args += ["-reset_timestamps", "1"]
+        args += [
+            "-segment_start_number", str(start_number),
+            "-segment_list", f"{out_dir}/{segment_list_name(start_number)}", "-segment_list_type", "csv",
+            f"{out_dir}/part_%03d.ts",
+        ]
+        return args
+
+    async def record(
+        self,
+        hls_url: str,
+        out_dir: str,
+        segment_time: int = 300,
+        headers: Optional[Dict[str, str]] = None,
+        progress: Optional[IngestProgress] = None,
+        on_progress: Optional[Callable[[IngestProgress], None]] = None,
+        start_number: int = 0,
+        predecessor=None,
+    ):
+        # predecessor is only used by the native engine; ffmpeg overlap is trimmed by PTS afterwards
+        if self.detach:
+            return self._spawn_detached(hls_url, out_dir, segment_time, headers, start_number, progress, on_progress)
+        args = self.command(hls_url, out_dir, segment_time, headers, start_number)
+        log.info("Running ffmpeg: %s", shlex.join(args))
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
         )
-        log.info("Running ffmpeg: %s", cmd)
-        return await asyncio.create_subprocess_shell(cmd)
+        # the reader ends by itself at EOF when ffmpeg exits
+        proc.progress_task = asyncio.create_task(read_progress(proc.stdout, progress or IngestProgress(), on_progress))
+        return proc
+
+    def _spawn_detached(self, hls_url, out_dir, segment_time, headers, start_number, progress, on_progress) -> DetachedProcess:
+        progress_path, log_path = detached_files(out_dir, start_number)
+        progress_path.write_bytes(b"")
+        args = self.command(hls_url, out_dir, segment_time, headers, start_number, progress_to=str(progress_path))
+        log.info("Running detached ffmpeg: %s", shlex.join(args))
+        with open(log_path, "wb") as stderr:
+            # a new session keeps it out of the service's process group and its signals
+            popen = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr, start_new_session=True)
+        proc = DetachedProcess(popen.pid, progress_path, log_path, popen)
+        proc.follow(progress or IngestProgress(), on_progress)
+        return proc
@@ -0,0 +1,267 @@
+import asyncio
+import collections
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Counter, Dict, List, Optional, Tuple
+
+from src.metrics.registry import (
+    governor_decisions_total,
+    governor_queue_depth,
+    governor_in_use,
+    governor_wait_seconds,
+    governor_bandwidth_kbps,
+)
+
+log = logging.getLogger(__name__)
+
+KINDS = ("ingest", "resolve", "background", "chat")
+# kbps of a YouTube live rendition, best first; used until streams at that quality are measured
+QUALITY_KBPS = {
+    "2160p": 20000,
+    "1440p": 10000,
+    "1080p": 6000,
+    "720p": 3000,
+    "480p": 1500,
+    "360p": 800,
+    "240p": 400,
+    "144p": 200,
+}
+# "best" is usually the 1080p rendition on YouTube live
+BEST_KBPS = QUALITY_KBPS["1080p"]
+# shorter parts (a trimmed handoff remainder) say little about the stream's rate
+MIN_PART_SEC = 1.0
+RATE_SMOOTHING = 0.3
+
+
+def parse_priorities(raw: str) -> Dict[str, int]:
+    # "@FRANCE24=10,UCxxxx=5"
+    out: Dict[str, int] = {}
+    for item in (raw or "").split(","):
+        channel, _, value = item.strip().partition("=")
+        if channel and value.strip().lstrip("-").isdigit():
+            out[channel] = int(value)
+    return out
+
+
+@dataclass(eq=False)
+class Grant:
+    kind: str
+    channel_id: Optional[str]
+    quality: Optional[str] = None
+    # bandwidth an ingest is charged: the estimate for its quality until it has been measured
+    kbps: float = 0.0
+    measured: bool = False
+    granted_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass(order=True)
+class _Waiter:
+    key: Tuple[int, int]
+    kind: str = field(compare=False)
+    channel_id: Optional[str] = field(compare=False)
+    quality: Optional[str] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    since: float = field(compare=False, default_factory=time.monotonic)
+
+
+# Admission control for the work that competes for CPU, NIC and the to_thread pool.
+# Each kind has a budget of concurrent grants (0 = unlimited); waiters queue per kind,
+# highest channel priority first, then first come. Ingests are also charged against a
+# bandwidth budget measured from the running ingests' output: an ingest that does not fit
+# at the requested quality is admitted at the best lower one that does, down to
+# `min_quality`, and deferred when even that does not fit.
+class Governor:
+    def __init__(
+        self,
+        limits: Optional[Dict[str, int]] = None,
+        bandwidth_kbps: float = 0.0,
+        priorities: Optional[Dict[str, int]] = None,
+        min_quality: str = "360p",
+    ):
+        self.limits = {kind: max(0, (limits or {}).get(kind, 0)) for kind in KINDS}
+        self.bandwidth_kbps = max(0.0, bandwidth_kbps)
+        self.priorities = priorities or {}
+        self.min_quality = min_quality
+        self._grants: Dict[str, List[Grant]] = {kind: [] for kind in KINDS}
+        self._queues: Dict[str, List[_Waiter]] = {kind: [] for kind in KINDS}
+        self._ingests: Dict[str, Grant] = {}
+        # measured kbps per quality, smoothed over every ingest seen at it
+        self._quality_kbps: Dict[str, float] = {}
+        self._seq = itertools.count()
+        self.decisions: Dict[str, Counter[str]] = {kind: collections.Counter() for kind in KINDS}
+        governor_bandwidth_kbps.labels(measure="budget").set(self.bandwidth_kbps)
+
+    def priority(self, channel_id: Optional[str]) -> int:
+        return self.priorities.get(channel_id, 0) if channel_id else 0
+
+    def estimate(self, quality: Optional[str]) -> float:
+        return self._quality_kbps.get(quality) or QUALITY_KBPS.get(quality) or BEST_KBPS
+
+    def bandwidth_used(self) -> float:
+        return sum(g.kbps for g in self._grants["ingest"])
+
+    def ladder(self, quality: Optional[str]) -> List[Optional[str]]:
+        # the requested quality, then the lower ones down to min_quality ("best": all of them)
+        names = list(QUALITY_KBPS)
+        lower = names[names.index(quality) + 1:] if quality in QUALITY_KBPS else names
+        floor = names.index(self.min_quality) if self.min_quality in QUALITY_KBPS else len(names) - 1
+        return [quality] + [q for q in lower if names.index(q) <= floor]
+
+    def _fit(self, kind: str, quality: Optional[str]) -> Optional[Tuple[Optional[str], float]]:
+        limit = self.limits[kind]
+        if limit and len(self._grants[kind]) >= limit:
+            return None
+        if kind != "ingest":
+            return quality, 0.0
+        if not self.bandwidth_kbps:
+            return quality, self.estimate(quality)
+        free = self.bandwidth_kbps - self.bandwidth_used()
+        for candidate in self.ladder(quality):
+            kbps = self.estimate(candidate)
+            if kbps <= free:
+                return candidate, kbps
+        return None
+
+    def _grant(self, kind: str, channel_id: Optional[str], requested: Optional[str], quality: Optional[str], kbps: float) -> Grant:
+        grant = Grant(kind, channel_id, quality, kbps)
+        self._grants[kind].append(grant)
+        if kind == "ingest" and channel_id:
+            self._ingests[channel_id] = grant
+        decision = "downgraded" if quality != requested else "admitted"
+        self.decisions[kind][decision] += 1
+        governor_decisions_total.labels(kind=kind, decision=decision).inc()
+        if decision == "downgraded":
+            log.info("Admitting %s at %s instead of %s to stay within the bandwidth budget", channel_id, quality, requested)
+        self._update_gauges(kind)
+        return grant
+
+    async def acquire(self, kind: str, channel_id: Optional[str] = None, quality: Optional[str] = None) -> Grant:
+        queue = self._queues[kind]
+        waiter = _Waiter((-self.priority(channel_id), next(self._seq)), kind, channel_id, quality, asyncio.get_running_loop().create_future())
+        heapq.heappush(queue, waiter)
+        self._dispatch(kind)
+        if waiter.future.done():
+            return waiter.future.result()
+        self.decisions[kind]["deferred"] += 1
+        governor_decisions_total.labels(kind=kind, decision="deferred").inc()
+        self._update_gauges(kind)
+        if channel_id:
+            log.info("Deferring %s for %s: %s budget exhausted (%d queued)", kind, channel_id, kind, len(queue))
+        try:
+            grant = await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # granted in the same tick the caller gave up
+                self.release(waiter.future.result())
+            else:
+                self.decisions[kind]["cancelled"] += 1
+                governor_decisions_total.labels(kind=kind, decision="cancelled").inc()
+                self._dispatch(kind)
+            raise
+        governor_wait_seconds.labels(kind=kind).observe(time.monotonic() - waiter.since)
+        return grant
+
+    def admit(self, kind: str, channel_id: Optional[str] = None, quality: Optional[str] = None) -> Grant:
+        # work that is already running (adopted ingests) is counted without waiting
+        return self._grant(kind, channel_id, quality, quality, self.estimate(quality) if kind == "ingest" else 0.0)
+
+    def release(self, grant: Grant):
+        grants = self._grants[grant.kind]
+        if grant not in grants:
+            return
+        grants.remove(grant)
+        if grant.kind == "ingest" and self._ingests.get(grant.channel_id) is grant:
+            del self._ingests[grant.channel_id]
+        self._dispatch(grant.kind)
+        self._update_gauges(grant.kind)
+
+    def ingests(self) -> Dict[str, Grant]:
+        return dict(self._ingests)
+
+    def requalify(self, channel_id: str, quality: str):
+        # the session switched variant: charge the new quality's estimate until it is measured
+        grant = self._ingests.get(channel_id)
+        if grant is None:
+            return
+        grant.quality = quality
+        grant.kbps = self.estimate(quality)
+        grant.measured = False
+        self._update_gauges("ingest")
+        self._dispatch("ingest")
+
+    @contextlib.asynccontextmanager
+    async def slot(self, kind: str, channel_id: Optional[str] = None) -> AsyncIterator[Grant]:
+        grant = await self.acquire(kind, channel_id)
+        try:
+            yield grant
+        finally:
+            self.release(grant)
+
+    def _dispatch(self, kind: str):
+        # strictly in queue order: a high-priority ingest waiting for bandwidth is not
+        # overtaken by smaller ones behind it
+        queue = self._queues[kind]
+        while queue:
+            head = queue[0]
+            if head.future.done():
+                heapq.heappop(queue)
+                continue
+            fit = self._fit(kind, head.quality)
+            if fit is None:
+                break
+            heapq.heappop(queue)
+            head.future.set_result(self._grant(kind, head.channel_id, head.quality, *fit))
+        self._update_gauges(kind)
+
+    def observe(self, channel_id: str, size: int, duration: Optional[float], quality: Optional[str] = None):
+        # The recorder reports each part its ingest closes. A live stream is fetched in
+        # realtime, so bytes over media duration is the rate the grant is charged; until
+        # a whole part has been seen it keeps the estimate. The running output size is no
+        # use here: ffmpeg's segment muxer reports it only as parts close, if at all.
+        grant = self._ingests.get(channel_id)
+        if grant is None or size <= 0 or not duration or duration < MIN_PART_SEC:
+            return
+        if quality is not None and quality != grant.quality:
+            # the last part of the variant the session just switched away from
+            return
+        kbps = size * 8 / 1000 / duration
+        grant.kbps = kbps if not grant.measured else grant.kbps + RATE_SMOOTHING * (kbps - grant.kbps)
+        grant.measured = True
+        known = self._quality_kbps.get(grant.quality)
+        self._quality_kbps[grant.quality] = kbps if known is None else known + RATE_SMOOTHING * (kbps - known)
+        governor_bandwidth_kbps.labels(measure="used").set(self.bandwidth_used())
+        # a stream that turned out cheaper than estimated may make room
+        self._dispatch("ingest")
+
+    def _update_gauges(self, kind: str):
+        governor_in_use.labels(kind=kind).set(len(self._grants[kind]))
+        governor_queue_depth.labels(kind=kind).set(sum(1 for w in self._queues[kind] if not w.future.done()))
+        if kind == "ingest":
+            governor_bandwidth_kbps.labels(measure="used").set(self.bandwidth_used())
+
+    def report(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "budgets": dict(self.limits),
+            "in_use": {kind: len(grants) for kind, grants in self._grants.items()},
+            "bandwidth": {
+                "budget_kbps": self.bandwidth_kbps,
+                "used_kbps": round(self.bandwidth_used(), 1),
+                "quality_kbps": {q: round(v, 1) for q, v in self._quality_kbps.items()},
+                "ingests": {
+                    g.channel_id: {"quality": g.quality, "kbps": round(g.kbps, 1), "measured": g.measured}
+                    for g in self._grants["ingest"]
+                },
+            },
+            "queue": [
+                {"kind": w.kind, "channel_id": w.channel_id, "priority": -w.key[0], "quality": w.quality, "waiting_sec": round(now - w.since, 1)}
+                for kind in KINDS
+                for w in sorted(self._queues[kind])
+                if not w.future.done()
+            ],
+            "decisions": {kind: dict(c) for kind, c in self.decisions.items()},
+        }
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from src.metrics.registry import hls_cache_requests_total
+
+log = logging.getLogger(__name__)
+
+_EXPIRE_PATH = re.compile(r"/expire/(\d+)")
+
+
+def url_expiry(url: str) -> Optional[float]:
+    # googlevideo manifest URLs carry expiry either as a path segment or a query param
+    parsed = urlparse(url)
+    m = _EXPIRE_PATH.search(parsed.path)
+    if m:
+        return float(m.group(1))
+    values = parse_qs(parsed.query).get("expire")
+    if values and values[0].isdigit():
+        return float(values[0])
+    return None
+
+
+@dataclass
+class CachedUrl:
+    url: str
+    resolved_at: float
+    expires_at: float
+
+
+class HlsUrlCache:
+    def __init__(self, resolver: Callable[[str, str], Awaitable[str]], refresh_margin_sec: float = 300, default_ttl_sec: float = 3600, min_validity_sec: float = 30):
+        self._resolver = resolver
+        self.refresh_margin = refresh_margin_sec
+        self.default_ttl = default_ttl_sec
+        self.min_validity = min_validity_sec
+        self._entries: Dict[Tuple[str, str], CachedUrl] = {}
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._refresh_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    def peek(self, video_id: str, quality: str) -> Optional[CachedUrl]:
+        entry = self._entries.get((video_id, quality))
+        if entry and entry.expires_at - time.time() > self.min_validity:
+            return entry
+        return None
+
+    async def get(self, video_id: str, quality: str) -> str:
+        entry = self.peek(video_id, quality)
+        if entry:
+            hls_cache_requests_total.labels(result="hit").inc()
+            return entry.url
+        hls_cache_requests_total.labels(result="miss").inc()
+        return (await self._resolve((video_id, quality))).url
+
+    async def _resolve(self, key: Tuple[str, str]) -> CachedUrl:
+        # concurrent misses for the same key share one extraction
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = asyncio.ensure_future(self._do_resolve(key))
+            self._inflight[key] = fut
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(fut)
+
+    async def _do_resolve(self, key: Tuple[str, str]) -> CachedUrl:
+        url = await self._resolver(*key)
+        now = time.time()
+        entry = CachedUrl(url=url, resolved_at=now, expires_at=url_expiry(url) or now + self.default_ttl)
+        self._entries[key] = entry
+        self._schedule_refresh(key, entry)
+        return entry
+
+    def _schedule_refresh(self, key: Tuple[str, str], entry: CachedUrl):
+        task = self._refresh_tasks.get(key)
+        if task:
+            task.cancel()
+        self._refresh_tasks[key] = asyncio.create_task(self._refresh_later(key, entry.expires_at - self.refresh_margin))
+
+    async def _refresh_later(self, key: Tuple[str, str], at: float):
+        await asyncio.sleep(max(0.0, at - time.time()))
+        self._refresh_tasks.pop(key, None)
+        try:
+            await self._resolve(key)
+            hls_cache_requests_total.labels(result="refresh").inc()
+        except Exception as e:
+            log.warning("Background HLS refresh failed for %s: %s", key, e)
+            if key in self._entries:
+                self._refresh_tasks[key] = asyncio.create_task(self._refresh_later(key, time.time() + 30))
+
+    def seed(self, video_id: str, quality: str, url: str):
+        # a URL resolved by a previous instance; refreshed and expired like any other entry
+        now = time.time()
+        entry = CachedUrl(url=url, resolved_at=now, expires_at=url_expiry(url) or now + self.default_ttl)
+        if entry.expires_at - now > self.min_validity:
+            self._entries[(video_id, quality)] = entry
+            self._schedule_refresh((video_id, quality), entry)
+
+    def invalidate(self, video_id: str, quality: Optional[str] = None):
+        for key in [k for k in self._entries if k[0] == video_id and (quality is None or k[1] == quality)]:
+            self._entries.pop(key, None)
+            hls_cache_requests_total.labels(result="invalidate").inc()
+
+    def release(self, video_id: str):
+        self.invalidate(video_id)
+        for key in [k for k in self._refresh_tasks if k[0] == video_id]:
+            self._refresh_tasks.pop(key).cancel()
+        for key in [k for k in self._inflight if k[0] == video_id]:
+            self._inflight.pop(key).cancel()
@@ -0,0 +1,308 @@
+import asyncio
+import logging
+import pathlib
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import httpx
+
+from .ffmpeg_runner import IngestProgress
+from .segment_tracker import segment_list_name
+from src.metrics.registry import native_segments_fetched_total, native_segments_lost_total
+
+log = logging.getLogger(__name__)
+
+# Exit codes mirror what the supervisor expects from an ffmpeg process
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_UNSUPPORTED = 2
+LIVE_EDGE_SEGMENTS = 3
+
+
+class PlaylistUnsupported(Exception):
+    pass
+
+
+@dataclass
+class MediaPlaylist:
+    target_duration: float
+    media_sequence: int
+    segments: List[Tuple[int, float, str]] = field(default_factory=list)
+    ended: bool = False
+
+
+def parse_master(text: str, base_url: str) -> List[Tuple[int, str]]:
+    variants: List[Tuple[int, str]] = []
+    bandwidth = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            bandwidth = 0
+            for attr in line.split(":", 1)[1].split(","):
+                if attr.startswith("BANDWIDTH="):
+                    bandwidth = int(attr.split("=", 1)[1])
+        elif line and not line.startswith("#") and bandwidth is not None:
+            variants.append((bandwidth, urljoin(base_url, line)))
+            bandwidth = None
+    return variants
+
+
+def parse_media(text: str, base_url: str) -> MediaPlaylist:
+    pl = MediaPlaylist(target_duration=2.0, media_sequence=0)
+    duration = None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            pl.target_duration = float(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            pl.media_sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",", 1)[0])
+        elif line.startswith("#EXT-X-ENDLIST"):
+            pl.ended = True
+        elif line.startswith("#EXT-X-MAP") or (line.startswith("#EXT-X-KEY") and "METHOD=NONE" not in line):
+            # fMP4 init sections and encrypted segments are left to ffmpeg
+            raise PlaylistUnsupported(line.split(":", 1)[0])
+        elif line and not line.startswith("#"):
+            pl.segments.append((pl.media_sequence + len(pl.segments), duration or pl.target_duration, urljoin(base_url, line)))
+            duration = None
+    return pl
+
+
+# Process-like handle (wait/terminate/returncode) so the supervisor treats it like ffmpeg
+class HlsSession:
+    def __init__(
+        self,
+        runner: "HlsDownloader",
+        url: str,
+        out_dir: str,
+        segment_time: int,
+        headers: Optional[Dict[str, str]],
+        progress: Optional[IngestProgress] = None,
+        on_progress: Optional[Callable[[IngestProgress], None]] = None,
+        start_number: int = 0,
+        predecessor: Optional["HlsSession"] = None,
+    ):
+        self.runner = runner
+        self.url = url
+        self.out_dir = pathlib.Path(out_dir)
+        self.segment_time = segment_time
+        self.headers = headers or {}
+        self.pid = None
+        self.stderr = None
+        self.returncode: Optional[int] = None
+        self.forbidden = False
+        self.progress = progress or IngestProgress()
+        self._on_progress = on_progress
+        self.start_number = start_number
+        self.last_sequence: Optional[int] = None
+        # make-before-break: the predecessor keeps writing until this session claims a sequence
+        self.predecessor = predecessor
+        self.stop_before: Optional[int] = None
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def wait(self) -> int:
+        try:
+            await asyncio.shield(self._task)
+        except asyncio.CancelledError:
+            if not self._task.done():
+                raise
+        return self.returncode if self.returncode is not None else EXIT_ERROR
+
+    def terminate(self):
+        self._stopping = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    kill = terminate
+
+    async def _get(self, url: str, fatal=(403, 404, 410)) -> httpx.Response:
+        last: Optional[Exception] = None
+        for attempt in range(self.runner.retries + 1):
+            try:
+                r = await self.runner.http.get(url, headers=self.headers)
+            except httpx.HTTPError as e:
+                last = e
+            else:
+                if r.status_code < 400:
+                    return r
+                last = httpx.HTTPStatusError(f"HTTP {r.status_code} for {url}", request=r.request, response=r)
+                if r.status_code in fatal:
+                    # signed googlevideo URLs answer 403 once expired; the supervisor must re-resolve
+                    self.forbidden = True
+                    raise last
+                if r.status_code == 404:
+                    raise last
+            await asyncio.sleep(min(0.5 * 2 ** attempt, 4))
+        raise last or RuntimeError(f"giving up on {url}")
+
+    async def _media_url(self) -> str:
+        r = await self._get(self.url)
+        if "#EXT-X-STREAM-INF" not in r.text:
+            return self.url
+        variants = parse_master(r.text, str(r.url))
+        if not variants:
+            raise PlaylistUnsupported("empty master playlist")
+        return max(variants)[1]
+
+    async def _fetch_segment(self, seq: int, uri: str) -> Tuple[Optional[bytes], float]:
+        # the data and how long it took, waiting for a fetch slot included
+        started = time.monotonic()
+        async with self.runner.fetch_slots:
+            try:
+                data = (await self._get(uri, fatal=(403,))).content
+                native_segments_fetched_total.inc()
+                return data, time.monotonic() - started
+            except httpx.HTTPError as e:
+                if self.forbidden:
+                    raise
+                log.warning("Segment %d dropped after retries: %s", seq, e)
+                native_segments_lost_total.inc()
+                return None, time.monotonic() - started
+
+    def _report(self, written: int, media_sec: float, started: float):
+        # same fields ffmpeg -progress reports, so the supervisor treats both engines alike
+        wall = max(time.monotonic() - started, 1e-3)
+        self.progress.update({
+            "total_size": str(written),
+            "out_time_us": str(int(media_sec * 1_000_000)),
+            "bitrate": f"{written * 8 / max(media_sec, 1e-3) / 1000:.1f}kbits/s",
+            "speed": f"{media_sec / wall:.3f}x",
+        })
+        if self._on_progress:
+            self._on_progress(self.progress)
+
+    def _claim(self, seq: int) -> bool:
+        # no await between check and claim, so the two sessions never both write a sequence
+        if self.stop_before is not None and seq >= self.stop_before:
+            self._stopping = True
+            return False
+        pred = self.predecessor
+        if pred is not None and pred.returncode is None:
+            if pred.last_sequence is not None and seq <= pred.last_sequence:
+                return False
+            pred.stop_before = seq
+        self.predecessor = None
+        return True
+
+    def _close_part(self, part, start: float, end: float):
+        part.close()
+        # same CSV as ffmpeg -segment_list so segment tracking works without inotify
+        with (self.out_dir / segment_list_name(self.start_number)).open("a", encoding="utf-8") as f:
+            f.write(f"{pathlib.Path(part.name).name},{start:.6f},{end:.6f}\n")
+
+    async def _run(self):
+        part = None
+        part_index = self.start_number
+        part_duration = 0.0
+        elapsed = 0.0
+        written = 0
+        started = time.monotonic()
+        try:
+            media_url = await self._media_url()
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            while not self._stopping:
+                r = await self._get(media_url)
+                pl = parse_media(r.text, str(r.url))
+                pending = [s for s in pl.segments if self.last_sequence is None or s[0] > self.last_sequence]
+                pred = self.predecessor
+                if self.last_sequence is None and pred is not None and pred.last_sequence is not None:
+                    # pick up right after what the predecessor already wrote
+                    pending = [s for s in pending if s[0] > pred.last_sequence]
+                elif self.last_sequence is None:
+                    pending = pending[-LIVE_EDGE_SEGMENTS:]
+                elif pending and pending[0][0] > self.last_sequence + 1:
+                    lost = pending[0][0] - self.last_sequence - 1
+                    log.warning("Fell behind live window on %s: %d segments lost", self.out_dir, lost)
+                    native_segments_lost_total.inc(lost)
+                fetched = await asyncio.gather(*(self._fetch_segment(seq, uri) for seq, _, uri in pending))
+                for (seq, duration, _), (data, fetch_sec) in zip(pending, fetched):
+                    if not self._claim(seq):
+                        if self._stopping:
+                            break
+                        continue
+                    self.last_sequence = seq
+                    if data is None:
+                        continue
+                    if part is None:
+                        part = (self.out_dir / f"part_{part_index:03d}.ts").open("ab")
+                    wrote = time.monotonic()
+                    await asyncio.to_thread(part.write, data)
+                    self.progress.note_segment(duration, fetch_sec + time.monotonic() - wrote)
+                    part_duration += duration
+                    written += len(data)
+                    self._report(written, elapsed + part_duration, started)
+                    if part_duration >= self.segment_time:
+                        self._close_part(part, elapsed, elapsed + part_duration)
+                        elapsed += part_duration
+                        part, part_index, part_duration = None, part_index + 1, 0.0
+                if pl.ended:
+                    break
+                # reload at half the target duration when nothing new arrived, per RFC 8216 6.3.4
+                await asyncio.sleep(pl.target_duration if pending else pl.target_duration / 2)
+            self.returncode = EXIT_OK
+        except asyncio.CancelledError:
+            self.returncode = EXIT_OK
+        except PlaylistUnsupported as e:
+            log.info("Native HLS engine cannot handle %s (%s)", self.url, e)
+            self.returncode = EXIT_UNSUPPORTED
+        except Exception as e:
+            log.warning("Native HLS ingest failed for %s: %s", self.out_dir, e)
+            self.returncode = EXIT_ERROR
+        finally:
+            if part is not None:
+                self._close_part(part, elapsed, elapsed + part_duration)
+
+
+class HlsDownloader:
+    def __init__(self, fetch_concurrency: int = 64, max_connections: int = 200, retries: int = 3):
+        self.retries = retries
+        self._fetch_concurrency = fetch_concurrency
+        self._max_connections = max_connections
+        self._http: Optional[httpx.AsyncClient] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(10, connect=5),
+                follow_redirects=True,
+                limits=httpx.Limits(max_connections=self._max_connections, max_keepalive_connections=self._max_connections),
+            )
+        return self._http
+
+    @property
+    def fetch_slots(self) -> asyncio.Semaphore:
+        # shared across sessions: bounds concurrent segment downloads for the whole host
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._fetch_concurrency)
+        return self._slots
+
+    async def record(
+        self,
+        hls_url: str,
+        out_dir: str,
+        segment_time: int = 300,
+        headers: Optional[Dict[str, str]] = None,
+        progress: Optional[IngestProgress] = None,
+        on_progress: Optional[Callable[[IngestProgress], None]] = None,
+        start_number: int = 0,
+        predecessor: Optional[HlsSession] = None,
+    ) -> HlsSession:
+        if not isinstance(predecessor, HlsSession):
+            predecessor = None
+        session = HlsSession(self, hls_url, out_dir, segment_time, headers, progress, on_progress, start_number, predecessor)
+        log.info("Starting native HLS ingest into %s", out_dir)
+        session.start()
+        return session
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
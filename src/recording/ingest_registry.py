@@ -0,0 +1,68 @@
+import json
+import logging
+import os
+import pathlib
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+REGISTRY_DIR = "ingests"
+_ENTRY_NAME = re.compile(r"^(.+)\.(\d+)\.json$")
+
+
+@dataclass
+class IngestEntry:
+    channel_id: str
+    video_id: str
+    out_dir: str
+    quality: str
+    first_part: int
+    # set for detached ffmpeg runs only; in-process ingests end with the service
+    pid: Optional[int] = None
+    hls_url: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+
+
+# One JSON file per ingest run under RECORDING_ROOT/.state/ingests, written when the run
+# starts and removed when it ends or its session stops. Whatever is left at startup was
+# live when the previous instance went away.
+class IngestRegistry:
+    def __init__(self, state_dir: pathlib.Path):
+        self.dir = pathlib.Path(state_dir) / REGISTRY_DIR
+
+    def _path(self, channel_id: str, first_part: int) -> pathlib.Path:
+        return self.dir / f"{channel_id}.{first_part:06d}.json"
+
+    def save(self, entry: IngestEntry):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(entry.channel_id, entry.first_part)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(asdict(entry)), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def remove(self, channel_id: str, first_part: int):
+        self._path(channel_id, first_part).unlink(missing_ok=True)
+
+    def remove_channel(self, channel_id: str):
+        for path in self.dir.glob("*.json"):
+            m = _ENTRY_NAME.match(path.name)
+            if m and m.group(1) == channel_id:
+                path.unlink(missing_ok=True)
+
+    def load(self) -> Dict[str, List[IngestEntry]]:
+        # channel -> its entries, oldest run first
+        entries: Dict[str, List[IngestEntry]] = {}
+        for path in self.dir.glob("*.json"):
+            try:
+                entry = IngestEntry(**json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError, TypeError) as e:
+                log.warning("Dropping unreadable ingest registry entry %s: %s", path.name, e)
+                path.unlink(missing_ok=True)
+                continue
+            entries.setdefault(entry.channel_id, []).append(entry)
+        for runs in entries.values():
+            runs.sort(key=lambda e: e.first_part)
+        return entries
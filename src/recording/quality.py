@@ -0,0 +1,162 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .ffmpeg_runner import IngestProgress
+from .governor import QUALITY_KBPS, Governor
+from src.config.settings import settings
+
+log = logging.getLogger(__name__)
+
+# segment duration / time to fetch and write it (native engine); below DOWN the session
+# has too little slack to ride out a slow patch, above UP a higher variant would still fit
+DOWN_HEADROOM = 1.5
+UP_HEADROOM = 3.0
+# ffmpeg reports speed relative to realtime; a live ingest that keeps up sits at ~1.0
+SLOW_SPEED = 0.9
+GOOD_SPEED = 0.98
+# congestion must last this long before stepping down, and headroom before stepping up
+DOWN_AFTER_SEC = 30
+UP_AFTER_SEC = 300
+UP_HOLD_MAX_SEC = 3600
+# a new ingest needs a moment before its measurements mean anything
+SETTLE_SEC = 30
+# an upgrade followed this soon by a downgrade failed; the next try waits twice as long
+PROBE_FAIL_SEC = 600
+# upgrades must leave this share of the host bandwidth budget free
+HOST_UP_ROOM = 0.9
+# with VIDEO_QUALITY=best the step below "best" is 1080p, the top of most YouTube lives
+BEST_FALLBACK = "1080p"
+
+
+def direction(old: Optional[str], new: str) -> str:
+    # "best" and other names outside the table rank above every fixed rung
+    rank = lambda q: QUALITY_KBPS.get(q, float("inf"))
+    return "up" if rank(new) > rank(old) else "down"
+
+
+@dataclass
+class _Track:
+    quality: str
+    switched_at: float
+    bad_since: Optional[float] = None
+    good_since: Optional[float] = None
+    up_hold: float = UP_AFTER_SEC
+    upgraded_at: Optional[float] = None
+
+
+# Picks the HLS variant each session should record at. Sessions step down one rung when
+# they cannot keep up (low headroom or speed, sustained for DOWN_AFTER_SEC), when the host
+# is over its bandwidth budget (lowest priority, then most expensive session first), or
+# when VIDEO_QUALITY is lowered. They step back up one rung after UP_AFTER_SEC of ample
+# headroom, if the host budget has room; each failed upgrade doubles that wait.
+class QualityController:
+    def __init__(self, governor: Governor):
+        self.governor = governor
+        self._tracks: Dict[str, _Track] = {}
+
+    def ladder(self) -> List[str]:
+        # VIDEO_QUALITY, then the lower rungs down to GOVERNOR_MIN_QUALITY
+        ceiling = settings.video_quality
+        names = list(QUALITY_KBPS)
+        floor = names.index(settings.governor_min_quality) if settings.governor_min_quality in QUALITY_KBPS else len(names) - 1
+        if ceiling in QUALITY_KBPS:
+            return names[names.index(ceiling):max(floor, names.index(ceiling)) + 1]
+        return [ceiling] + names[names.index(BEST_FALLBACK):floor + 1]
+
+    def _track(self, channel_id: str, quality: str, now: float) -> _Track:
+        track = self._tracks.get(channel_id)
+        if track is None or track.quality != quality:
+            track = self._tracks[channel_id] = _Track(quality, now, up_hold=track.up_hold if track else UP_AFTER_SEC)
+        return track
+
+    def forget(self, channel_id: str):
+        self._tracks.pop(channel_id, None)
+
+    def _host_over(self) -> bool:
+        budget = self.governor.bandwidth_kbps
+        return bool(budget) and self.governor.bandwidth_used() > budget
+
+    def _host_victim(self, ladder: List[str]) -> Optional[str]:
+        # the session that gives way when the host is over budget
+        candidates = [(self.governor.priority(c), -g.kbps, c) for c, g in self.governor.ingests().items() if g.quality in ladder[:-1]]
+        return min(candidates)[2] if candidates else None
+
+    def _host_room(self, current: str, target: str) -> bool:
+        budget = self.governor.bandwidth_kbps
+        if not budget:
+            return True
+        extra = self.governor.estimate(target) - self.governor.estimate(current)
+        return self.governor.bandwidth_used() + extra <= budget * HOST_UP_ROOM
+
+    def _lower(self, ladder: List[str], quality: str, progress: Optional[IngestProgress]) -> Optional[str]:
+        if quality not in ladder:
+            return None
+        i = ladder.index(quality)
+        if i + 1 >= len(ladder):
+            return None
+        if quality not in QUALITY_KBPS and progress is not None and progress.bitrate_kbps:
+            # "best" is some unknown rendition; skip the rungs it probably already is
+            for rung in ladder[i + 1:]:
+                if QUALITY_KBPS[rung] < progress.bitrate_kbps * 0.9:
+                    return rung
+            return ladder[-1]
+        return ladder[i + 1]
+
+    def evaluate(self, channel_id: str, quality: str, progress: IngestProgress, now: Optional[float] = None) -> Optional[Tuple[str, str]]:
+        # (new quality, reason) when the session should switch variant, else None
+        now = time.monotonic() if now is None else now
+        track = self._track(channel_id, quality, now)
+        if now - track.switched_at < SETTLE_SEC:
+            return None
+        ladder = self.ladder()
+        if quality not in ladder:
+            # VIDEO_QUALITY or GOVERNOR_MIN_QUALITY changed under the session
+            if quality in QUALITY_KBPS and ladder[-1] in QUALITY_KBPS and QUALITY_KBPS[quality] < QUALITY_KBPS[ladder[-1]]:
+                return ladder[-1], "floor"
+            return ladder[0], "ceiling"
+        if progress.headroom is not None:
+            bad, good = progress.headroom < DOWN_HEADROOM, progress.headroom >= UP_HEADROOM
+        else:
+            speed = progress.speed if progress.speed is not None else 1.0
+            bad, good = speed < SLOW_SPEED, speed >= GOOD_SPEED
+        track.bad_since = (track.bad_since or now) if bad else None
+        track.good_since = (track.good_since or now) if good else None
+        lower = self._lower(ladder, quality, progress)
+        if lower and self._host_over() and self._host_victim(ladder) == channel_id:
+            return lower, "host"
+        if lower and track.bad_since is not None and now - track.bad_since >= DOWN_AFTER_SEC:
+            return lower, "congestion"
+        i = ladder.index(quality)
+        if i > 0 and track.good_since is not None and now - track.good_since >= track.up_hold and self._host_room(quality, ladder[i - 1]):
+            return ladder[i - 1], "headroom"
+        return None
+
+    def on_exit(self, channel_id: str, quality: str, progress: Optional[IngestProgress]) -> Optional[str]:
+        # an ingest that died while it was struggling restarts one rung lower
+        track = self._tracks.get(channel_id)
+        if track is None or track.quality != quality or track.bad_since is None:
+            return None
+        return self._lower(self.ladder(), quality, progress)
+
+    def switched(self, channel_id: str, old: Optional[str], new: str, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        track = self._tracks.get(channel_id)
+        up_hold = track.up_hold if track else UP_AFTER_SEC
+        ladder = self.ladder()
+        upgrade = new in ladder and old in ladder and ladder.index(new) < ladder.index(old)
+        if track is not None and not upgrade:
+            if track.upgraded_at is not None and now - track.upgraded_at < PROBE_FAIL_SEC:
+                up_hold = min(up_hold * 2, UP_HOLD_MAX_SEC)
+            elif track.upgraded_at is not None:
+                up_hold = max(UP_AFTER_SEC, up_hold / 2)
+        self._tracks[channel_id] = _Track(new, now, up_hold=up_hold, upgraded_at=now if upgrade else None)
+
+    def switch_failed(self, channel_id: str):
+        # the new variant could not be started; hold off as after a failed upgrade
+        track = self._tracks.get(channel_id)
+        if track is not None:
+            track.switched_at = time.monotonic()
+            track.bad_since = track.good_since = None
+            track.up_hold = min(track.up_hold * 2, UP_HOLD_MAX_SEC)
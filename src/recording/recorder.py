@@ -1,21 +1,56 @@
 import asyncio
+import dataclasses
+import logging
+import os
 import pathlib
-from typing import Optional, Dict, Any, List
+import re
+import shutil
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
-from .ffmpeg_runner import FFmpegRunner
+from .chat_capture import ChatCapture, pytchat
+from .governor import Governor, Grant
+from .ffmpeg_runner import FFmpegRunner, IngestProgress, DetachedProcess, adopt_detached
+from .hls_cache import HlsUrlCache, url_expiry
+from .hls_downloader import HlsDownloader, EXIT_UNSUPPORTED
+from .ingest_registry import IngestEntry, IngestRegistry
+from .quality import QualityController, direction
+from .segment_tracker import SegmentTracker, SegmentEvent, SEGMENT_NAME, next_part_number
 from src.config.settings import settings
+from src.storage.catalog import Catalog
+from src.storage.journal import SegmentRecord
 from src.storage.manifest import ManifestWriter
+from src.storage.seek_index import append_index, index_segment
+from src.storage import ts_verify
+from src.storage.ts_probe import SegmentProbe, probe_segment, trim_head
+from src.youtube import extractor_pool
+from src.metrics.registry import (
+    recording_restart_gap_seconds,
+    recording_restarts_total,
+    recording_segments_total,
+    recording_bytes_total,
+    recording_stalls_total,
+    recording_handoffs_total,
+    quality_switches_total,
+    ingest_shared_segments_total,
+    hls_resolve_seconds,
+    ingest_spawn_seconds,
+    ingest_first_segment_seconds,
+    ingest_bitrate_kbps,
+    ingest_speed,
+    ingest_output_bytes,
+    ingest_out_time_seconds,
+    ingest_headroom,
+)
+
+log = logging.getLogger(__name__)
 
 try:
     import yt_dlp
 except Exception:
     yt_dlp = None
 
-try:
-    import pytchat
-except Exception:
-    pytchat = None
-
 QUALITY_HEIGHTS = {
     "2160p": 2160,
     "1440p": 1440,
@@ -27,6 +62,10 @@ QUALITY_HEIGHTS = {
     "144p": 144,
 }
 
+STOP_TIMEOUT_SEC = 15
+
+HTTP_FORBIDDEN = re.compile(r"\b(403 Forbidden|404 Not Found|HTTP error 40[34])\b")
+
 YOUTUBE_HEADERS = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118.0 Safari/537.36",
     "Accept": "*/*",
@@ -35,152 +74,697 @@ YOUTUBE_HEADERS = {
     "Referer": "https://www.youtube.com/",
 }
 
+@dataclass
+class _Ingest:
+    # one ingest run (ffmpeg process or native session) and the state tied to it
+    proc: Any
+    tracker: SegmentTracker
+    progress: IngestProgress
+    first_part: int
+    expires_at: Optional[float] = None
+    segments: int = 0
+    last_pts: Optional[int] = None
+    trim_after_pts: Optional[int] = None
+    pending: Optional[asyncio.Future] = None
+    tasks: List[asyncio.Task] = field(default_factory=list)
+    # monotonic start, for the time-to-first-segment histogram; None for adopted runs
+    launched_at: Optional[float] = None
+    engine: str = "ffmpeg"
+    # HLS variant this run records
+    quality: Optional[str] = None
+
+
+@dataclass
+class _Share:
+    # a session fed by another channel's ingest of the same live video
+    owner: str
+    next_part: int
+    last_pts: Optional[int] = None
+
+
+def _terminate_spawned(spawn: asyncio.Future):
+    # an ingest whose launch was cancelled: stop it as soon as it exists
+    if not spawn.cancelled() and spawn.exception() is None:
+        spawn.result().terminate()
+
+
+def _link_or_copy(src: pathlib.Path, dst: pathlib.Path) -> str:
+    # a hardlink costs no space; filesystems without them get a copy
+    try:
+        os.link(src, dst)
+        return "link"
+    except FileExistsError:
+        raise
+    except OSError:
+        shutil.copy2(src, dst)
+        return "copy"
+
+
 class Recorder:
-    def __init__(self, ffmpeg: FFmpegRunner, root: str):
+    def __init__(self, ffmpeg: Union[FFmpegRunner, HlsDownloader], root: str, catalog: Optional[Catalog] = None, postprocess=None, governor: Optional[Governor] = None):
         self.ffmpeg = ffmpeg
+        self.catalog = catalog
+        # RemuxPipeline (or None); closed sessions are handed to it
+        self.postprocess = postprocess
+        # admission for ingests, resolves and chat threads; unlimited unless configured
+        self.governor = governor or Governor()
+        # moves sessions between HLS variants as their throughput and the host budget allow
+        self.quality = QualityController(self.governor)
+        # channel -> (quality, reason) of a variant switch the watchdog asked for
+        self._switch_to: Dict[str, Tuple[str, str]] = {}
+        # channel -> the share it records from, for channels live with a video another
+        # channel's ingest already records (collabs, simulcasts)
+        self._shared: Dict[str, _Share] = {}
+        # the native engine hands playlists it cannot handle (fMP4, encrypted) to ffmpeg
+        self.fallback = FFmpegRunner(copyts=settings.restart_overlap, detach=settings.detach_ingests)
         self.root = pathlib.Path(root)
+        self.registry = IngestRegistry(self.root / ".state")
         self.processes: Dict[str, asyncio.subprocess.Process] = {}
-        self.chat_tasks: Dict[str, asyncio.Task] = {}
+        self.chats: Dict[str, ChatCapture] = {}
+        self._chat_tasks: Dict[str, asyncio.Task] = {}
+        # quality each open session records at; the governor may lower it at admission
+        self._quality: Dict[str, str] = {}
         self._manifest_writers: Dict[str, ManifestWriter] = {}
         self._channel_states: Dict[str, str] = {}
+        self._fallback_videos: Set[str] = set()
+        self._supervisors: Dict[str, asyncio.Task] = {}
+        self._progress: Dict[str, IngestProgress] = {}
+        self.hls_cache = HlsUrlCache(
+            self._resolve_hls_url,
+            refresh_margin_sec=settings.hls_refresh_margin_sec,
+            default_ttl_sec=settings.hls_default_ttl_sec,
+        )
 
     async def start(self, channel_id: str, video_id: str):
         if channel_id in self.processes:
             return
+        owner = self._ingest_owner(video_id) if settings.share_ingests else None
+        if owner is not None:
+            out_dir = self._open_session(channel_id, video_id, self._quality.get(owner), chat=False)
+            self._shared[channel_id] = _Share(owner, next_part_number(str(out_dir)))
+            self._channel_states[channel_id] = 'shared'
+            log.info("%s is live with %s, already recorded for %s; sharing that ingest", channel_id, video_id, owner)
+            return
+        out_dir = self._open_session(channel_id, video_id)
+        self._supervisors[channel_id] = asyncio.create_task(self._supervise_recording(channel_id, video_id, str(out_dir)))
+        await asyncio.sleep(0)
+
+    def _open_session(self, channel_id: str, video_id: str, quality: Optional[str] = None, chat: bool = True) -> pathlib.Path:
         out_dir = self.root / channel_id / video_id
         out_dir.mkdir(parents=True, exist_ok=True)
         manifest_path = out_dir / "manifest.json"
-        writer = ManifestWriter(manifest_path)
-        writer.start(channel_id, video_id, settings.video_quality)
+        writer = ManifestWriter(manifest_path, settings.manifest_compact_sec)
+        self._quality[channel_id] = quality or settings.video_quality
+        writer.start(channel_id, video_id, self._quality[channel_id])
         self._manifest_writers[channel_id] = writer
+        if self.catalog:
+            self.catalog.session_started(channel_id, video_id, str(out_dir), writer.manifest.started_at)
         self._channel_states[channel_id] = 'recording'
-        task = asyncio.create_task(self._supervise_recording(channel_id, video_id, str(out_dir)))
         self.processes[channel_id] = None
-        if pytchat:
-            chat_task = asyncio.create_task(self._capture_chat(video_id, out_dir / "chat.txt"))
-            self.chat_tasks[channel_id] = chat_task
-        await asyncio.sleep(0)
+        if chat:
+            self._start_chat(channel_id, video_id, out_dir)
+        return out_dir
+
+    def _start_chat(self, channel_id: str, video_id: str, out_dir: pathlib.Path):
+        if pytchat and settings.chat_enabled:
+            chat = ChatCapture(channel_id, video_id, out_dir, settings.chat_compress, settings.chat_queue_size, settings.chat_flush_sec)
+            self.chats[channel_id] = chat
+            self._chat_tasks[channel_id] = asyncio.create_task(self._run_chat(chat))
+
+    def _ingest_owner(self, video_id: str) -> Optional[str]:
+        # the channel whose ingest is recording this video, if any
+        return next((c for c, v in self.sessions().items() if v == video_id and c in self.processes and c not in self._shared), None)
+
+    def _video_in_use(self, video_id: str, besides: str) -> bool:
+        # another active session (an heir or a sharer) records this video
+        return any(v == video_id and c != besides and c in self.processes for c, v in self.sessions().items())
+
+    def _sharers(self, owner: str) -> List[str]:
+        return [c for c, share in self._shared.items() if share.owner == owner]
+
+    def _hand_over(self, owner: str):
+        # The owner has stopped and its last part went to every sharer; the first of them
+        # records on from its own directory and the rest follow it. The new ingest starts
+        # at the live edge, a few segments back, and trims what the owner already wrote.
+        sharers = self._sharers(owner)
+        if not sharers:
+            return
+        video_id = self._manifest_writers[sharers[0]].manifest.video_id
+        running = self._ingest_owner(video_id)
+        if running is not None:
+            # another channel started its own ingest of the video meanwhile
+            for channel_id in sharers:
+                self._shared[channel_id].owner = running
+            return
+        heir = sharers[0]
+        share = self._shared.pop(heir)
+        for channel_id in sharers[1:]:
+            self._shared[channel_id].owner = heir
+        out_dir = self._manifest_writers[heir].path.parent
+        self._quality[heir] = self._quality.get(owner, settings.video_quality)
+        self._channel_states[heir] = 'recording'
+        self._start_chat(heir, video_id, out_dir)
+        self._supervisors[heir] = asyncio.create_task(self._supervise_recording(heir, video_id, str(out_dir), last_pts=share.last_pts))
+        log.info("%s stopped; %s takes over the ingest of %s for %d channel(s)", owner, heir, video_id, len(sharers))
+
+    async def _run_chat(self, chat: ChatCapture):
+        # holds a chat slot for the whole session; stop() cancels it once the chat has stopped
+        async with self.governor.slot("chat", chat.channel_id):
+            chat.start()
+            await asyncio.get_running_loop().create_future()
+
+    async def adopt(self, channels: Optional[Set[str]] = None) -> Dict[str, str]:
+        # Resumes the sessions a previous instance left in the ingest registry and returns
+        # {channel: video}. A detached ffmpeg that is still running is taken over as is;
+        # otherwise the session restarts with the saved manifest URL, without a live check
+        # or a yt-dlp resolve.
+        resumed: Dict[str, str] = {}
+        for channel_id, runs in self.registry.load().items():
+            if (channels is not None and channel_id not in channels) or channel_id in self.processes:
+                continue
+            latest = runs[-1]
+            for stale in runs[:-1]:
+                # an overlapping handoff was interrupted; the newer run carries on
+                proc = adopt_detached(stale.pid, stale.out_dir, stale.first_part) if stale.pid else None
+                if proc is not None:
+                    proc.terminate()
+                self.registry.remove(channel_id, stale.first_part)
+            out_dir = self._open_session(channel_id, latest.video_id, latest.quality)
+            if latest.hls_url:
+                self.hls_cache.seed(latest.video_id, latest.quality, latest.hls_url)
+            proc = adopt_detached(latest.pid, str(out_dir), latest.first_part) if latest.pid else None
+            ingest = None
+            if proc is not None:
+                tracker = SegmentTracker(str(out_dir), settings.segment_events, first_part=latest.first_part)
+                tracker.start()
+                progress = IngestProgress()
+                proc.follow(progress, lambda p, c=channel_id: self._export_progress(c, p), from_end=True)
+                ingest = _Ingest(proc=proc, tracker=tracker, progress=progress, first_part=latest.first_part, expires_at=url_expiry(latest.hls_url or ""), quality=latest.quality)
+            else:
+                self.registry.remove(channel_id, latest.first_part)
+            last_pts = await self._catch_up(channel_id, latest.video_id, out_dir, runs[0].first_part, still_writing=proc is not None)
+            if ingest is not None:
+                ingest.last_pts = last_pts
+                self._start_tracking(channel_id, latest.video_id, ingest)
+            self._supervisors[channel_id] = asyncio.create_task(self._supervise_recording(channel_id, latest.video_id, str(out_dir), adopted=ingest, last_pts=last_pts))
+            resumed[channel_id] = latest.video_id
+            log.info("Resumed %s %s (%s)", channel_id, latest.video_id, f"adopted ffmpeg pid {proc.pid}" if proc else "restarting ingest")
+        return resumed
+
+    async def _catch_up(self, channel_id: str, video_id: str, out_dir: pathlib.Path, first_part: int, still_writing: bool) -> Optional[int]:
+        # journals the parts closed while no instance was watching; returns the last PTS seen
+        numbered = sorted((int(m.group(1)), p) for p, m in ((p, SEGMENT_NAME.match(p.name)) for p in out_dir.glob("part_*.ts")) if m)
+        parts = [p for n, p in numbered if n >= first_part]
+        if still_writing and parts:
+            parts.pop()
+        writer = self._manifest_writers[channel_id]
+        last_pts = None
+        for path in parts:
+            if writer.has_segment(path.name):
+                continue
+            probe = await self._on_segment(channel_id, video_id, SegmentEvent(name=path.name, path=path, size=path.stat().st_size))
+            last_pts = probe.pts_last if probe.pts_last is not None else last_pts
+        return last_pts
+
+    async def release(self):
+        # shutdown with detached ingests: leave them running for the next instance to adopt
+        for chat in list(self.chats.values()):
+            await chat.stop()
+        for task in self._chat_tasks.values():
+            task.cancel()
+        supervisors = list(self._supervisors.values())
+        for task in supervisors:
+            task.cancel()
+        await asyncio.gather(*supervisors, return_exceptions=True)
+        for writer in self._manifest_writers.values():
+            writer.suspend()
+        self._manifest_writers.clear()
 
     async def stop(self, channel_id: str):
-        self.processes.pop(channel_id, None)
+        # an owner with a live ingest hands it on once its last part has been shared
+        owner = self._shared.pop(channel_id, None) is None and channel_id in self.processes
+        proc = self.processes.pop(channel_id, None)
         self._channel_states[channel_id] = 'stopping'
-        task = self.chat_tasks.pop(channel_id, None)
-        if task:
-            task.cancel()
+        chat = self.chats.pop(channel_id, None)
+        if chat:
+            await chat.stop()
+        chat_task = self._chat_tasks.pop(channel_id, None)
+        if chat_task:
+            chat_task.cancel()
+        if proc is not None and proc.returncode is None:
+            proc.terminate()
+        supervisor = self._supervisors.pop(channel_id, None)
+        if supervisor and (proc is None or proc.returncode is not None):
+            # idle in backoff or resolving; nothing left to flush
+            supervisor.cancel()
+        elif supervisor:
+            # let the ingest close its last segment so it reaches the journal before the manifest ends
             try:
-                await task
+                await asyncio.wait_for(asyncio.shield(supervisor), STOP_TIMEOUT_SEC)
+            except asyncio.TimeoutError:
+                supervisor.cancel()
             except Exception:
                 pass
+        if owner:
+            # the ingest keeps running for as long as another channel shares it
+            self._hand_over(channel_id)
+        if chat:
+            await chat.close()
+        self.registry.remove_channel(channel_id)
+        self._quality.pop(channel_id, None)
         writer = self._manifest_writers.pop(channel_id, None)
         if writer:
             writer.end()
+            if self.catalog:
+                self.catalog.session_ended(channel_id, writer.manifest.video_id, writer.manifest.ended_at)
+            if self.postprocess:
+                self.postprocess.submit(channel_id, writer.manifest.video_id, str(writer.path.parent))
         self._channel_states[channel_id] = 'idle'
 
-    async def _supervise_recording(self, channel_id: str, video_id: str, out_dir: str):
+    async def _launch(self, channel_id: str, video_id: str, out_dir: str, runner, hls_url: str, start_number: int, predecessor: Optional["_Ingest"] = None, quality: Optional[str] = None) -> "_Ingest":
+        quality = quality or self._quality.get(channel_id, settings.video_quality)
+        tracker = SegmentTracker(out_dir, settings.segment_events, first_part=start_number)
+        tracker.reset()
+        tracker.start()
+        progress = IngestProgress()
+        engine = "native" if isinstance(runner, HlsDownloader) else "ffmpeg"
+        launched_at = time.monotonic()
+        spawn = asyncio.ensure_future(runner.record(
+            hls_url,
+            out_dir,
+            settings.segment_time_sec,
+            headers=YOUTUBE_HEADERS,
+            progress=progress,
+            on_progress=lambda p, c=channel_id: self._export_progress(c, p),
+            start_number=start_number,
+            predecessor=predecessor.proc if predecessor else None,
+        ))
+        try:
+            # shielded: stop() may cancel the supervisor mid-spawn, and the process being
+            # created must not be left running unreferenced
+            proc = await asyncio.shield(spawn)
+        except asyncio.CancelledError:
+            tracker.close()
+            spawn.add_done_callback(_terminate_spawned)
+            raise
+        except Exception:
+            tracker.close()
+            raise
+        ingest_spawn_seconds.labels(engine=engine).observe(time.monotonic() - launched_at)
+        ingest = _Ingest(proc=proc, tracker=tracker, progress=progress, first_part=start_number, expires_at=url_expiry(hls_url), launched_at=launched_at, engine=engine, quality=quality)
+        self.registry.save(IngestEntry(
+            channel_id=channel_id,
+            video_id=video_id,
+            out_dir=out_dir,
+            quality=quality,
+            first_part=start_number,
+            pid=proc.pid if isinstance(proc, DetachedProcess) else None,
+            hls_url=hls_url,
+        ))
+        self._start_tracking(channel_id, video_id, ingest)
+        return ingest
+
+    def _start_tracking(self, channel_id: str, video_id: str, ingest: "_Ingest"):
+        ingest.tasks = [
+            asyncio.create_task(self._track_segments(channel_id, video_id, ingest)),
+            asyncio.create_task(self._watch_stderr(ingest.proc, channel_id, video_id)),
+        ]
+
+    async def _finish(self, channel_id: str, video_id: str, ingest: "_Ingest"):
+        # the process has exited: stop its helpers and account for the segments it closed last
+        for t in ingest.tasks:
+            t.cancel()
+            try:
+                await t
+            except BaseException:
+                pass
+        if ingest.pending is not None:
+            try:
+                await ingest.pending
+            except Exception as e:
+                log.warning("Segment accounting failed for %s: %s", channel_id, e)
+        for ev in ingest.tracker.drain():
+            await self._ingest_segment(channel_id, video_id, ingest, ev)
+        ingest.tracker.close()
+        self.registry.remove(channel_id, ingest.first_part)
+        if isinstance(ingest.proc, DetachedProcess):
+            ingest.proc.discard_files()
+
+    async def _supervise_recording(self, channel_id: str, video_id: str, out_dir: str, adopted: Optional["_Ingest"] = None, last_pts: Optional[int] = None):
         retries = 0
         backoff = settings.restart_backoff_initial_sec
-        while channel_id in self.processes:
-            try:
-                hls_url = await self.resolve_hls_url(video_id)
-                self._channel_states[channel_id] = 'recording'
-                proc = await self.ffmpeg.record(hls_url, out_dir, settings.segment_time_sec, headers=YOUTUBE_HEADERS)
-                seg_task = asyncio.create_task(self._segment_counter(channel_id, out_dir))
-                code = await proc.wait()
-                seg_task.cancel()
+        loop = asyncio.get_running_loop()
+        exited_at: Optional[float] = None
+        ingest: Optional[_Ingest] = None
+        grant: Optional[Grant] = None
+        try:
+            quality = self._quality.get(channel_id, settings.video_quality)
+            if adopted is not None:
+                grant = self.governor.admit("ingest", channel_id, quality)
+            else:
+                # waits here, with the session open, while the ingest budget is exhausted
+                self._channel_states[channel_id] = 'queued'
+                grant = await self.governor.acquire("ingest", channel_id, quality)
+            if grant.quality != quality:
+                self._quality[channel_id] = grant.quality
+                writer = self._manifest_writers.get(channel_id)
+                if writer and writer.manifest:
+                    writer.manifest.quality = grant.quality
+            while channel_id in self.processes:
                 try:
-                    await seg_task
+                    if adopted is not None:
+                        # already running, left behind by the previous instance
+                        ingest, adopted = adopted, None
+                        runner = self.ffmpeg
+                    else:
+                        hls_url = await self.resolve_hls_url(video_id, self._quality.get(channel_id))
+                        self._channel_states[channel_id] = 'recording'
+                        runner = self.fallback if video_id in self._fallback_videos else self.ffmpeg
+                        ingest = await self._launch(channel_id, video_id, out_dir, runner, hls_url, next_part_number(out_dir))
+                        if settings.restart_overlap or isinstance(runner, HlsDownloader):
+                            # source timestamps are kept, so media the previous run already wrote is cut
+                            ingest.trim_after_pts = last_pts
+                    if channel_id not in self.processes:
+                        # stopped while resolving/spawning
+                        ingest.proc.terminate()
+                        await ingest.proc.wait()
+                        await self._finish(channel_id, video_id, ingest)
+                        break
+                    if exited_at is not None:
+                        recording_restart_gap_seconds.observe(loop.time() - exited_at)
+                        recording_restarts_total.labels(channel=channel_id, video=video_id).inc()
+                    while True:
+                        if channel_id not in self.processes:
+                            ingest.proc.terminate()
+                            break
+                        self.processes[channel_id] = ingest.proc
+                        self._progress[channel_id] = ingest.progress
+                        reason = await self._watchdog(channel_id, ingest)
+                        if reason is None:
+                            break
+                        successor = await self._handoff(channel_id, video_id, out_dir, runner, ingest, reason)
+                        if successor is None:
+                            break
+                        ingest = successor
+                    code = await ingest.proc.wait()
+                    exited_at = loop.time()
+                    if getattr(ingest.proc, "forbidden", False):
+                        self.hls_cache.invalidate(video_id)
+                    await self._finish(channel_id, video_id, ingest)
+                    last_pts = ingest.last_pts if ingest.last_pts is not None else last_pts
+                    if channel_id not in self.processes:
+                        break
+                    if settings.quality_adaptive and ingest.quality:
+                        # an ingest that died while it could not keep up comes back one rung lower
+                        lower = self.quality.on_exit(channel_id, ingest.quality, ingest.progress)
+                        if lower:
+                            self._switched(channel_id, ingest.quality, lower, "congestion")
+                    if code == EXIT_UNSUPPORTED and runner is not self.fallback:
+                        self._fallback_videos.add(video_id)
+                        continue
+                    retries += 1
+                    if retries > settings.restart_max_retries:
+                        break
+                    await asyncio.sleep(min(backoff, settings.restart_backoff_max_sec))
+                    backoff = min(backoff * 2, settings.restart_backoff_max_sec)
                 except Exception:
+                    self._channel_states[channel_id] = 'error'
+                    retries += 1
+                    if retries > settings.restart_max_retries:
+                        break
+                    await asyncio.sleep(min(backoff, settings.restart_backoff_max_sec))
+                    backoff = min(backoff * 2, settings.restart_backoff_max_sec)
+        except asyncio.CancelledError:
+            if ingest is not None:
+                # cancelled with the ingest still running (shutdown/release): stop watching it
+                for t in ingest.tasks:
+                    t.cancel()
+                ingest.tracker.close()
+            raise
+        finally:
+            if grant is not None:
+                self.governor.release(grant)
+            if self._supervisors.get(channel_id) is asyncio.current_task():
+                # gave up without stop(); a newer session for the channel is left untouched
+                self._supervisors.pop(channel_id, None)
+                self.processes.pop(channel_id, None)
+            self._progress.pop(channel_id, None)
+            self._switch_to.pop(channel_id, None)
+            self.quality.forget(channel_id)
+            for gauge in (ingest_bitrate_kbps, ingest_speed, ingest_output_bytes, ingest_out_time_seconds, ingest_headroom):
+                try:
+                    gauge.remove(channel_id)
+                except KeyError:
                     pass
-                if channel_id not in self.processes:
+            if not self._video_in_use(video_id, channel_id):
+                # an heir taking over a shared ingest still resolves and records this video
+                self.hls_cache.release(video_id)
+                self._fallback_videos.discard(video_id)
+            self._channel_states[channel_id] = 'idle'
+
+    async def _watchdog(self, channel_id: str, ingest: "_Ingest") -> Optional[str]:
+        # Returns once the ingest exits (None) or needs replacing ('stall' / 'expiry' /
+        # 'quality', with the target variant in _switch_to).
+        # A hung ingest never exits on its own, so without overlap it is killed here.
+        timeout = settings.stall_timeout_sec
+        proc, progress = ingest.proc, ingest.progress
+        waiter = asyncio.ensure_future(proc.wait())
+        try:
+            while not waiter.done():
+                await asyncio.wait([waiter], timeout=min(5.0, timeout / 2))
+                if waiter.done() or channel_id not in self.processes:
                     break
-                retries += 1
-                if retries > settings.restart_max_retries:
+                stalled = time.monotonic() - progress.last_advance
+                if stalled > timeout:
+                    log.warning("Ingest for %s stalled for %.0fs; restarting", channel_id, stalled)
+                    recording_stalls_total.labels(channel=channel_id).inc()
+                    if settings.restart_overlap:
+                        return "stall"
+                    proc.kill()
                     break
-                await asyncio.sleep(min(backoff, settings.restart_backoff_max_sec))
-                backoff = min(backoff * 2, settings.restart_backoff_max_sec)
-            except Exception:
-                self._channel_states[channel_id] = 'error'
-                retries += 1
-                if retries > settings.restart_max_retries:
-                    break
-                await asyncio.sleep(min(backoff, settings.restart_backoff_max_sec))
-                backoff = min(backoff * 2, settings.restart_backoff_max_sec)
-        self.processes.pop(channel_id, None)
-        self._channel_states[channel_id] = 'idle'
+                if settings.restart_overlap and ingest.expires_at and time.time() > ingest.expires_at - self.hls_cache.refresh_margin / 2:
+                    return "expiry"
+                # switches are make-before-break only: ffmpeg without -copyts rebases its
+                # timestamps, so the overlap of two runs could not be trimmed
+                if settings.quality_adaptive and ingest.quality and (settings.restart_overlap or ingest.engine == "native"):
+                    switch = self.quality.evaluate(channel_id, ingest.quality, progress)
+                    if switch:
+                        self._switch_to[channel_id] = switch
+                        return "quality"
+        finally:
+            waiter.cancel()
+        return None
+
+    async def _handoff(self, channel_id: str, video_id: str, out_dir: str, runner, old: "_Ingest", reason: str) -> Optional["_Ingest"]:
+        # Make-before-break: the replacement starts while the old ingest keeps writing and
+        # takes over once its own output advances. Returns None if the old one should just
+        # run until it exits. A quality switch is the same handoff onto another variant, so
+        # the new quality starts at a part boundary.
+        quality, why = self._switch_to.pop(channel_id, (None, None)) if reason == "quality" else (None, None)
+        if quality is None:
+            old.expires_at = None
+        try:
+            hls_url = await self.resolve_hls_url(video_id, quality or self._quality.get(channel_id))
+            # one spare part number: the old run may still roll over to its next part meanwhile
+            new = await self._launch(channel_id, video_id, out_dir, runner, hls_url, next_part_number(out_dir) + 1, predecessor=old, quality=quality)
+        except Exception as e:
+            log.warning("Handoff for %s failed to start: %s", channel_id, e)
+            if reason == "stall":
+                old.proc.kill()
+            if quality:
+                self.quality.switch_failed(channel_id)
+            return None
+        old.tracker.stop_part = new.first_part
+        deadline = time.monotonic() + settings.stall_timeout_sec
+        while new.progress.out_time_sec <= 0 and new.proc.returncode is None and time.monotonic() < deadline and channel_id in self.processes:
+            await asyncio.sleep(0.5)
+        if new.progress.out_time_sec <= 0 or channel_id not in self.processes:
+            new.proc.terminate()
+            await new.proc.wait()
+            await self._finish(channel_id, video_id, new)
+            old.tracker.stop_part = None
+            if reason == "stall":
+                old.proc.kill()
+            if quality:
+                self.quality.switch_failed(channel_id)
+            recording_handoffs_total.labels(channel=channel_id, reason=reason, result="failed").inc()
+            return None
+        if old.proc.returncode is None:
+            old.proc.terminate()
+        await old.proc.wait()
+        await self._finish(channel_id, video_id, old)
+        if settings.restart_overlap or isinstance(runner, HlsDownloader):
+            new.trim_after_pts = old.last_pts
+        if quality:
+            self._switched(channel_id, old.quality, quality, why)
+        recording_handoffs_total.labels(channel=channel_id, reason=reason, result="ok").inc()
+        log.info("Handed %s over to a new ingest (%s), continuing at part %d", channel_id, reason, new.first_part)
+        return new
+
+    def _switched(self, channel_id: str, old: Optional[str], new: str, reason: str):
+        # the manifest picks the switch up from the quality of the next journaled part
+        self._quality[channel_id] = new
+        self.governor.requalify(channel_id, new)
+        self.quality.switched(channel_id, old, new)
+        quality_switches_total.labels(direction=direction(old, new), reason=reason).inc()
+        log.info("Switched %s from %s to %s (%s)", channel_id, old, new, reason)
+
+    def _export_progress(self, channel_id: str, progress: IngestProgress):
+        if progress.bitrate_kbps is not None:
+            ingest_bitrate_kbps.labels(channel=channel_id).set(progress.bitrate_kbps)
+        if progress.speed is not None:
+            ingest_speed.labels(channel=channel_id).set(progress.speed)
+        ingest_output_bytes.labels(channel=channel_id).set(progress.output_bytes)
+        ingest_out_time_seconds.labels(channel=channel_id).set(progress.out_time_sec)
+        if progress.headroom is not None:
+            ingest_headroom.labels(channel=channel_id).set(progress.headroom)
+
+    def get_progress(self, channel_id: str) -> Optional[IngestProgress]:
+        return self._progress.get(channel_id)
+
+    def ingest_lagging(self) -> bool:
+        # background work yields while any live ingest has gone quiet for longer than usual
+        limit = settings.postprocess_pause_after_sec
+        now = time.monotonic()
+        return any(now - p.last_advance > limit for p in self._progress.values())
+
+    async def _watch_stderr(self, proc: asyncio.subprocess.Process, channel_id: str, video_id: str):
+        if proc.stderr is None:
+            return
+        async for raw in proc.stderr:
+            line = raw.decode(errors="replace").rstrip()
+            if not line:
+                continue
+            log.warning("ffmpeg[%s]: %s", channel_id, line)
+            if HTTP_FORBIDDEN.search(line):
+                # the manifest URL was revoked or expired early; the next restart must re-resolve
+                self.hls_cache.invalidate(video_id)
+
+    async def resolve_hls_url(self, video_id: str, quality: Optional[str] = None) -> str:
+        return await self.hls_cache.get(video_id, quality or settings.video_quality)
 
-    async def resolve_hls_url(self, video_id: str) -> str:
+    async def _resolve_hls_url(self, video_id: str, quality: str) -> str:
         if yt_dlp is None:
             raise RuntimeError("yt-dlp is required to resolve HLS URLs. Please install it.")
         url = f"https://www.youtube.com/watch?v={video_id}"
-
-        def _extract() -> Optional[str]:
-            preferred_height = QUALITY_HEIGHTS.get(settings.video_quality)
-            ydl_opts = {
-                "quiet": True,
-                "no_warnings": True,
-                "skip_download": True,
-                "format": "best",
-                "http_headers": YOUTUBE_HEADERS,
-            }
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if not info:
-                    return None
-                formats: List[Dict[str, Any]] = info.get("formats", []) or []
-                hls_formats = [f for f in formats if f.get("protocol") in ("m3u8", "m3u8_native") and f.get("url")]
-                if not hls_formats:
-                    return info.get("url")
-                selected = None
-                if preferred_height:
-                    hls_formats.sort(key=lambda f: (f.get("height") or 0, f.get("tbr") or 0), reverse=True)
-                    for f in hls_formats:
-                        h = f.get("height") or 0
-                        if h <= preferred_height:
-                            selected = f
-                            break
-                if not selected:
-                    selected = max(hls_formats, key=lambda f: (f.get("height") or 0, f.get("tbr") or 0))
-                return selected.get("url") if selected else None
-
-        hls = await asyncio.to_thread(_extract)
+        channel_id = next((c for c, v in self.sessions().items() if v == video_id), None)
+        started = time.monotonic()
+        try:
+            async with self.governor.slot("resolve", channel_id):
+                # timed from admission, so a queued resolve does not look like a slow one
+                started = time.monotonic()
+                hls = await extractor_pool.extract_hls_url(url, QUALITY_HEIGHTS.get(quality), YOUTUBE_HEADERS)
+        except Exception:
+            hls_resolve_seconds.labels(result="error").observe(time.monotonic() - started)
+            raise
+        hls_resolve_seconds.labels(result="ok" if hls else "error").observe(time.monotonic() - started)
         if not hls:
             raise RuntimeError("Unable to resolve HLS URL from yt-dlp")
         return hls
 
-    async def _capture_chat(self, video_id: str, out_file: pathlib.Path):
-        if not pytchat:
-            return
-        out_file.parent.mkdir(parents=True, exist_ok=True)
-        stop_event = asyncio.Event()
+    async def _track_segments(self, channel_id: str, video_id: str, ingest: "_Ingest"):
+        async for ev in ingest.tracker.events():
+            # shielded so _finish never cancels a segment halfway through the journal/catalog
+            ingest.pending = asyncio.ensure_future(self._ingest_segment(channel_id, video_id, ingest, ev))
+            await asyncio.shield(ingest.pending)
 
-        def _run():
-            try:
-                chat = pytchat.create(video_id=video_id, interruptable=True)
-                with out_file.open("a", encoding="utf-8") as f:
-                    while chat.is_alive():
-                        for c in chat.get().sync_items():
-                            f.write(f"[{c.datetime}] {c.author.name}: {c.message}\n")
-                        if stop_event.is_set():
-                            break
-            except Exception:
+    async def _ingest_segment(self, channel_id: str, video_id: str, ingest: "_Ingest", ev: SegmentEvent):
+        writer = self._manifest_writers.get(channel_id)
+        if writer and writer.has_segment(ev.name):
+            # an adopted run's segment list replays parts the journal already has
+            return
+        if ingest.trim_after_pts is not None and ingest.segments == 0:
+            size = await asyncio.to_thread(trim_head, ev.path, ingest.trim_after_pts)
+            if size is None:
+                # entirely inside the overlap with the previous run
+                ev.path.unlink(missing_ok=True)
                 return
+            # the segment list times no longer match the trimmed file; fall back to PTS
+            ev.size, ev.start, ev.end = size, None, None
+        probe = await self._on_segment(channel_id, video_id, ev, ingest.quality)
+        if ingest.segments == 0 and ingest.launched_at is not None:
+            ingest_first_segment_seconds.labels(engine=ingest.engine).observe(time.monotonic() - ingest.launched_at)
+        ingest.segments += 1
+        if probe.pts_last is not None:
+            ingest.last_pts = probe.pts_last
+
+    async def _on_segment(self, channel_id: str, video_id: str, ev: SegmentEvent, quality: Optional[str] = None) -> SegmentProbe:
+        closed_at = time.time()
+        probe = await asyncio.to_thread(probe_segment, ev.path)
+        duration = ev.end - ev.start if ev.start is not None and ev.end is not None else probe.duration
+        writer = self._manifest_writers.get(channel_id)
+        record = SegmentRecord(
+            index=writer.next_index() if writer else 0,
+            name=ev.name,
+            started_at=closed_at - (duration or 0.0),
+            duration=duration,
+            bytes=probe.size,
+            pts_first=probe.pts_first,
+            pts_last=probe.pts_last,
+            crc32=probe.crc32,
+            quality=quality or self._quality.get(channel_id),
+        )
+        if writer:
+            writer.add_segment(record)
+        self.governor.observe(channel_id, probe.size, duration, record.quality)
+        if self.catalog:
+            self.catalog.segment_added(channel_id, video_id, probe.size)
+        entry = check = None
+        if settings.seek_index:
+            entry = await asyncio.to_thread(index_segment, ev.path)
+        if settings.verify_segments and ts_verify.np is not None:
+            check = await asyncio.to_thread(ts_verify.verify_segment, ev.path)
+            ts_verify.record_metrics(channel_id, check)
+            if writer:
+                writer.add_check(check)
+            if not check.ok:
+                log.warning("Segment %s of %s failed verification: %s", ev.name, channel_id, check)
+        progress = self._progress.get(channel_id)
+        if progress:
+            progress.segment_bytes += probe.size
+        chat = self.chats.get(channel_id)
+        if chat:
+            await chat.rotate(ev.name)
+        recording_segments_total.labels(channel=channel_id, video=video_id).inc()
+        recording_bytes_total.labels(channel=channel_id, video=video_id).inc(probe.size)
+        for sharer in self._sharers(channel_id):
+            await self._share_segment(sharer, video_id, ev.path, record, check, entry)
+        return probe
 
+    async def _share_segment(self, channel_id: str, video_id: str, path: pathlib.Path, record: SegmentRecord, check, entry):
+        # the part, its journal record, check and seek index, under the sharer's own numbering
+        share = self._shared.get(channel_id)
+        writer = self._manifest_writers.get(channel_id)
+        if share is None or writer is None:
+            return
+        name = f"part_{share.next_part:03d}.ts"
         try:
-            await asyncio.to_thread(_run)
-        finally:
-            stop_event.set()
+            method = await asyncio.to_thread(_link_or_copy, path, writer.path.parent / name)
+        except OSError as e:
+            log.warning("Could not share %s of %s with %s: %s", path.name, video_id, channel_id, e)
+            return
+        share.next_part += 1
+        if record.pts_last is not None:
+            share.last_pts = record.pts_last
+        writer.add_segment(dataclasses.replace(record, index=writer.next_index(), name=name))
+        if check is not None:
+            writer.add_check(dataclasses.replace(check, name=name))
+        if entry is not None:
+            await asyncio.to_thread(append_index, writer.path.parent, dataclasses.replace(entry, name=name))
+        if self.catalog:
+            self.catalog.segment_added(channel_id, video_id, record.bytes)
+        ingest_shared_segments_total.labels(channel=channel_id, method=method).inc()
 
-    async def _segment_counter(self, channel_id: str, out_dir: str):
-        while channel_id in self.processes:
-            try:
-                writer = self._manifest_writers.get(channel_id)
-                if writer:
-                    count = len([p for p in pathlib.Path(out_dir).glob('part_*.ts')])
-                    writer._manifest.segments = count
-                    writer._flush()
-            except Exception:
-                pass
-            await asyncio.sleep(5)
+    def sessions(self) -> Dict[str, str]:
+        # channel -> video of every open session
+        return {c: w.manifest.video_id for c, w in self._manifest_writers.items() if w.manifest}
+
+    def is_recording(self, channel_id: str, video_id: str) -> bool:
+        writer = self._manifest_writers.get(channel_id)
+        return writer is not None and writer.manifest is not None and writer.manifest.video_id == video_id
 
     def get_channel_state(self, channel_id: str) -> str:
         return self._channel_states.get(channel_id, 'idle')
+
+    def channel_states(self) -> Dict[str, str]:
+        return {c: st for c, st in self._channel_states.items() if st != 'idle'}
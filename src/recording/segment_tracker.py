@@ -0,0 +1,192 @@
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import os
+import pathlib
+import re
+import struct
+import sys
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+SEGMENT_LIST = "segments.csv"
+SEGMENT_NAME = re.compile(r"^part_(\d+)\.ts$")
+LIST_POLL_SEC = 1.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT = struct.Struct("iIII")
+
+
+def next_part_number(out_dir: str) -> int:
+    # restarts continue after the highest part on disk instead of overwriting part_000
+    numbers = [int(m.group(1)) for m in (SEGMENT_NAME.match(p.name) for p in pathlib.Path(out_dir).glob("part_*.ts")) if m]
+    return max(numbers, default=-1) + 1
+
+
+def segment_list_name(first_part: int) -> str:
+    # one list per ingest run, so overlapping runs never share (or truncate) a file
+    return SEGMENT_LIST if first_part == 0 else f"segments_{first_part:03d}.csv"
+
+
+@dataclass
+class SegmentEvent:
+    name: str
+    path: pathlib.Path
+    size: int
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+
+_libc = None
+
+
+def _inotify_libc():
+    global _libc
+    if _libc is None and sys.platform.startswith("linux"):
+        try:
+            lib = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            lib.inotify_init1.argtypes = [ctypes.c_int]
+            lib.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            _libc = lib
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc or None
+
+
+def inotify_available() -> bool:
+    return _inotify_libc() is not None
+
+
+# Emits an event each time a part_*.ts file of one ingest run is completed.
+# Linux uses inotify IN_CLOSE_WRITE; elsewhere the ffmpeg -segment_list CSV is tailed.
+# Parts outside [first_part, stop_part) belong to another run in the same directory.
+class SegmentTracker:
+    def __init__(self, out_dir: str, mode: str = "auto", first_part: int = 0):
+        self.out_dir = pathlib.Path(out_dir)
+        self.first_part = first_part
+        self.stop_part: Optional[int] = None
+        self.list_path = self.out_dir / segment_list_name(first_part)
+        self.use_inotify = mode == "inotify" or (mode == "auto" and inotify_available())
+        self._fd: Optional[int] = None
+        self._offset = 0
+        self._buffer = b""
+        self._queue: "asyncio.Queue[SegmentEvent]" = asyncio.Queue()
+
+    def reset(self):
+        # ffmpeg truncates its segment list on start; drop the previous run's file so no entry is replayed
+        try:
+            self.list_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def start(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        if not self.use_inotify:
+            return
+        libc = _inotify_libc()
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0 or libc.inotify_add_watch(fd, os.fsencode(self.out_dir), IN_CLOSE_WRITE) < 0:
+            log.warning("inotify unavailable for %s (errno %d); tailing %s", self.out_dir, ctypes.get_errno(), self.list_path.name)
+            if fd >= 0:
+                os.close(fd)
+            self.use_inotify = False
+            return
+        self._fd = fd
+        asyncio.get_running_loop().add_reader(fd, self._on_readable)
+
+    def _on_readable(self):
+        for ev in self._read_inotify():
+            self._queue.put_nowait(ev)
+
+    def _read_inotify(self) -> List[SegmentEvent]:
+        events: List[SegmentEvent] = []
+        if self._fd is None:
+            return events
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return events
+        pos = 0
+        while pos + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, pos)
+            name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0").decode(errors="replace")
+            pos += _EVENT.size + length
+            if mask & IN_CLOSE_WRITE and SEGMENT_NAME.match(name):
+                ev = self._event(name)
+                if ev:
+                    events.append(ev)
+        return events
+
+    def _read_list(self) -> List[SegmentEvent]:
+        events: List[SegmentEvent] = []
+        try:
+            size = self.list_path.stat().st_size
+        except FileNotFoundError:
+            return events
+        if size < self._offset:
+            self._offset, self._buffer = 0, b""
+        if size == self._offset:
+            return events
+        with self.list_path.open("rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+        self._offset = size
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            fields = line.decode(errors="replace").strip().split(",")
+            if not fields or not SEGMENT_NAME.match(fields[0]):
+                continue
+            ev = self._event(fields[0])
+            if ev and len(fields) >= 3:
+                try:
+                    ev.start, ev.end = float(fields[1]), float(fields[2])
+                except ValueError:
+                    pass
+            if ev:
+                events.append(ev)
+        return events
+
+    def _event(self, name: str) -> Optional[SegmentEvent]:
+        number = int(SEGMENT_NAME.match(name).group(1))
+        if number < self.first_part or (self.stop_part is not None and number >= self.stop_part):
+            return None
+        path = self.out_dir / name
+        try:
+            return SegmentEvent(name=name, path=path, size=path.stat().st_size)
+        except FileNotFoundError:
+            return None
+
+    def drain(self) -> List[SegmentEvent]:
+        # pick up segments closed right before the ingest exited
+        pending: List[SegmentEvent] = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        return pending + (self._read_inotify() if self.use_inotify else self._read_list())
+
+    async def events(self) -> AsyncIterator[SegmentEvent]:
+        # list entries go through the queue too, so drain() still sees any not yet consumed
+        while True:
+            if self.use_inotify:
+                yield await self._queue.get()
+                continue
+            for ev in self._read_list():
+                self._queue.put_nowait(ev)
+            if self._queue.empty():
+                await asyncio.sleep(LIST_POLL_SEC)
+            else:
+                yield self._queue.get_nowait()
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(self._fd)
+            except RuntimeError:
+                pass
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,234 @@
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    channel_id TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    started_at REAL,
+    ended_at REAL,
+    segments INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    dir_mtime REAL,
+    updated_at REAL,
+    PRIMARY KEY (channel_id, video_id)
+);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started_at);
+CREATE INDEX IF NOT EXISTS sessions_channel ON sessions (channel_id, started_at);
+CREATE TABLE IF NOT EXISTS jobs (
+    channel_id TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output TEXT,
+    error TEXT,
+    created_at REAL,
+    updated_at REAL,
+    PRIMARY KEY (channel_id, video_id, kind)
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at);
+"""
+
+COLUMNS = ("channel_id", "video_id", "path", "started_at", "ended_at", "segments", "bytes")
+JOB_COLUMNS = ("channel_id", "video_id", "kind", "path", "state", "attempts", "output", "error", "created_at", "updated_at")
+
+
+class Catalog:
+    def __init__(self, db_path: str, root: str):
+        self.root = pathlib.Path(root)
+        self._prefix = os.path.join(str(self.root), "")
+        self.db_path = pathlib.Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        # bumped on every write; together with the epoch it makes a cheap ETag
+        self.epoch = f"{os.getpid():x}{int(time.time()):x}"
+        self.version = 0
+
+    def revision(self) -> str:
+        # data_version moves when another connection (e.g. a sharded worker) commits
+        with self._lock:
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+        return f"{self.version}.{data_version}"
+
+    def _write(self, sql: str, params: Iterable[Any] = ()):
+        with self._lock:
+            self._db.execute(sql, tuple(params))
+            self.version += 1
+
+    def session_started(self, channel_id: str, video_id: str, path: str, started_at: float):
+        self._write(
+            "INSERT INTO sessions (channel_id, video_id, path, started_at, ended_at, updated_at) VALUES (?, ?, ?, ?, NULL, ?) "
+            "ON CONFLICT (channel_id, video_id) DO UPDATE SET ended_at = NULL, updated_at = excluded.updated_at",
+            (channel_id, video_id, path, started_at, time.time()),
+        )
+
+    def segment_added(self, channel_id: str, video_id: str, size: int):
+        self._write(
+            "UPDATE sessions SET segments = segments + 1, bytes = bytes + ?, updated_at = ? WHERE channel_id = ? AND video_id = ?",
+            (size, time.time(), channel_id, video_id),
+        )
+
+    def session_ended(self, channel_id: str, video_id: str, ended_at: float):
+        self._write(
+            "UPDATE sessions SET ended_at = ?, updated_at = ? WHERE channel_id = ? AND video_id = ?",
+            (ended_at, time.time(), channel_id, video_id),
+        )
+
+    def remove(self, channel_id: str, video_id: str):
+        self._write("DELETE FROM sessions WHERE channel_id = ? AND video_id = ?", (channel_id, video_id))
+
+    def moved(self, channel_id: str, video_id: str, path: str):
+        self._write("UPDATE sessions SET path = ?, updated_at = ? WHERE channel_id = ? AND video_id = ?", (path, time.time(), channel_id, video_id))
+
+    def sessions_oldest_first(self) -> List[Dict[str, Any]]:
+        # retention candidates; only sessions still under the recording root
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM sessions WHERE substr(path, 1, ?) = ? ORDER BY started_at ASC",
+                (len(self._prefix), self._prefix),
+            ).fetchall()
+        return [dict(zip(COLUMNS, r)) for r in rows]
+
+    def _scan_session(self, video_dir: pathlib.Path) -> Dict[str, Any]:
+        info: Dict[str, Any] = {}
+        manifest = video_dir / "manifest.json"
+        if manifest.exists():
+            try:
+                info = json.loads(manifest.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                info = {}
+        parts = list(video_dir.glob("part_*.ts"))
+        sizes = [p.stat().st_size for p in parts]
+        started = info.get("started_at") or (min((p.stat().st_mtime for p in parts), default=video_dir.stat().st_mtime))
+        return {"started_at": started, "ended_at": info.get("ended_at"), "segments": len(parts), "bytes": sum(sizes)}
+
+    def rebuild(self) -> int:
+        # only directories whose mtime moved since the last scan are re-read
+        with self._lock:
+            rows = self._db.execute("SELECT channel_id, video_id, dir_mtime, path FROM sessions").fetchall()
+        known = {(c, v): m for c, v, m, _ in rows}
+        # sessions moved to a cold tier are not under the root and must not be dropped
+        outside = {(c, v) for c, v, _, p in rows if not p.startswith(self._prefix)}
+        seen = set()
+        upserts: List[Tuple[Any, ...]] = []
+        if self.root.exists():
+            for channel_dir in self.root.iterdir():
+                if not channel_dir.is_dir() or channel_dir.name.startswith("."):
+                    continue
+                for video_dir in channel_dir.iterdir():
+                    if not video_dir.is_dir():
+                        continue
+                    key = (channel_dir.name, video_dir.name)
+                    seen.add(key)
+                    mtime = video_dir.stat().st_mtime
+                    if known.get(key) == mtime:
+                        continue
+                    s = self._scan_session(video_dir)
+                    upserts.append((key[0], key[1], str(video_dir), s["started_at"], s["ended_at"], s["segments"], s["bytes"], mtime, time.time()))
+        removed = [k for k in known if k not in seen and k not in outside]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO sessions (channel_id, video_id, path, started_at, ended_at, segments, bytes, dir_mtime, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (channel_id, video_id) DO UPDATE SET "
+                "path = excluded.path, started_at = excluded.started_at, ended_at = excluded.ended_at, "
+                "segments = excluded.segments, bytes = excluded.bytes, dir_mtime = excluded.dir_mtime, updated_at = excluded.updated_at",
+                upserts,
+            )
+            self._db.executemany("DELETE FROM sessions WHERE channel_id = ? AND video_id = ?", removed)
+            self._db.execute("COMMIT")
+            self.version += 1
+        return len(upserts)
+
+    def query(
+        self,
+        channel_id: Optional[str] = None,
+        channels_in: Optional[List[str]] = None,
+        channels_not_in: Optional[List[str]] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 1000,
+        offset: int = 0,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        where: List[str] = []
+        params: List[Any] = []
+        if channel_id:
+            where.append("channel_id = ?")
+            params.append(channel_id)
+        if since is not None:
+            where.append("started_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("started_at < ?")
+            params.append(until)
+        # a session carries its channel's live state only while it is open
+        if channels_in is not None:
+            where.append(f"(ended_at IS NULL AND channel_id IN ({','.join('?' * len(channels_in))}))")
+            params.extend(channels_in)
+        if channels_not_in is not None:
+            where.append(f"(ended_at IS NOT NULL OR channel_id NOT IN ({','.join('?' * len(channels_not_in))}))")
+            params.extend(channels_not_in)
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM sessions{clause}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM sessions{clause} ORDER BY started_at DESC LIMIT ? OFFSET ?",
+                params + [limit, offset],
+            ).fetchall()
+        return [dict(zip(COLUMNS, r)) for r in rows], total
+
+    def get(self, channel_id: str, video_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM sessions WHERE channel_id = ? AND video_id = ?", (channel_id, video_id)
+            ).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    # post-processing jobs live next to the sessions they belong to, so they survive restarts
+    def job_enqueue(self, channel_id: str, video_id: str, kind: str, path: str):
+        now = time.time()
+        self._write(
+            "INSERT INTO jobs (channel_id, video_id, kind, path, state, attempts, created_at, updated_at) VALUES (?, ?, ?, ?, 'queued', 0, ?, ?) "
+            "ON CONFLICT (channel_id, video_id, kind) DO UPDATE SET state = 'queued', path = excluded.path, error = NULL, "
+            "attempts = 0, updated_at = excluded.updated_at WHERE jobs.state != 'running'",
+            (channel_id, video_id, kind, path, now, now),
+        )
+
+    def job_update(self, channel_id: str, video_id: str, kind: str, state: str, error: Optional[str] = None, output: Optional[str] = None, attempt: bool = False):
+        self._write(
+            "UPDATE jobs SET state = ?, error = ?, output = COALESCE(?, output), attempts = attempts + ?, updated_at = ? "
+            "WHERE channel_id = ? AND video_id = ? AND kind = ?",
+            (state, error, output, int(attempt), time.time(), channel_id, video_id, kind),
+        )
+
+    def jobs(self, state: Optional[str] = None, channel_id: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        where: List[str] = []
+        params: List[Any] = []
+        if state:
+            where.append("state = ?")
+            params.append(state)
+        if channel_id:
+            where.append("channel_id = ?")
+            params.append(channel_id)
+        clause = f" WHERE {' AND '.join(where)}" if where else ""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs{clause} ORDER BY created_at LIMIT ?", params + [limit]
+            ).fetchall()
+        return [dict(zip(JOB_COLUMNS, r)) for r in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
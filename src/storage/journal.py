@@ -0,0 +1,71 @@
+import json
+import pathlib
+from dataclasses import dataclass, asdict
+from typing import IO, List, Optional
+
+JOURNAL_NAME = "segments.jsonl"
+
+
+@dataclass
+class SegmentRecord:
+    index: int
+    name: str
+    started_at: float
+    duration: Optional[float]
+    bytes: int
+    pts_first: Optional[int]
+    pts_last: Optional[int]
+    crc32: int
+    # HLS variant the part was recorded at; absent in journals written before quality switching
+    quality: Optional[str] = None
+
+    def to_dict(self):
+        return asdict(self)
+
+
+class SegmentJournal:
+    # one JSON line per closed segment; never rewritten, so a crash loses at most the line being written
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self._fh: Optional[IO[str]] = None
+
+    def append(self, record: SegmentRecord):
+        if self._fh is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            torn = _ends_torn(self.path)
+            self._fh = self.path.open("a", encoding="utf-8")
+            if torn:
+                self._fh.write("\n")
+        self._fh.write(json.dumps(record.to_dict(), separators=(",", ":")) + "\n")
+        self._fh.flush()
+
+    def replay(self) -> List[SegmentRecord]:
+        return read_journal(self.path)
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+
+def _ends_torn(path: pathlib.Path) -> bool:
+    try:
+        with path.open("rb") as f:
+            f.seek(-1, 2)
+            return f.read(1) != b"\n"
+    except OSError:
+        return False
+
+
+def read_journal(path: pathlib.Path) -> List[SegmentRecord]:
+    records: List[SegmentRecord] = []
+    if not path.exists():
+        return records
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(SegmentRecord(**json.loads(line)))
+            except (ValueError, TypeError):
+                # torn final line after a crash
+                continue
+    return records
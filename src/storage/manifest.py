@@ -1,8 +1,11 @@
 import json
 import time
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, List, Optional, Set
+
+from .journal import JOURNAL_NAME, SegmentJournal, SegmentRecord
+from .ts_verify import SegmentCheck, append_check, integrity_summary, read_checks
 
 @dataclass
 class SessionManifest:
@@ -12,35 +15,99 @@ class SessionManifest:
     started_at: float
     ended_at: Optional[float] = None
     segments: int = 0
+    bytes: int = 0
+    duration: float = 0.0
+    journal: str = JOURNAL_NAME
+    updated_at: Optional[float] = None
+    # verifier totals, once any part has been checked
+    integrity: Optional[Dict[str, Any]] = None
+    # variant changes within the session: first part at the new quality, when, from, to
+    quality_switches: List[Dict[str, Any]] = field(default_factory=list)
 
     def to_dict(self):
         return asdict(self)
 
+# manifest.json is a summary compacted from the per-segment journal every `compact_interval` seconds
 class ManifestWriter:
-    def __init__(self, path: Path):
+    def __init__(self, path: Path, compact_interval: float = 60.0):
         self.path = path
+        self.compact_interval = compact_interval
+        self.journal = SegmentJournal(path.parent / JOURNAL_NAME)
         self._manifest: Optional[SessionManifest] = None
+        self._names: Set[str] = set()
+        self._checks: Dict[str, SegmentCheck] = {}
+        self._last_flush = 0.0
+        # quality of the last journaled part
+        self._quality: Optional[str] = None
+
+    @property
+    def manifest(self) -> Optional[SessionManifest]:
+        return self._manifest
 
     def start(self, channel_id: str, video_id: str, quality: str):
         self._manifest = SessionManifest(channel_id=channel_id, video_id=video_id, quality=quality, started_at=time.time())
+        self._quality = None
+        # resuming a session (restart or crash): the journal holds the history so far
+        records = self.journal.replay()
+        if records:
+            self._manifest.started_at = records[0].started_at
+            for r in records:
+                self._apply(r)
+        self._checks = read_checks(self.path.parent)
+        if self._checks:
+            self._manifest.integrity = integrity_summary(self._checks.values())
         self._flush()
 
-    def increment_segment(self):
-        if self._manifest:
-            self._manifest.segments += 1
+    def _apply(self, record: SegmentRecord):
+        self._names.add(record.name)
+        self._manifest.segments += 1
+        self._manifest.bytes += record.bytes
+        self._manifest.duration += record.duration or 0.0
+        # the journal is the record of switches; the manifest lists them and the current quality
+        if record.quality and record.quality != self._quality:
+            if self._quality is not None:
+                self._manifest.quality_switches.append({"part": record.name, "at": record.started_at, "from": self._quality, "to": record.quality})
+            self._quality = record.quality
+            self._manifest.quality = record.quality
+
+    def add_check(self, check: SegmentCheck):
+        if not self._manifest:
+            return
+        append_check(self.path.parent, check)
+        self._checks[check.name] = check
+        self._manifest.integrity = integrity_summary(self._checks.values())
+
+    def has_segment(self, name: str) -> bool:
+        return name in self._names
+
+    def next_index(self) -> int:
+        return self._manifest.segments if self._manifest else 0
+
+    def add_segment(self, record: SegmentRecord):
+        if not self._manifest:
+            return
+        self.journal.append(record)
+        self._apply(record)
+        if time.time() - self._last_flush >= self.compact_interval:
             self._flush()
 
     def end(self):
         if self._manifest:
             self._manifest.ended_at = time.time()
             self._flush()
+        self.journal.close()
+
+    def suspend(self):
+        # handed over to another instance, which replays the journal; the session stays open
+        self._flush()
+        self.journal.close()
 
     def _flush(self):
         if not self._manifest:
             return
+        self._manifest.updated_at = self._last_flush = time.time()
         self.path.parent.mkdir(parents=True, exist_ok=True)
         tmp = self.path.with_suffix(".tmp")
         with tmp.open("w", encoding="utf-8") as f:
             json.dump(self._manifest.to_dict(), f, ensure_ascii=False, indent=2)
         tmp.replace(self.path)
-
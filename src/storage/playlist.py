@@ -0,0 +1,66 @@
+import math
+import os
+import pathlib
+from typing import Dict, List, Optional, Tuple
+
+from .journal import JOURNAL_NAME, SegmentRecord, read_journal
+from src.recording.segment_tracker import SEGMENT_NAME
+
+# timestamps further apart than this between consecutive parts mark a gap (restart, lost media)
+MAX_PTS_GAP = 10 * 90000
+CACHE_SIZE = 256
+
+_cache: Dict[pathlib.Path, Tuple[Tuple[int, int], List[SegmentRecord]]] = {}
+
+
+def journal_records(session_dir: pathlib.Path) -> List[SegmentRecord]:
+    # the journal is append-only, so a (mtime, size) match means nothing changed since the last read
+    path = session_dir / JOURNAL_NAME
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        _cache.pop(path, None)
+        return []
+    key = (st.st_mtime_ns, st.st_size)
+    hit = _cache.get(path)
+    if hit and hit[0] == key:
+        return hit[1]
+    records = sorted(read_journal(path), key=lambda r: r.index)
+    if len(_cache) >= CACHE_SIZE:
+        _cache.clear()
+    _cache[path] = (key, records)
+    return records
+
+
+def _discontinuous(prev: SegmentRecord, cur: SegmentRecord) -> bool:
+    prev_m, cur_m = SEGMENT_NAME.match(prev.name), SEGMENT_NAME.match(cur.name)
+    if prev_m and cur_m and int(cur_m.group(1)) != int(prev_m.group(1)) + 1:
+        return True
+    if prev.pts_last is None or cur.pts_first is None:
+        return False
+    return cur.pts_first < prev.pts_last or cur.pts_first - prev.pts_last > MAX_PTS_GAP
+
+
+def render_playlist(records: List[SegmentRecord], ended: bool, default_duration: float, uri_prefix: str = "") -> str:
+    # An HLS media playlist over the closed parts. A live session is an EVENT playlist that
+    # players reload as it grows; an ended one is VOD. Restarts and timestamp resets get
+    # EXT-X-DISCONTINUITY so players do not stall on the jump.
+    durations = [r.duration if r.duration and r.duration > 0 else default_duration for r in records]
+    target = max([math.ceil(d) for d in durations] or [math.ceil(default_duration)])
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        f"#EXT-X-PLAYLIST-TYPE:{'VOD' if ended else 'EVENT'}",
+    ]
+    prev: Optional[SegmentRecord] = None
+    for record, duration in zip(records, durations):
+        if prev is not None and _discontinuous(prev, record):
+            lines.append("#EXT-X-DISCONTINUITY")
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(uri_prefix + record.name)
+        prev = record
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import os
+import pathlib
+import re
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from .catalog import Catalog
+from src.metrics.registry import disk_used_bytes, disk_free_bytes, retention_evictions_total, retention_bytes_freed_total
+
+log = logging.getLogger(__name__)
+
+DEFAULT_POLICY = "*"
+_SIZE = re.compile(r"^(\d+(?:\.\d+)?)([KMGT]?)B?$", re.I)
+_AGE = re.compile(r"^(\d+(?:\.\d+)?)([smhd]?)$", re.I)
+_SIZE_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+_AGE_UNITS = {"S": 1, "M": 60, "H": 3600, "D": 86400}
+
+
+@dataclass
+class RetentionPolicy:
+    max_age_sec: Optional[float] = None
+    max_bytes: Optional[int] = None
+    keep: Optional[int] = None
+
+
+def _amount(value: str, pattern: re.Pattern, units: Dict[str, int], default_unit: str) -> float:
+    m = pattern.match(value.strip())
+    if not m:
+        raise ValueError(f"bad retention value: {value}")
+    return float(m.group(1)) * units[(m.group(2) or default_unit).upper()]
+
+
+def parse_policies(raw: str) -> Dict[str, RetentionPolicy]:
+    # "*:age=30d,size=500G;UCxxxx:keep=5" -> {"*": ..., "UCxxxx": ...}
+    policies: Dict[str, RetentionPolicy] = {}
+    for entry in filter(None, (e.strip() for e in (raw or "").split(";"))):
+        channel, _, rules = entry.partition(":")
+        policy = RetentionPolicy()
+        for rule in filter(None, (r.strip() for r in rules.split(","))):
+            key, _, value = rule.partition("=")
+            key = key.strip().lower()
+            if key == "age":
+                policy.max_age_sec = _amount(value, _AGE, _AGE_UNITS, "d")
+            elif key == "size":
+                policy.max_bytes = int(_amount(value, _SIZE, _SIZE_UNITS, ""))
+            elif key == "keep":
+                policy.keep = int(value)
+            else:
+                raise ValueError(f"unknown retention rule: {rule}")
+        policies[channel.strip() or DEFAULT_POLICY] = policy
+    return policies
+
+
+def _tree_size(path: pathlib.Path) -> int:
+    total = 0
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _same_device(a: pathlib.Path, b: pathlib.Path) -> bool:
+    # compared on the nearest existing ancestors, as either may not exist yet
+    def dev(p: pathlib.Path) -> Optional[int]:
+        for candidate in (p, *p.resolve().parents):
+            try:
+                return os.stat(candidate).st_dev
+            except OSError:
+                continue
+        return None
+    return dev(a) is not None and dev(a) == dev(b)
+
+
+# Keeps RECORDING_ROOT within its watermarks. Per-channel policies are applied first; if
+# `high` is set and the filesystem is still above it (fraction used), finished sessions
+# are evicted oldest-first until it is at or below `low` (default: `high`). Candidates come from the catalog, so a
+# pass costs one query instead of a tree walk. Evicted sessions are deleted, or moved to
+# `cold_dir` when one is configured. Sessions `is_active` claims (recording, or being
+# remuxed) are never touched.
+class RetentionEngine:
+    def __init__(
+        self,
+        catalog: Catalog,
+        root: str,
+        high: Optional[float] = None,
+        low: Optional[float] = None,
+        policies: Optional[Dict[str, RetentionPolicy]] = None,
+        cold_dir: Optional[str] = None,
+        is_active: Optional[Callable[[str, str], bool]] = None,
+        interval: float = 60,
+    ):
+        if high is not None:
+            low = high if low is None else low
+            if not 0 < low <= high <= 1:
+                raise ValueError("retention watermarks must satisfy 0 < low <= high <= 1")
+        self.catalog = catalog
+        self.root = pathlib.Path(root)
+        self.high = high
+        self.low = low
+        self.policies = policies or {}
+        self.cold_dir = pathlib.Path(cold_dir) if cold_dir else None
+        self.is_active = is_active or (lambda channel_id, video_id: False)
+        self.interval = interval
+        if high is not None and self.cold_dir is not None and _same_device(self.root, self.cold_dir):
+            log.warning("RETENTION_COLD_DIR is on the recording filesystem; moving sessions there frees no space for the watermarks")
+
+    def disk_usage(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        usage = shutil.disk_usage(self.root)
+        disk_used_bytes.set(usage.used)
+        disk_free_bytes.set(usage.free)
+        return usage
+
+    def _evictable(self, session: Dict[str, Any]) -> bool:
+        return not self.is_active(session["channel_id"], session["video_id"])
+
+    def _policy_victims(self, sessions: List[Dict[str, Any]], now: float) -> List[tuple]:
+        victims: List[tuple] = []
+        by_channel: Dict[str, List[Dict[str, Any]]] = {}
+        for s in sessions:
+            by_channel.setdefault(s["channel_id"], []).append(s)
+        for channel_id, rows in by_channel.items():
+            policy = self.policies.get(channel_id) or self.policies.get(DEFAULT_POLICY)
+            if policy is None:
+                continue
+            # rows are oldest-first; walk from the newest to decide what is kept
+            kept = 0
+            kept_bytes = 0
+            for s in reversed(rows):
+                if not self._evictable(s):
+                    kept += 1
+                    kept_bytes += s["bytes"] or 0
+                    continue
+                reason = None
+                if policy.max_age_sec is not None and now - (s["started_at"] or now) > policy.max_age_sec:
+                    reason = "age"
+                elif policy.keep is not None and kept >= policy.keep:
+                    reason = "keep"
+                elif policy.max_bytes is not None and kept_bytes + (s["bytes"] or 0) > policy.max_bytes:
+                    reason = "size"
+                if reason:
+                    victims.append((s, reason))
+                else:
+                    kept += 1
+                    kept_bytes += s["bytes"] or 0
+        return victims
+
+    def _evict(self, session: Dict[str, Any], reason: str) -> int:
+        # returns the bytes freed on the recording filesystem
+        path = pathlib.Path(session["path"])
+        channel_id, video_id = session["channel_id"], session["video_id"]
+        size = _tree_size(path) if path.exists() else 0
+        if self.cold_dir is not None:
+            target = self.cold_dir / channel_id / video_id
+            target.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists():
+                if _same_device(path, target.parent):
+                    # a rename on the same filesystem frees nothing
+                    size = 0
+                shutil.move(str(path), str(target))
+            self.catalog.moved(channel_id, video_id, str(target))
+            action = "move"
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+            self.catalog.remove(channel_id, video_id)
+            action = "delete"
+        retention_evictions_total.labels(channel=channel_id, reason=reason, action=action).inc()
+        retention_bytes_freed_total.inc(size)
+        log.info("Retention %s %s/%s (%s, %d bytes)", "moved" if action == "move" else "deleted", channel_id, video_id, reason, size)
+        return size
+
+    def run_once(self) -> int:
+        now = time.time()
+        sessions = self.catalog.sessions_oldest_first()
+        evicted = set()
+        for s, reason in self._policy_victims(sessions, now):
+            self._evict(s, reason)
+            evicted.add((s["channel_id"], s["video_id"]))
+        usage = self.disk_usage()
+        if self.high is not None and usage.total and usage.used / usage.total > self.high:
+            # sizes are measured as sessions go; the real usage is re-read afterwards
+            to_free = usage.used - self.low * usage.total
+            for s in sessions:
+                if to_free <= 0:
+                    break
+                if (s["channel_id"], s["video_id"]) in evicted or not self._evictable(s):
+                    continue
+                to_free -= self._evict(s, "watermark")
+                evicted.add((s["channel_id"], s["video_id"]))
+            usage = self.disk_usage()
+            if usage.used / usage.total > self.high:
+                log.warning("Recording root still %.0f%% full after retention; only active sessions are left", usage.used / usage.total * 100)
+        return len(evicted)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                log.warning("Retention pass failed: %s", e)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,164 @@
+import json
+import pathlib
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .journal import JOURNAL_NAME, SegmentRecord, read_journal
+from .ts_probe import PTS_WRAP, SCAN_CHUNK, TS_PACKET, psi_packets, iter_pes_pts, sync_offset
+
+INDEX_NAME = "seek_index.jsonl"
+# one seek point per second is plenty for cutting and keeps an 8 h session index small
+MIN_SPACING = 90000
+COPY_CHUNK = 1 << 20
+
+
+@dataclass
+class SegmentIndex:
+    name: str
+    pts_first: Optional[int]
+    # (pts, byte offset) of keyframes, in file order
+    points: List[Tuple[int, int]] = field(default_factory=list)
+
+
+def scan_keyframes(path: pathlib.Path) -> SegmentIndex:
+    # video keyframes (random_access_indicator set); audio-only streams fall back to PES starts
+    points: List[Tuple[int, int]] = []
+    fallback: List[Tuple[int, int]] = []
+    first_pid = None
+    pts_first = None
+    with path.open("rb") as f:
+        start = sync_offset(f.read(SCAN_CHUNK))
+        if start is None:
+            return SegmentIndex(path.name, None)
+        f.seek(start)
+        offset = start
+        while True:
+            chunk = f.read(SCAN_CHUNK)
+            if len(chunk) < TS_PACKET:
+                break
+            for pos, pid, stream_id, pts, random_access in iter_pes_pts(chunk, offset):
+                if pts_first is None:
+                    pts_first = pts
+                if 0xE0 <= stream_id <= 0xEF and random_access:
+                    if not points or (pts - points[-1][0]) % PTS_WRAP >= MIN_SPACING:
+                        points.append((pts, pos))
+                elif not points:
+                    first_pid = pid if first_pid is None else first_pid
+                    if pid == first_pid and (not fallback or (pts - fallback[-1][0]) % PTS_WRAP >= MIN_SPACING):
+                        fallback.append((pts, pos))
+            offset += len(chunk)
+    return SegmentIndex(path.name, pts_first, points or fallback)
+
+
+def index_segment(path: pathlib.Path) -> SegmentIndex:
+    # appended next to the journal as each part closes
+    entry = scan_keyframes(path)
+    append_index(path.parent, entry)
+    return entry
+
+
+def append_index(session_dir: pathlib.Path, entry: SegmentIndex):
+    with (session_dir / INDEX_NAME).open("a", encoding="utf-8") as f:
+        f.write(json.dumps(asdict(entry), separators=(",", ":")) + "\n")
+
+
+def read_index(session_dir: pathlib.Path) -> Dict[str, SegmentIndex]:
+    entries: Dict[str, SegmentIndex] = {}
+    path = session_dir / INDEX_NAME
+    if not path.exists():
+        return entries
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                data = json.loads(line)
+                entries[data["name"]] = SegmentIndex(data["name"], data["pts_first"], [tuple(p) for p in data["points"]])
+            except (ValueError, KeyError, TypeError):
+                # torn final line after a crash
+                continue
+    return entries
+
+
+def build_index(session_dir: pathlib.Path) -> int:
+    # indexes journaled parts recorded before the index existed; returns how many were added
+    have = read_index(session_dir)
+    added = 0
+    for record in sorted(read_journal(session_dir / JOURNAL_NAME), key=lambda r: r.index):
+        path = session_dir / record.name
+        if record.name not in have and path.exists():
+            index_segment(path)
+            added += 1
+    return added
+
+
+def _duration(record: SegmentRecord) -> float:
+    if record.duration:
+        return record.duration
+    if record.pts_first is not None and record.pts_last is not None:
+        return ((record.pts_last - record.pts_first) % PTS_WRAP) / 90000.0
+    return 0.0
+
+
+def _offset_at(entry: SegmentIndex, seconds: float, after: bool) -> Optional[int]:
+    # byte offset of the last keyframe at/before `seconds` into the part, or of the first
+    # one past it when `after` (None: to the end of the part)
+    if entry.pts_first is None or not entry.points:
+        return None if after else 0
+    target = seconds * 90000
+    chosen = None if after else 0
+    for pts, offset in entry.points:
+        rel = (pts - entry.pts_first) % PTS_WRAP
+        if after and rel > target:
+            return offset
+        if not after and rel <= target:
+            chosen = offset
+    return chosen
+
+
+def plan_clip(session_dir: pathlib.Path, t0: float, t1: float, wall: bool = False) -> List[Tuple[pathlib.Path, int, Optional[int]]]:
+    # Byte ranges (path, start, end) covering [t0, t1]: from the keyframe at or before t0 to
+    # the keyframe after t1. Times are seconds from the session start, or unix time with
+    # `wall`. Only the parts the clip touches are read, so the cost follows the clip length.
+    if t1 <= t0:
+        raise ValueError("clip end must be after its start")
+    records = sorted(read_journal(session_dir / JOURNAL_NAME), key=lambda r: r.index)
+    if not records:
+        raise ValueError("session has no segments")
+    spans = []
+    clock = 0.0
+    for r in records:
+        begin = r.started_at if wall else clock
+        spans.append((r, begin, begin + _duration(r)))
+        clock += _duration(r)
+    touched = [s for s in spans if s[2] > t0 and s[1] < t1]
+    if not touched:
+        raise ValueError("clip is outside the recorded range")
+    index = read_index(session_dir)
+    ranges: List[Tuple[pathlib.Path, int, Optional[int]]] = []
+    for i, (record, begin, _) in enumerate(touched):
+        path = session_dir / record.name
+        entry = index.get(record.name)
+        if entry is None and (i == 0 or i == len(touched) - 1):
+            # not indexed yet: scan just this part
+            entry = scan_keyframes(path)
+        start = _offset_at(entry, t0 - begin, after=False) if i == 0 else 0
+        end = _offset_at(entry, t1 - begin, after=True) if i == len(touched) - 1 else None
+        ranges.append((path, start, end))
+    return ranges
+
+
+def read_clip(ranges: List[Tuple[pathlib.Path, int, Optional[int]]]) -> Iterator[bytes]:
+    for path, start, end in ranges:
+        with path.open("rb") as f:
+            if start > 0:
+                # cut mid-part: players need the PAT/PMT before the first keyframe
+                head = f.read(SCAN_CHUNK)
+                yield psi_packets(head, sync_offset(head) or 0)
+            f.seek(start)
+            remaining = None if end is None else end - start
+            while remaining is None or remaining > 0:
+                chunk = f.read(COPY_CHUNK if remaining is None else min(COPY_CHUNK, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
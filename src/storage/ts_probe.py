@@ -0,0 +1,157 @@
+import os
+import pathlib
+import zlib
+from dataclasses import dataclass
+from typing import Iterator, Optional, Tuple
+
+TS_PACKET = 188
+SYNC_BYTE = 0x47
+PTS_WRAP = 1 << 33
+PROBE_WINDOW = 1024 * 1024
+CHUNK = 4 * 1024 * 1024
+SCAN_CHUNK = CHUNK - CHUNK % TS_PACKET
+
+
+@dataclass
+class SegmentProbe:
+    pts_first: Optional[int]
+    pts_last: Optional[int]
+    crc32: int
+    size: int
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.pts_first is None or self.pts_last is None:
+            return None
+        return ((self.pts_last - self.pts_first) % PTS_WRAP) / 90000.0
+
+
+def parse_pts(b: bytes, pos: int) -> int:
+    return (
+        ((b[pos] >> 1) & 0x07) << 30
+        | b[pos + 1] << 22
+        | (b[pos + 2] >> 1) << 15
+        | b[pos + 3] << 7
+        | b[pos + 4] >> 1
+    )
+
+
+def payload_offset(pkt: bytes) -> Optional[int]:
+    afc = (pkt[3] >> 4) & 0x03
+    if afc in (0, 2):
+        return None
+    off = 4
+    if afc == 3:
+        off += 1 + pkt[4]
+    return off if off < TS_PACKET else None
+
+
+def sync_offset(buf: bytes) -> Optional[int]:
+    for start in range(min(TS_PACKET, len(buf))):
+        if buf[start] == SYNC_BYTE and (start + TS_PACKET >= len(buf) or buf[start + TS_PACKET] == SYNC_BYTE):
+            return start
+    return None
+
+
+def iter_pes_pts(buf: bytes, base_offset: int = 0) -> Iterator[Tuple[int, int, int, int, bool]]:
+    # yields (byte offset of packet, pid, stream_id, pts, random_access) for packets that start a PES with a PTS
+    start = sync_offset(buf)
+    if start is None:
+        return
+    for pos in range(start, len(buf) - TS_PACKET + 1, TS_PACKET):
+        pkt = buf[pos:pos + TS_PACKET]
+        if pkt[0] != SYNC_BYTE or not pkt[1] & 0x40:
+            continue
+        off = payload_offset(pkt)
+        if off is None or off + 14 > TS_PACKET:
+            continue
+        if pkt[off:off + 3] != b"\x00\x00\x01" or not (0xC0 <= pkt[off + 3] <= 0xEF):
+            continue
+        if not pkt[off + 7] & 0x80:
+            continue
+        pid = ((pkt[1] & 0x1F) << 8) | pkt[2]
+        random_access = bool((pkt[3] >> 4) & 0x02 and pkt[4] > 0 and pkt[5] & 0x40)
+        yield base_offset + pos, pid, pkt[off + 3], parse_pts(pkt, off + 9), random_access
+
+
+def probe_segment(path: pathlib.Path) -> SegmentProbe:
+    crc = 0
+    size = 0
+    head = b""
+    tail = b""
+    with path.open("rb") as f:
+        while True:
+            chunk = f.read(CHUNK)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            if len(head) < PROBE_WINDOW:
+                head += chunk[:PROBE_WINDOW - len(head)]
+            tail = (tail + chunk)[-PROBE_WINDOW:]
+    first = next((pts for _, _, _, pts, _ in iter_pes_pts(head)), None)
+    last = None
+    for _, _, _, pts, _ in iter_pes_pts(tail):
+        if last is None or (pts - last) % PTS_WRAP < PTS_WRAP // 2:
+            last = pts
+    return SegmentProbe(pts_first=first, pts_last=last, crc32=crc, size=size)
+
+
+def psi_packets(buf: bytes, start: int) -> bytes:
+    # the PAT and the PMT it points at; a trimmed file must still start with them
+    pat = pmt = None
+    pmt_pid = None
+    for pos in range(start, len(buf) - TS_PACKET + 1, TS_PACKET):
+        pkt = buf[pos:pos + TS_PACKET]
+        pid = ((pkt[1] & 0x1F) << 8) | pkt[2]
+        off = payload_offset(pkt)
+        if off is None or not pkt[1] & 0x40:
+            continue
+        if pid == 0 and pat is None:
+            pat = pkt
+            section = off + 1 + pkt[off]
+            for entry in range(section + 8, min(section + 3 + (((pkt[section + 1] & 0x0F) << 8) | pkt[section + 2]) - 4, TS_PACKET - 3), 4):
+                if (pkt[entry] << 8 | pkt[entry + 1]) != 0:
+                    pmt_pid = ((pkt[entry + 2] & 0x1F) << 8) | pkt[entry + 3]
+                    break
+        elif pmt_pid is not None and pid == pmt_pid:
+            pmt = pkt
+            break
+    return (pat or b"") + (pmt or b"")
+
+
+def trim_head(path: pathlib.Path, after_pts: int) -> Optional[int]:
+    # Drops everything before the first video keyframe whose PTS is past after_pts, so a
+    # run that overlapped its predecessor does not repeat media. Returns the new size, or
+    # None when the whole file lies inside the overlap.
+    with path.open("rb") as f:
+        head = f.read(SCAN_CHUNK)
+        start = sync_offset(head)
+        if start is None:
+            return None
+        f.seek(start)
+        offset = start
+        cut = None
+        while cut is None:
+            chunk = f.read(SCAN_CHUNK)
+            if len(chunk) < TS_PACKET:
+                return None
+            for pos, _, stream_id, pts, random_access in iter_pes_pts(chunk, offset):
+                if 0xE0 <= stream_id <= 0xEF and random_access and 0 < (pts - after_pts) % PTS_WRAP < PTS_WRAP // 2:
+                    cut = pos
+                    break
+            offset += len(chunk)
+        if cut == start:
+            return path.stat().st_size
+        psi = psi_packets(head, start)
+        tmp = path.with_name(path.name + ".trim")
+        with tmp.open("wb") as out:
+            out.write(psi)
+            f.seek(cut)
+            while True:
+                chunk = f.read(CHUNK)
+                if not chunk:
+                    break
+                out.write(chunk)
+    os.replace(tmp, path)
+    return path.stat().st_size
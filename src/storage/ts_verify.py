@@ -0,0 +1,229 @@
+import asyncio
+import contextlib
+import json
+import logging
+import mmap
+import os
+import pathlib
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterable, List, Optional
+
+from .catalog import Catalog
+from .journal import JOURNAL_NAME, read_journal
+from .ts_probe import TS_PACKET, SYNC_BYTE, sync_offset
+from src.metrics.registry import segments_verified_total, segment_stream_errors_total, verify_bytes_total
+
+log = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+VERIFY_NAME = "verify.jsonl"
+NULL_PID = 0x1FFF
+PCR_HZ = 27_000_000
+PCR_WRAP = (1 << 33) * 300
+# ISO 13818-1 requires a PCR at least every 100 ms
+MAX_PCR_GAP = PCR_HZ // 10
+
+
+@dataclass
+class SegmentCheck:
+    name: str
+    bytes: int
+    packets: int
+    sync_errors: int
+    truncated_bytes: int
+    cc_errors: int
+    pcr_gaps: int
+    duration: Optional[float]
+    bitrate_kbps: Optional[float]
+    checked_at: float = field(default_factory=time.time)
+
+    @property
+    def ok(self) -> bool:
+        return self.packets > 0 and self.sync_errors == 0 and self.truncated_bytes == 0 and self.cc_errors == 0
+
+
+def _check_packets(pk: "np.ndarray") -> Dict[str, Any]:
+    # pk is an (n, 188) view of the file; only header columns are touched, all at once
+    synced = pk[:, 0] == SYNC_BYTE
+    b3 = pk[:, 3]
+    pid = ((pk[:, 1].astype(np.uint16) & 0x1F) << 8) | pk[:, 2]
+    afc = (b3 >> 4) & 0x03
+    cc = (b3 & 0x0F).astype(np.int16)
+    af_len = pk[:, 4]
+    flags = pk[:, 5]
+    has_af = (afc & 0x02).astype(bool) & (af_len > 0)
+    discontinuity = has_af & ((flags & 0x80) > 0)
+
+    # continuity: per PID, packets that carry payload count up by one (mod 16); a repeat
+    # (duplicate packet) or a flagged discontinuity is allowed
+    sel = np.flatnonzero(synced & ((afc & 0x01) > 0) & (pid != NULL_PID))
+    order = sel[np.argsort(pid[sel], kind="stable")]
+    same_pid = pid[order][1:] == pid[order][:-1]
+    step = (cc[order][1:] - cc[order][:-1]) & 0x0F
+    cc_errors = int(np.count_nonzero(same_pid & (step != 1) & (step != 0) & ~discontinuity[order][1:]))
+
+    # PCR of the first PID that carries one
+    pcr_rows = np.flatnonzero(synced & has_af & (af_len >= 7) & ((flags & 0x10) > 0))
+    pcr_gaps = 0
+    duration = None
+    if len(pcr_rows):
+        pcr_rows = pcr_rows[pid[pcr_rows] == pid[pcr_rows[0]]]
+        f = pk[pcr_rows, 6:12].astype(np.uint64)
+        base = (f[:, 0] << 25) | (f[:, 1] << 17) | (f[:, 2] << 9) | (f[:, 3] << 1) | (f[:, 4] >> 7)
+        pcr = base * 300 + (((f[:, 4] & 1) << 8) | f[:, 5])
+        if len(pcr) > 1:
+            delta = (pcr[1:].astype(np.int64) - pcr[:-1].astype(np.int64)) % PCR_WRAP
+            # a backwards jump shows up as a huge forward one after the modulo
+            pcr_gaps = int(np.count_nonzero(delta > MAX_PCR_GAP))
+            duration = float(delta[delta <= MAX_PCR_GAP].sum()) / PCR_HZ
+    return {"sync_errors": int(len(pk) - np.count_nonzero(synced)), "cc_errors": cc_errors, "pcr_gaps": pcr_gaps, "duration": duration}
+
+
+def verify_segment(path: pathlib.Path) -> SegmentCheck:
+    # the file is mapped, not read: the page cache feeds NumPy directly
+    if np is None:
+        raise RuntimeError("numpy is required for segment verification. Please install it.")
+    size = os.path.getsize(path)
+    if size < TS_PACKET:
+        return SegmentCheck(path.name, size, 0, 0, size, 0, 0, None, None)
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = sync_offset(mm[:TS_PACKET * 2])
+        if start is None:
+            return SegmentCheck(path.name, size, size // TS_PACKET, size // TS_PACKET, size % TS_PACKET, 0, 0, None, None)
+        count = (size - start) // TS_PACKET
+        buf = np.frombuffer(mm, dtype=np.uint8, count=count * TS_PACKET, offset=start)
+        try:
+            result = _check_packets(buf.reshape(count, TS_PACKET))
+        finally:
+            # views must be gone before the mapping can close
+            del buf
+    duration = result["duration"]
+    bitrate = size * 8 / duration / 1000 if duration else None
+    return SegmentCheck(
+        name=path.name,
+        bytes=size,
+        packets=count,
+        sync_errors=result["sync_errors"] + (1 if start else 0),
+        truncated_bytes=(size - start) % TS_PACKET,
+        cc_errors=result["cc_errors"],
+        pcr_gaps=result["pcr_gaps"],
+        duration=duration,
+        bitrate_kbps=bitrate,
+    )
+
+
+def append_check(session_dir: pathlib.Path, check: SegmentCheck):
+    with (session_dir / VERIFY_NAME).open("a", encoding="utf-8") as f:
+        f.write(json.dumps(asdict(check), separators=(",", ":")) + "\n")
+
+
+def read_checks(session_dir: pathlib.Path) -> Dict[str, SegmentCheck]:
+    # the latest check per part wins
+    checks: Dict[str, SegmentCheck] = {}
+    path = session_dir / VERIFY_NAME
+    if not path.exists():
+        return checks
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                check = SegmentCheck(**json.loads(line))
+            except (ValueError, TypeError):
+                continue
+            checks[check.name] = check
+    return checks
+
+
+def integrity_summary(checks: Iterable[SegmentCheck]) -> Dict[str, Any]:
+    checks = list(checks)
+    return {
+        "checked": len(checks),
+        "sync_errors": sum(c.sync_errors for c in checks),
+        "cc_errors": sum(c.cc_errors for c in checks),
+        "pcr_gaps": sum(c.pcr_gaps for c in checks),
+        "truncated": sum(1 for c in checks if c.truncated_bytes),
+        "bad_segments": sorted(c.name for c in checks if not c.ok),
+    }
+
+
+def patch_manifest(session_dir: pathlib.Path, summary: Dict[str, Any]):
+    # closed sessions only; a live ManifestWriter owns manifest.json while recording
+    path = session_dir / "manifest.json"
+    try:
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return
+    if manifest.get("ended_at") is None:
+        return
+    manifest["integrity"] = summary
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def record_metrics(channel_id: str, check: SegmentCheck):
+    segments_verified_total.labels(channel=channel_id, result="ok" if check.ok else "corrupt").inc()
+    verify_bytes_total.inc(check.bytes)
+    for kind in ("sync_errors", "cc_errors", "pcr_gaps"):
+        value = getattr(check, kind)
+        if value:
+            segment_stream_errors_total.labels(channel=channel_id, kind=kind).inc(value)
+
+
+def verify_session(session_dir: pathlib.Path, recheck: bool = False) -> List[SegmentCheck]:
+    # checks the parts not checked yet (all with recheck) and returns the new results;
+    # with a journal only closed (journaled) parts are considered
+    checks = read_checks(session_dir)
+    records = read_journal(session_dir / JOURNAL_NAME)
+    if records:
+        paths = [session_dir / r.name for r in sorted(records, key=lambda r: r.index)]
+    else:
+        paths = sorted(session_dir.glob("part_*.ts"))
+    done: List[SegmentCheck] = []
+    for path in paths:
+        if (not recheck and path.name in checks) or not path.exists():
+            continue
+        check = verify_segment(path)
+        append_check(session_dir, check)
+        checks[check.name] = check
+        done.append(check)
+    if done:
+        patch_manifest(session_dir, integrity_summary(checks.values()))
+    return done
+
+
+# Sweeps closed sessions in the catalog, oldest first, and verifies every part not checked
+# yet. Live parts are verified by the recorder as they close.
+class ArchiveVerifier:
+    def __init__(self, catalog: Catalog, interval: float = 3600, governor=None):
+        self.catalog = catalog
+        self.interval = interval
+        # Governor (or None); a pass holds a background slot
+        self.governor = governor
+
+    def run_once(self) -> int:
+        checked = 0
+        for session in self.catalog.sessions_oldest_first():
+            if session["ended_at"] is None:
+                continue
+            for check in verify_session(pathlib.Path(session["path"])):
+                record_metrics(session["channel_id"], check)
+                checked += 1
+                if not check.ok:
+                    log.warning("Segment %s/%s/%s failed verification: %s", session["channel_id"], session["video_id"], check.name, check)
+        return checked
+
+    async def run(self):
+        while True:
+            try:
+                async with self.governor.slot("background") if self.governor else contextlib.nullcontext():
+                    checked = await asyncio.to_thread(self.run_once)
+                if checked:
+                    log.info("Archive verification checked %d segments", checked)
+            except Exception as e:
+                log.warning("Archive verification pass failed: %s", e)
+            await asyncio.sleep(self.interval)
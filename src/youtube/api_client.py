@@ -1,23 +1,249 @@
+import asyncio
+import datetime
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from zoneinfo import ZoneInfo
+
 import httpx
 
+from src.metrics.registry import youtube_api_requests_total, youtube_quota_used, youtube_quota_pace_factor
+
+log = logging.getLogger(__name__)
+
 BASE_URL = "https://www.googleapis.com/youtube/v3"
+BATCH_SIZE = 50
+BATCH_WINDOW_SEC = 0.05
+ETAG_CACHE_SIZE = 4096
+# channels.list, playlistItems.list and videos.list all cost 1 unit (search.list costs 100)
+QUOTA_COST = {"channels": 1, "playlistItems": 1, "videos": 1}
+# 403 reasons that mean the project's quota is spent; others (e.g. playlistItemsNotAccessible)
+# concern one resource
+QUOTA_REASONS = {"quotaExceeded", "dailyLimitExceeded"}
+# Daily quota resets at midnight Pacific time
+QUOTA_TZ = ZoneInfo("America/Los_Angeles")
+
+
+class QuotaExceeded(OSError):
+    pass
+
+
+def _error_reasons(r: httpx.Response) -> Set[str]:
+    try:
+        return {e.get("reason") for e in r.json()["error"]["errors"]}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return set()
+
+
+def _parse_time(value: str) -> Optional[float]:
+    # RFC 3339 as returned by the API, e.g. 2024-05-01T18:00:00Z
+    try:
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class QuotaBudget:
+    def __init__(self, daily_units: int, reserve_units: int = 0):
+        self.daily_units = daily_units
+        self.reserve_units = reserve_units
+        self.used = 0
+        self._started = time.time()
+        self._reset_at = self._next_reset(self._started)
+
+    @staticmethod
+    def _next_reset(now: float) -> float:
+        local = datetime.datetime.fromtimestamp(now, QUOTA_TZ)
+        midnight = (local + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight.timestamp()
+
+    def _roll(self, now: float):
+        if now >= self._reset_at:
+            self.used = 0
+            self._started = now
+            self._reset_at = self._next_reset(now)
+
+    def remaining(self) -> int:
+        self._roll(time.time())
+        return max(0, self.daily_units - self.reserve_units - self.used)
+
+    def spend(self, units: int):
+        self._roll(time.time())
+        if self.used + units > self.daily_units - self.reserve_units:
+            raise QuotaExceeded("YouTube API quota budget exhausted")
+        self.used += units
+        youtube_quota_used.set(self.used)
+
+    def pace_factor(self) -> float:
+        # >1 when the current spend rate would exhaust the budget before the next reset
+        now = time.time()
+        self._roll(now)
+        remaining = self.daily_units - self.reserve_units - self.used
+        if remaining <= 0:
+            return float("inf")
+        rate = self.used / max(now - self._started, 600.0)
+        allowed = remaining / max(self._reset_at - now, 60.0)
+        factor = max(1.0, min(rate / allowed, 60.0)) if allowed > 0 else 60.0
+        youtube_quota_pace_factor.set(factor)
+        return factor
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "daily_units": self.daily_units,
+            "reserve_units": self.reserve_units,
+            "used": self.used,
+            "remaining": self.remaining(),
+            "resets_at": self._reset_at,
+            "pace_factor": self.pace_factor(),
+        }
+
 
 class YouTubeClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: str = BASE_URL, daily_quota: int = 10000, quota_reserve: int = 0, recent_uploads: int = 5):
         self._key = api_key
-        self._http = httpx.Client(timeout=10)
-
-    def search_live(self, channel_id: str):
-        params = {
-            "part": "snippet",
-            "channelId": channel_id,
-            "eventType": "live",
-            "type": "video",
-            "key": self._key,
-        }
-        r = self._http.get(f"{BASE_URL}/search", params=params)
+        self._http = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=10,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+        self.quota = QuotaBudget(daily_quota, quota_reserve)
+        self._recent_uploads = recent_uploads
+        self._etags: "OrderedDict[Tuple, Tuple[str, Dict[str, Any]]]" = OrderedDict()
+        self._uploads: Dict[str, str] = {}
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        # channel -> scheduled start (unix time) of its next announced live, from the last check
+        self.upcoming: Dict[str, Optional[float]] = {}
+
+    async def _get(self, endpoint: str, params: Dict[str, str]) -> Dict[str, Any]:
+        self.quota.spend(QUOTA_COST.get(endpoint, 1))
+        cache_key = (endpoint, tuple(sorted(params.items())))
+        cached = self._etags.get(cache_key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        r = await self._http.get(f"/{endpoint}", params={**params, "key": self._key}, headers=headers)
+        youtube_api_requests_total.labels(endpoint=endpoint, status=str(r.status_code)).inc()
+        if r.status_code == 304 and cached:
+            self._etags.move_to_end(cache_key)
+            return cached[1]
         if r.status_code == 403:
-            raise OSError("YouTube API quota exceeded")
+            reasons = _error_reasons(r)
+            # an unreadable 403 is taken as quota, which stops spending
+            if not reasons or reasons & QUOTA_REASONS:
+                raise QuotaExceeded("YouTube API quota exceeded")
         r.raise_for_status()
         data = r.json()
-        return data.get("items", [])
\ No newline at end of file
+        etag = r.headers.get("ETag") or data.get("etag")
+        if etag:
+            self._etags[cache_key] = (etag, data)
+            self._etags.move_to_end(cache_key)
+            while len(self._etags) > ETAG_CACHE_SIZE:
+                self._etags.popitem(last=False)
+        return data
+
+    async def live_video_id(self, channel_id: str) -> Optional[str]:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((channel_id, fut))
+        if len(self._pending) >= BATCH_SIZE:
+            self._spawn_flush()
+        elif self._flush_timer is None:
+            self._flush_timer = loop.call_later(BATCH_WINDOW_SEC, self._spawn_flush)
+        return await fut
+
+    def _spawn_flush(self):
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        batch, self._pending = self._pending[:BATCH_SIZE], self._pending[BATCH_SIZE:]
+        if batch:
+            task = asyncio.create_task(self._flush(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if self._pending:
+            self._flush_timer = asyncio.get_running_loop().call_later(BATCH_WINDOW_SEC, self._spawn_flush)
+
+    async def _flush(self, batch: List[Tuple[str, asyncio.Future]]):
+        cids = list(dict.fromkeys(cid for cid, fut in batch if not fut.done()))
+        errors: Dict[str, Exception] = {}
+        try:
+            result = await self.live_videos(cids, errors) if cids else {}
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for cid, fut in batch:
+            if fut.done():
+                continue
+            if cid in errors:
+                # only this channel falls back to yt-dlp
+                fut.set_exception(errors[cid])
+            else:
+                fut.set_result(result.get(cid))
+
+    async def _uploads_playlists(self, channel_ids: List[str]) -> Dict[str, str]:
+        missing = [c for c in channel_ids if c not in self._uploads]
+        for i in range(0, len(missing), BATCH_SIZE):
+            chunk = missing[i:i + BATCH_SIZE]
+            data = await self._get("channels", {"part": "contentDetails", "id": ",".join(chunk), "maxResults": str(BATCH_SIZE)})
+            for item in data.get("items", []):
+                uploads = item.get("contentDetails", {}).get("relatedPlaylists", {}).get("uploads")
+                if uploads:
+                    self._uploads[item["id"]] = uploads
+        return {c: self._uploads[c] for c in channel_ids if c in self._uploads}
+
+    async def live_videos(self, channel_ids: List[str], errors: Optional[Dict[str, Exception]] = None) -> Dict[str, Optional[str]]:
+        # A channel whose uploads cannot be listed (no uploads playlist, 404 playlistNotFound,
+        # 403 playlistItemsNotAccessible) does not fail the batch: it is left out of the
+        # result and its error goes into `errors`.
+        playlists = await self._uploads_playlists(channel_ids)
+
+        async def _recent(cid: str, playlist_id: str):
+            try:
+                data = await self._get("playlistItems", {"part": "contentDetails", "playlistId": playlist_id, "maxResults": str(self._recent_uploads)})
+            except httpx.HTTPStatusError as e:
+                return cid, e
+            return cid, [i.get("contentDetails", {}).get("videoId") for i in data.get("items", [])]
+
+        owners: Dict[str, str] = {}
+        failed: Dict[str, Exception] = {c: LookupError(f"no uploads playlist for {c}") for c in channel_ids if c not in playlists}
+        for cid, vids in await asyncio.gather(*(_recent(c, p) for c, p in playlists.items())):
+            if isinstance(vids, Exception):
+                log.warning("Listing uploads of %s failed: %s", cid, vids)
+                failed[cid] = vids
+                continue
+            for vid in vids:
+                if vid:
+                    owners[vid] = cid
+        if errors is not None:
+            errors.update(failed)
+
+        result: Dict[str, Optional[str]] = {c: None for c in channel_ids if c not in failed}
+        started: Dict[str, str] = {}
+        upcoming: Dict[str, Optional[float]] = {c: None for c in playlists if c not in failed}
+        vids = list(owners)
+        for i in range(0, len(vids), BATCH_SIZE):
+            chunk = vids[i:i + BATCH_SIZE]
+            data = await self._get("videos", {"part": "snippet,liveStreamingDetails", "id": ",".join(chunk), "maxResults": str(BATCH_SIZE)})
+            for item in data.get("items", []):
+                details = item.get("liveStreamingDetails") or {}
+                content = item.get("snippet", {}).get("liveBroadcastContent")
+                if content == "upcoming" and details.get("scheduledStartTime"):
+                    cid = owners[item["id"]]
+                    at = _parse_time(details["scheduledStartTime"])
+                    if at is not None and (upcoming[cid] is None or at < upcoming[cid]):
+                        upcoming[cid] = at
+                if content != "live" or details.get("actualEndTime"):
+                    continue
+                cid = owners[item["id"]]
+                start = details.get("actualStartTime") or ""
+                if result[cid] is None or start > started.get(cid, ""):
+                    result[cid] = item["id"]
+                    started[cid] = start
+        self.upcoming.update(upcoming)
+        return result
+
+    async def aclose(self):
+        await self._http.aclose()
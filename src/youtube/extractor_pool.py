@@ -0,0 +1,261 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from src.config.settings import settings
+
+log = logging.getLogger(__name__)
+
+# Lower value runs first: resolving an HLS URL for a (re)starting ingest beats live detection
+PRIORITY_HLS = 0
+PRIORITY_DETECT = 1
+
+_BASE_OPTS = {"quiet": True, "no_warnings": True, "skip_download": True}
+
+
+class ExtractionError(RuntimeError):
+    pass
+
+
+# --- worker side -----------------------------------------------------------
+
+def _ydl(cache: Dict[Any, Any], flat: bool = False, fmt: Optional[str] = None, headers: Optional[Dict[str, str]] = None):
+    key = (flat, fmt, tuple(sorted((headers or {}).items())))
+    ydl = cache.get(key)
+    if ydl is None:
+        import yt_dlp  # type: ignore
+        opts: Dict[str, Any] = dict(_BASE_OPTS)
+        if flat:
+            opts["extract_flat"] = True
+        if fmt:
+            opts["format"] = fmt
+        if headers:
+            opts["http_headers"] = headers
+        ydl = cache[key] = yt_dlp.YoutubeDL(opts)
+    return ydl
+
+
+def _job_live_video_id(cache, url: str) -> Optional[str]:
+    try:
+        info = _ydl(cache, flat=True).extract_info(url, download=False)
+    except Exception:
+        return None
+    if not info:
+        return None
+    if info.get("_type") == "url" and info.get("id"):
+        return info.get("id")
+    if info.get("id") and info.get("webpage_url_basename") == "watch":
+        return info.get("id")
+    for entry in info.get("entries", []) or []:
+        vid = entry.get("id")
+        if vid:
+            return vid
+    return None
+
+
+def _hls_formats(info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    formats: List[Dict[str, Any]] = info.get("formats", []) or []
+    return [f for f in formats if f.get("protocol") in ("m3u8", "m3u8_native") and f.get("url")]
+
+
+def _job_hls_url(cache, url: str, preferred_height: Optional[int], headers: Optional[Dict[str, str]]) -> Optional[str]:
+    info = _ydl(cache, fmt="best", headers=headers).extract_info(url, download=False)
+    if not info:
+        return None
+    hls_formats = _hls_formats(info)
+    if not hls_formats:
+        return info.get("url")
+    selected = None
+    if preferred_height:
+        hls_formats.sort(key=lambda f: (f.get("height") or 0, f.get("tbr") or 0), reverse=True)
+        for f in hls_formats:
+            h = f.get("height") or 0
+            if h <= preferred_height:
+                selected = f
+                break
+    if not selected:
+        selected = max(hls_formats, key=lambda f: (f.get("height") or 0, f.get("tbr") or 0))
+    return selected.get("url") if selected else None
+
+
+def _job_hls_heights(cache, url: str) -> List[int]:
+    info = _ydl(cache).extract_info(url, download=False)
+    return sorted(set(f.get("height") for f in _hls_formats(info or {}) if f.get("height")), reverse=True)
+
+
+JOBS: Dict[str, Callable[..., Any]] = {
+    "live_video_id": _job_live_video_id,
+    "hls_url": _job_hls_url,
+    "hls_heights": _job_hls_heights,
+}
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker_main(conn):
+    cache: Dict[Any, Any] = {}
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+        kind, args = job
+        try:
+            conn.send((True, JOBS[kind](cache, *args), _rss_bytes()))
+        except Exception as e:
+            conn.send((False, f"{type(e).__name__}: {e}", _rss_bytes()))
+
+
+# --- parent side -----------------------------------------------------------
+
+class _Worker:
+    def __init__(self, index: int):
+        self.index = index
+        self.proc: Optional[multiprocessing.process.BaseProcess] = None
+        self.conn = None
+        self.jobs = 0
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.is_alive()
+
+    async def ensure_started(self):
+        if self.alive:
+            return
+        ctx = multiprocessing.get_context("spawn")
+        parent, child = ctx.Pipe()
+        proc = ctx.Process(target=_worker_main, args=(child,), name=f"extractor-{self.index}", daemon=True)
+        await asyncio.to_thread(proc.start)
+        child.close()
+        self.proc, self.conn, self.jobs = proc, parent, 0
+
+    async def stop(self, kill: bool = False):
+        proc, conn = self.proc, self.conn
+        self.proc = self.conn = None
+        if proc is None:
+            return
+        try:
+            if kill:
+                proc.kill()
+            else:
+                conn.send(None)
+        except Exception:
+            proc.kill()
+        await asyncio.to_thread(proc.join, 5)
+        if proc.is_alive():
+            proc.kill()
+        conn.close()
+
+
+class ExtractorPool:
+    def __init__(self, size: int, max_jobs: int = 200, max_rss_mb: int = 512, timeout: float = 30.0):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.timeout = timeout
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._workers: List[_Worker] = []
+        self._tasks: List[asyncio.Task] = []
+
+    def _ensure_running(self):
+        if self._queue is not None:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [_Worker(i) for i in range(self.size)]
+        self._tasks = [asyncio.create_task(self._serve(w)) for w in self._workers]
+
+    async def submit(self, kind: str, *args, priority: int = PRIORITY_DETECT, timeout: Optional[float] = None) -> Any:
+        if self.size <= 0:
+            return await asyncio.wait_for(asyncio.to_thread(JOBS[kind], {}, *args), timeout or self.timeout)
+        self._ensure_running()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((priority, next(self._seq), kind, args, fut))
+        # cancelling fut (timeout or caller cancellation) makes the serving task kill the worker
+        return await asyncio.wait_for(fut, timeout or self.timeout)
+
+    async def _serve(self, worker: _Worker):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, kind, args, fut = await self._queue.get()
+            if fut.done():
+                continue
+            try:
+                await worker.ensure_started()
+                worker.conn.send((kind, args))
+            except Exception as e:
+                await worker.stop(kill=True)
+                if not fut.done():
+                    fut.set_exception(ExtractionError(f"extractor worker unavailable: {e}"))
+                continue
+            readable = loop.create_future()
+            fd = worker.conn.fileno()
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+            try:
+                await asyncio.wait({readable, fut}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                loop.remove_reader(fd)
+            if fut.done():
+                log.warning("Extractor job %s abandoned; killing worker %d", kind, worker.index)
+                await worker.stop(kill=True)
+                continue
+            try:
+                ok, result, rss = worker.conn.recv()
+            except Exception as e:
+                await worker.stop(kill=True)
+                fut.set_exception(ExtractionError(f"extractor worker died: {e}"))
+                continue
+            worker.jobs += 1
+            if ok:
+                fut.set_result(result)
+            else:
+                fut.set_exception(ExtractionError(result))
+            if worker.jobs >= self.max_jobs or rss > self.max_rss:
+                log.info("Recycling extractor worker %d after %d jobs rss=%dMB", worker.index, worker.jobs, rss // (1024 * 1024))
+                await worker.stop()
+
+    async def close(self):
+        for t in self._tasks:
+            t.cancel()
+        for w in self._workers:
+            await w.stop()
+        self._tasks, self._workers, self._queue = [], [], None
+
+
+_pool: Optional[ExtractorPool] = None
+
+
+def get_pool() -> ExtractorPool:
+    global _pool
+    if _pool is None:
+        _pool = ExtractorPool(
+            settings.extractor_workers,
+            max_jobs=settings.extractor_max_jobs,
+            max_rss_mb=settings.extractor_max_rss_mb,
+            timeout=settings.extractor_timeout_sec,
+        )
+    return _pool
+
+
+async def extract_live_video_id(url: str) -> Optional[str]:
+    return await get_pool().submit("live_video_id", url, priority=PRIORITY_DETECT)
+
+
+async def extract_hls_url(url: str, preferred_height: Optional[int], headers: Optional[Dict[str, str]] = None) -> Optional[str]:
+    return await get_pool().submit("hls_url", url, preferred_height, headers, priority=PRIORITY_HLS)
+
+
+async def extract_hls_heights(url: str) -> List[int]:
+    return await get_pool().submit("hls_heights", url, priority=PRIORITY_HLS)
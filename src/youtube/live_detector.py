@@ -9,3 +9,13 @@ class LiveDetector:
         now_live = current_video_id is not None
         return changed, now_live
 
+    def seed(self, channel_id: str, video_id: str):
+        # known live from an adopted session; the first check then reports no change
+        self._state[channel_id] = video_id
+
+    def is_live(self, channel_id: str) -> bool:
+        return self._state.get(channel_id) is not None
+
+    def forget(self, channel_id: str):
+        self._state.pop(channel_id, None)
+
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.config.settings import settings
+
+log = logging.getLogger(__name__)
+
+SCHEDULE_DIR = "schedule"
+MAX_STARTS = 60
+HISTORY_HORIZON = 90 * 86400
+DAY = 86400
+WEEK = 7 * DAY
+# a habitual slot needs this many past starts within SLOT_WIDTH of the same time of day/week
+SLOT_SUPPORT = 2
+SLOT_WIDTH = 30 * 60
+# tight polling from a little before an expected start until well after it (streams start late)
+LEAD_SEC = 10 * 60
+GRACE_SEC = 30 * 60
+# checks between the slots of a channel with a routine are this many base intervals apart
+OFF_SCHEDULE_FACTOR = 4
+# not live for this long: the interval grows linearly with the idle time, up to the max
+DORMANT_AFTER = 7 * DAY
+SAVE_DELAY_SEC = 5.0
+
+_SAFE_NAME = re.compile(r"[^A-Za-z0-9_.@-]")
+
+
+@dataclass
+class ChannelHistory:
+    # live starts seen (unix time, oldest first), when the channel was first polled, and the
+    # next scheduled start announced for it, if any
+    starts: List[float] = field(default_factory=list)
+    since: float = field(default_factory=time.time)
+    upcoming: Optional[float] = None
+
+    @property
+    def last_live(self) -> Optional[float]:
+        return self.starts[-1] if self.starts else None
+
+
+# One small JSON file per channel under RECORDING_ROOT/.state/schedule, so sharded workers
+# each write only the channels they own. Files are read on first use; a channel without one
+# is seeded from the start times of its sessions in the catalog.
+class ScheduleHistory:
+    def __init__(self, state_dir: pathlib.Path):
+        self.dir = pathlib.Path(state_dir) / SCHEDULE_DIR
+        self._entries: Dict[str, ChannelHistory] = {}
+        self._seed: Dict[str, List[float]] = {}
+        self._dirty: set = set()
+        self._saver: Optional[asyncio.Task] = None
+
+    def _path(self, channel_id: str) -> pathlib.Path:
+        return self.dir / f"{_SAFE_NAME.sub('_', channel_id)}.json"
+
+    def seed(self, sessions: Iterable[Tuple[str, float]]):
+        # (channel, started_at) of recorded sessions
+        for channel_id, started_at in sessions:
+            if started_at:
+                self._seed.setdefault(channel_id, []).append(started_at)
+
+    def get(self, channel_id: str) -> ChannelHistory:
+        entry = self._entries.get(channel_id)
+        if entry is not None:
+            return entry
+        try:
+            entry = ChannelHistory(**json.loads(self._path(channel_id).read_text(encoding="utf-8")))
+        except FileNotFoundError:
+            starts = sorted(self._seed.pop(channel_id, []))[-MAX_STARTS:]
+            entry = ChannelHistory(starts=starts, since=starts[0] if starts else time.time())
+            self._entries[channel_id] = entry
+            self._changed(channel_id)
+        except (OSError, ValueError, TypeError) as e:
+            log.warning("Dropping unreadable poll history for %s: %s", channel_id, e)
+            entry = ChannelHistory()
+        self._entries[channel_id] = entry
+        return entry
+
+    def record_start(self, channel_id: str, at: float):
+        entry = self.get(channel_id)
+        entry.starts = [s for s in entry.starts if at - s < HISTORY_HORIZON][-(MAX_STARTS - 1):] + [at]
+        if entry.upcoming is not None and entry.upcoming < at + GRACE_SEC:
+            # the announced stream is the one that just started
+            entry.upcoming = None
+        self._changed(channel_id)
+
+    def set_upcoming(self, channel_id: str, at: Optional[float]):
+        entry = self.get(channel_id)
+        if entry.upcoming != at:
+            entry.upcoming = at
+            self._changed(channel_id)
+
+    def _changed(self, channel_id: str):
+        self._dirty.add(channel_id)
+        if self._saver is None or self._saver.done():
+            try:
+                self._saver = asyncio.get_running_loop().create_task(self._save_soon())
+            except RuntimeError:
+                # no loop (CLI use); flush() writes it
+                pass
+
+    async def _save_soon(self):
+        # coalesces the writes of a poll burst into one pass off the event loop
+        await asyncio.sleep(SAVE_DELAY_SEC)
+        await asyncio.to_thread(self.flush)
+
+    def flush(self):
+        dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        self.dir.mkdir(parents=True, exist_ok=True)
+        for channel_id in dirty:
+            entry = self._entries.get(channel_id)
+            if entry is None:
+                continue
+            path = self._path(channel_id)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(asdict(entry)), encoding="utf-8")
+            os.replace(tmp, path)
+
+
+def _slot_support(starts: List[float], at: float, period: int) -> int:
+    # past starts within SLOT_WIDTH of `at` modulo the period (time of day or of week)
+    count = 0
+    for s in starts:
+        d = (at - s) % period
+        if min(d, period - d) <= SLOT_WIDTH:
+            count += 1
+    return count
+
+
+def next_habitual_start(starts: List[float], now: float) -> Optional[float]:
+    # The earliest upcoming repeat of a past start that recurs: on SLOT_SUPPORT days at about
+    # the same time of day, or on as many weeks at the same time of week. Each past start
+    # proposes its next repeat; a proposal that is still in its grace period counts as now.
+    recent = [s for s in starts if now - s < HISTORY_HORIZON]
+    best = None
+    for s in recent:
+        for period in (DAY, WEEK):
+            k = max(1, -(-(now - GRACE_SEC - s) // period))
+            candidate = s + k * period
+            if best is not None and candidate >= best:
+                continue
+            if _slot_support(recent, candidate, period) >= SLOT_SUPPORT:
+                best = candidate
+    return best
+
+
+class PollPolicy:
+    # Per-channel delay until the next live check:
+    # - live (or adopted): the base interval, to notice the end
+    # - around an announced or habitual start: POLL_MIN_INTERVAL_SEC
+    # - between the slots of a channel with a routine: OFF_SCHEDULE_FACTOR base intervals
+    # - otherwise the base interval, stretched for channels idle longer than DORMANT_AFTER up
+    #   to POLL_MAX_INTERVAL_SEC
+    # - channels with a live WebSub subscription: at least WEBSUB_POLL_INTERVAL_SEC
+    # and never sleeping past the lead-in of the next expected start.
+    # The base is read from settings on every call, so PATCH /settings applies at once.
+    def __init__(self, history: ScheduleHistory):
+        self.history = history
+        # channel -> ((start count, last start), next habitual start); recomputed when the
+        # starts change or the cached slot has passed
+        self._habitual: Dict[str, Tuple[Tuple[int, Optional[float]], Optional[float]]] = {}
+
+    def _next_habitual(self, channel_id: str, entry: ChannelHistory, now: float) -> Optional[float]:
+        key = (len(entry.starts), entry.last_live)
+        cached = self._habitual.get(channel_id)
+        if cached and cached[0] == key and (cached[1] is None or now < cached[1] + GRACE_SEC):
+            return cached[1]
+        at = next_habitual_start(entry.starts, now)
+        self._habitual[channel_id] = (key, at)
+        return at
+
+    def next_delay(self, channel_id: str, live: bool, now: Optional[float] = None, pushed: bool = False) -> Tuple[float, str]:
+        base = float(settings.poll_interval_sec)
+        if live or not settings.poll_adaptive:
+            return base, "live" if live else "fixed"
+        now = time.time() if now is None else now
+        tight = float(min(settings.poll_min_interval_sec, base))
+        entry = self.history.get(channel_id)
+        expected: List[Tuple[float, str]] = []
+        if entry.upcoming is not None and now < entry.upcoming + GRACE_SEC:
+            expected.append((entry.upcoming, "upcoming"))
+        habitual = self._next_habitual(channel_id, entry, now)
+        if habitual is not None:
+            expected.append((habitual, "habitual"))
+        for at, reason in expected:
+            if at - LEAD_SEC <= now:
+                return tight, reason
+        idle = now - (entry.last_live or entry.since)
+        delay, reason = base, "active"
+        if habitual is not None:
+            # a channel with a routine rarely starts off it; check it less in between
+            delay, reason = min(max(base, settings.poll_max_interval_sec), base * OFF_SCHEDULE_FACTOR), "off_schedule"
+        if idle > DORMANT_AFTER:
+            delay, reason = min(max(base, settings.poll_max_interval_sec), base * idle / DORMANT_AFTER), "dormant"
+        if pushed and delay < settings.websub_poll_interval_sec:
+            # uploads are announced by WebSub; polling is only the safety net
+            delay, reason = float(settings.websub_poll_interval_sec), "pushed"
+        for at, _ in expected:
+            delay = min(delay, max(tight, at - LEAD_SEC - now))
+        return delay, reason
@@ -1,94 +1,233 @@
 import asyncio
+import heapq
 import logging
-from typing import Optional
+import pathlib
+import random
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 from .api_client import YouTubeClient
 from .live_detector import LiveDetector
+from .poll_policy import PollPolicy, ScheduleHistory
+from . import extractor_pool
+from .extractor_pool import ExtractionError
 from src.recording.recorder import Recorder
 from src.config.settings import settings
 from prometheus_client import Counter
-from src.metrics.registry import poll_duration_seconds, poll_errors_total, last_poll_timestamp, channel_state, CHANNEL_STATE_CODES
+from src.metrics.registry import (
+    poll_check_duration_seconds,
+    poll_schedule_lag_seconds,
+    poll_checks_inflight,
+    poll_errors_total,
+    last_poll_timestamp,
+    live_detection_seconds,
+    poll_delay_seconds,
+    active_recordings,
+    channels_total,
+    channel_state,
+    CHANNEL_STATE_CODES,
+)
 
 log = logging.getLogger(__name__)
 RECORDINGS_STARTED = Counter('poller_recordings_started_total', 'Number of recordings started by poller')
 
 async def resolve_live_video_id_from_handle(handle_or_id: str) -> Optional[str]:
-    try:
-        import yt_dlp  # type: ignore
-    except Exception:
-        return None
-
     # Build a channel live URL; both @handle and UC... work with /live
     base = handle_or_id if handle_or_id.startswith("http") else f"https://www.youtube.com/{handle_or_id}"
     if "/live" not in base:
         base = base.rstrip("/") + "/live"
-
-    def _extract() -> Optional[str]:
-        ydl_opts = {
-            "quiet": True,
-            "no_warnings": True,
-            "skip_download": True,
-            "extract_flat": True,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(base, download=False)
-            except Exception:
-                return None
-            if not info:
-                return None
-            if info.get("_type") == "url" and info.get("id"):
-                return info.get("id")
-            if info.get("id") and info.get("webpage_url_basename") == "watch":
-                return info.get("id")
-            for entry in info.get("entries", []) or []:
-                vid = entry.get("id")
-                if vid:
-                    return vid
-            return None
-
-    return await asyncio.to_thread(_extract)
+    try:
+        return await extractor_pool.extract_live_video_id(base)
+    except ExtractionError as e:
+        log.warning("Live extraction failed for %s: %s", handle_or_id, e)
+        return None
 
 class Poller:
-    def __init__(self, client: Optional[YouTubeClient], recorder: Recorder, detector: LiveDetector):
+    def __init__(
+        self,
+        client: Optional[YouTubeClient],
+        recorder: Recorder,
+        detector: LiveDetector,
+        channels: Optional[Callable[[], Iterable[str]]] = None,
+        pushed: Optional[Callable[[str], bool]] = None,
+    ):
         self.client = client
+        # sharded workers pass their own assignment; otherwise every configured channel
+        self._channel_source = channels or (lambda: settings.channel_ids)
         self.recorder = recorder
         self.detector = detector
-        self.interval = settings.poll_interval_sec
+        self.history = ScheduleHistory(pathlib.Path(settings.recording_root) / ".state")
+        self.policy = PollPolicy(self.history)
+        # the interval the schedule was built with; a PATCH /settings change rescales it
+        self._base_interval = settings.poll_interval_sec
+        # channels whose uploads arrive by WebSub are polled only as a safety net
+        self.pushed = pushed or (lambda cid: False)
+        # (due_time, channel_id) min-heap; each channel is scheduled independently. _due holds
+        # each channel's current due time; heap entries that no longer match it are stale.
+        self._schedule: List[Tuple[float, str]] = []
+        self._due: Dict[str, float] = {}
+        self._scheduled: Set[str] = set()
+        self._inflight: Set[str] = set()
+        self._recheck: Set[str] = set()
+        self._wake = asyncio.Event()
+        self._channels: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
 
     async def _check_channel(self, cid: str) -> Optional[str]:
         if self.client and cid.startswith("UC"):
+            started = time.monotonic()
             try:
-                items = self.client.search_live(cid)
-                return items[0]["id"]["videoId"] if items else None
+                video_id = await self.client.live_video_id(cid)
+                self.history.set_upcoming(cid, self.client.upcoming.get(cid))
+                return video_id
             except Exception as e:
                 log.warning("API check failed for %s: %s; falling back to yt-dlp", cid, e)
-        return await resolve_live_video_id_from_handle(cid)
+            finally:
+                live_detection_seconds.labels(method="api").observe(time.monotonic() - started)
+        started = time.monotonic()
+        try:
+            return await resolve_live_video_id_from_handle(cid)
+        finally:
+            live_detection_seconds.labels(method="ytdlp").observe(time.monotonic() - started)
+
+    def _next_delay(self, cid: str) -> float:
+        interval, reason = self.policy.next_delay(cid, self.detector.is_live(cid), pushed=self.pushed(cid))
+        if self.client and cid.startswith("UC"):
+            # stretch API-checked channels so the daily quota lasts until the reset
+            interval *= min(self.client.quota.pace_factor(), 60.0)
+        poll_delay_seconds.labels(reason=reason).observe(interval)
+        spread = interval * settings.poll_jitter_ratio
+        return max(1.0, interval + random.uniform(-spread, spread))
+
+    def _rescale(self, now: float):
+        # the base interval was changed at runtime: stretch or shrink what is already scheduled
+        new = settings.poll_interval_sec
+        ratio = new / self._base_interval if self._base_interval else 1.0
+        self._schedule = [(now + max(0.0, due - now) * ratio, cid) for due, cid in self._schedule if self._due.get(cid) == due]
+        heapq.heapify(self._schedule)
+        self._due = {cid: due for due, cid in self._schedule}
+        log.info("Poll interval changed from %ss to %ss; rescheduled %d channels", self._base_interval, new, len(self._schedule))
+        self._base_interval = new
+
+    def _push(self, cid: str, due: float):
+        heapq.heappush(self._schedule, (due, cid))
+        self._due[cid] = due
+        self._scheduled.add(cid)
+
+    def check_now(self, cid: str):
+        # a push notification: check the channel right away rather than when it is due
+        if cid not in self._channels:
+            return
+        if cid in self._inflight:
+            # the running check may predate the event; run another one after it
+            self._recheck.add(cid)
+            return
+        self._push(cid, asyncio.get_running_loop().time())
+        self._wake.set()
+
+    def _sync_channels(self, now: float):
+        channels = set(self._channel_source())
+        for cid in self._channels - channels:
+            # removed or handed to another worker: release it so it is not recorded twice
+            self.detector.forget(cid)
+            if cid in self.recorder.processes:
+                log.info("Channel %s unassigned; stopping its recording", cid)
+                task = asyncio.create_task(self.recorder.stop(cid))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        self._channels = channels
+        channels_total.set(len(channels))
+        active_recordings.set(sum(1 for st in self.recorder.channel_states().values() if st == 'recording'))
+        for cid in self._channels - self._scheduled:
+            # channels resumed from a previous instance are already known to be live
+            self._push(cid, now + (self._next_delay(cid) if self.detector.is_live(cid) else random.uniform(0, 1.0)))
+
+    async def _poll_one(self, cid: str, lag: float):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        poll_checks_inflight.inc()
+        try:
+            live_video_id = await asyncio.wait_for(self._check_channel(cid), timeout=settings.poll_check_timeout_sec)
+            changed, now_live = self.detector.update(cid, live_video_id)
+            if changed and now_live:
+                self.history.record_start(cid, time.time())
+                log.info("Starting recording for %s %s", cid, live_video_id)
+                RECORDINGS_STARTED.inc()
+                await self.recorder.start(cid, live_video_id)
+            elif changed and not now_live:
+                log.info("Stopping recording for %s", cid)
+                await self.recorder.stop(cid)
+            # update channel state gauge
+            st = self.recorder.get_channel_state(cid)
+            channel_state.labels(channel=cid).set(CHANNEL_STATE_CODES.get(st, 0))
+            last_poll_timestamp.set_to_current_time()
+        except asyncio.TimeoutError:
+            poll_errors_total.inc()
+            log.warning("Poll timeout channel=%s after %ss", cid, settings.poll_check_timeout_sec)
+        except Exception as e:
+            poll_errors_total.inc()
+            log.exception("Poll error channel=%s error=%s", cid, e)
+        finally:
+            poll_checks_inflight.dec()
+            done = loop.time()
+            poll_check_duration_seconds.labels(channel=cid).observe(done - start)
+            poll_schedule_lag_seconds.observe(lag)
+            self._sem.release()
+            self._scheduled.discard(cid)
+            self._inflight.discard(cid)
+            if cid in self._channels:
+                recheck = cid in self._recheck
+                self._recheck.discard(cid)
+                self._push(cid, done if recheck else done + self._next_delay(cid))
 
     async def run(self):
+        loop = asyncio.get_running_loop()
+        self._sem = asyncio.Semaphore(max(1, settings.poll_concurrency))
+        catalog = getattr(self.recorder, "catalog", None)
+        if catalog is not None:
+            # channels without a history file start from the sessions already recorded
+            sessions = await asyncio.to_thread(catalog.sessions_oldest_first)
+            self.history.seed((s["channel_id"], s["started_at"]) for s in sessions)
+        try:
+            await self._run(loop)
+        finally:
+            self.history.flush()
+
+    async def _run(self, loop: asyncio.AbstractEventLoop):
         while True:
-            start = asyncio.get_event_loop().time()
-            for cid in settings.channel_ids:
-                try:
-                    live_video_id = await self._check_channel(cid)
-                    changed, now_live = self.detector.update(cid, live_video_id)
-                    if changed and now_live:
-                        log.info("Starting recording for %s %s", cid, live_video_id)
-                        RECORDINGS_STARTED.inc()
-                        await self.recorder.start(cid, live_video_id)
-                    elif changed and not now_live:
-                        log.info("Stopping recording for %s", cid)
-                        await self.recorder.stop(cid)
-                    # update channel state gauge
-                    st = self.recorder.get_channel_state(cid)
-                    channel_state.labels(channel=cid).set(CHANNEL_STATE_CODES.get(st, 0))
-                except Exception as e:
-                    poll_errors_total.inc()
-                    log.exception("Poll error channel=%s error=%s", cid, e)
-            duration = asyncio.get_event_loop().time() - start
-            poll_duration_seconds.observe(duration)
-            last_poll_timestamp.set_to_current_time()
-            await asyncio.sleep(self.interval)
+            now = loop.time()
+            if settings.poll_interval_sec != self._base_interval:
+                self._rescale(now)
+            self._sync_channels(now)
+            if not self._schedule:
+                await self._sleep(1)
+                continue
+            due, cid = self._schedule[0]
+            if due > now:
+                # wake up periodically to pick up channel list changes
+                await self._sleep(min(due - now, 1.0))
+                continue
+            heapq.heappop(self._schedule)
+            if self._due.get(cid) != due:
+                # superseded by check_now
+                continue
+            del self._due[cid]
+            if cid not in self._channels:
+                self._scheduled.discard(cid)
+                continue
+            self._inflight.add(cid)
+            await self._sem.acquire()
+            task = asyncio.create_task(self._poll_one(cid, loop.time() - due))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _sleep(self, seconds: float):
+        # cut short by check_now
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
 
     def get_interval(self) -> int:
-        return self.interval
+        return settings.poll_interval_sec
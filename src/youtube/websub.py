@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import pathlib
+import secrets
+import time
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, quote, urlparse
+
+import httpx
+
+from src.metrics.registry import websub_notifications_total, websub_subscriptions, websub_verifications_total
+
+log = logging.getLogger(__name__)
+
+STATE_NAME = "websub.json"
+TOPIC_URL = "https://www.youtube.com/xml/feeds/videos.xml?channel_id="
+ATOM_NS = {"atom": "http://www.w3.org/2005/Atom", "yt": "http://www.youtube.com/xml/schemas/2015", "at": "http://purl.org/atompub/tombstones/1.0"}
+RECONCILE_SEC = 60
+# a request the hub never verified is sent again after this long
+PENDING_RETRY_SEC = 15 * 60
+MAX_BODY = 1 << 20
+
+
+def topic_url(channel_id: str) -> str:
+    return TOPIC_URL + channel_id
+
+
+def channel_of(topic: str) -> Optional[str]:
+    values = parse_qs(urlparse(topic).query).get("channel_id")
+    return values[0] if values else None
+
+
+def parse_feed(body: bytes) -> List[Tuple[str, str]]:
+    # (channel id, video id) of each entry; deleted-entry tombstones carry no new video
+    root = ET.fromstring(body)
+    out = []
+    for entry in root.findall("atom:entry", ATOM_NS):
+        video = entry.findtext("yt:videoId", namespaces=ATOM_NS)
+        channel = entry.findtext("yt:channelId", namespaces=ATOM_NS)
+        if video and channel:
+            out.append((channel, video))
+    return out
+
+
+@dataclass
+class Subscription:
+    channel_id: str
+    # requested -> active (hub verified) -> renewed before expiry; denied by the hub
+    state: str = "requested"
+    requested_at: float = 0.0
+    expires_at: Optional[float] = None
+
+
+# Subscriber side of WebSub for YouTube channel feeds. Subscriptions are requested from the
+# hub for every UC... channel, verified through the callback, renewed ahead of lease expiry
+# and dropped for channels that are no longer configured. A notification is checked against
+# the HMAC secret of its topic and turned into an immediate live check of the channel.
+class WebSubSubscriber:
+    def __init__(
+        self,
+        callback_url: str,
+        hub_url: str,
+        state_dir: pathlib.Path,
+        lease_sec: int = 432000,
+        secret: Optional[str] = None,
+        channels: Optional[Callable[[], Iterable[str]]] = None,
+    ):
+        self.callback_url = callback_url.rstrip("/")
+        self.hub_url = hub_url
+        self.lease_sec = lease_sec
+        self.path = pathlib.Path(state_dir) / STATE_NAME
+        self._channel_source = channels or (lambda: [])
+        self.subscriptions: Dict[str, Subscription] = {}
+        # channels we asked the hub to drop; their unsubscribe verification is confirmed
+        self._leaving: Set[str] = set()
+        self._secret = secret
+        self._http: Optional[httpx.AsyncClient] = None
+        # called with (channel, video) for each notified upload
+        self.on_notify: Callable[[str, str], None] = lambda channel_id, video_id: None
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            data = {}
+        except (OSError, ValueError) as e:
+            log.warning("Ignoring unreadable WebSub state %s: %s", self.path, e)
+            data = {}
+        # a generated secret must outlive restarts: live subscriptions were made with it
+        self._secret = self._secret or data.get("secret") or secrets.token_hex(32)
+        for cid, sub in (data.get("subscriptions") or {}).items():
+            try:
+                self.subscriptions[cid] = Subscription(**sub)
+            except TypeError:
+                continue
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        data = {"secret": self._secret, "subscriptions": {c: asdict(s) for c, s in self.subscriptions.items()}}
+        tmp.write_text(json.dumps(data), encoding="utf-8")
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.path)
+
+    def _topic_secret(self, topic: str) -> str:
+        # one secret per topic, so a leaked one does not sign for other channels
+        return hmac.new(self._secret.encode(), topic.encode(), hashlib.sha256).hexdigest()
+
+    def wanted(self) -> Set[str]:
+        # feeds exist per channel id; @handles stay on polling
+        return {c for c in self._channel_source() if c.startswith("UC")}
+
+    def covers(self, channel_id: str) -> bool:
+        sub = self.subscriptions.get(channel_id)
+        return sub is not None and sub.state == "active" and (sub.expires_at or 0) > time.time()
+
+    def covered(self) -> Set[str]:
+        return {c for c in self.subscriptions if self.covers(c)}
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(timeout=15)
+        return self._http
+
+    async def _request(self, channel_id: str, mode: str) -> bool:
+        topic = topic_url(channel_id)
+        form = {
+            "hub.callback": f"{self.callback_url}/websub/{quote(channel_id, safe='')}",
+            "hub.mode": mode,
+            "hub.topic": topic,
+            "hub.verify": "async",
+        }
+        if mode == "subscribe":
+            form["hub.lease_seconds"] = str(self.lease_sec)
+            form["hub.secret"] = self._topic_secret(topic)
+        try:
+            r = await self.http.post(self.hub_url, data=form)
+        except httpx.HTTPError as e:
+            log.warning("WebSub %s for %s failed: %s", mode, channel_id, e)
+            return False
+        if r.status_code not in (202, 204):
+            log.warning("WebSub %s for %s rejected by hub: %s %s", mode, channel_id, r.status_code, r.text[:200])
+            return False
+        return True
+
+    async def reconcile(self):
+        now = time.time()
+        wanted = self.wanted()
+        changed = False
+        for cid in sorted(wanted):
+            sub = self.subscriptions.get(cid)
+            due = (
+                sub is None
+                or (sub.state in ("requested", "denied") and now - sub.requested_at > PENDING_RETRY_SEC)
+                or (sub.state == "active" and (sub.expires_at or 0) - now < min(86400, self.lease_sec / 4))
+            )
+            if due and await self._request(cid, "subscribe"):
+                state = sub.state if sub is not None and sub.state == "active" else "requested"
+                self.subscriptions[cid] = Subscription(cid, state, now, sub.expires_at if sub else None)
+                changed = True
+        for cid in [c for c in self.subscriptions if c not in wanted]:
+            self._leaving.add(cid)
+            await self._request(cid, "unsubscribe")
+            del self.subscriptions[cid]
+            changed = True
+        for state in ("requested", "active", "denied"):
+            websub_subscriptions.labels(state=state).set(sum(1 for s in self.subscriptions.values() if s.state == state))
+        if changed:
+            await asyncio.to_thread(self._save)
+
+    def verify(self, channel_id: str, mode: str, topic: str, challenge: str, lease_seconds: Optional[int]) -> Optional[str]:
+        # the hub confirms a (un)subscription we asked for; anything else is refused (None)
+        if topic != topic_url(channel_id):
+            websub_verifications_total.labels(mode=mode, result="refused").inc()
+            return None
+        sub = self.subscriptions.get(channel_id)
+        if mode == "subscribe" and sub is not None:
+            sub.state = "active"
+            sub.expires_at = time.time() + (lease_seconds or self.lease_sec)
+            log.info("WebSub subscription for %s active for %ss", channel_id, lease_seconds)
+        elif mode == "unsubscribe" and channel_id in self._leaving and sub is None:
+            self._leaving.discard(channel_id)
+        else:
+            websub_verifications_total.labels(mode=mode, result="refused").inc()
+            return None
+        websub_verifications_total.labels(mode=mode, result="accepted").inc()
+        self._save_soon()
+        return challenge
+
+    def denied(self, channel_id: str, reason: str):
+        sub = self.subscriptions.get(channel_id)
+        if sub is not None:
+            sub.state = "denied"
+            log.warning("WebSub hub denied the subscription for %s: %s", channel_id, reason)
+            self._save_soon()
+
+    def notify(self, channel_id: str, body: bytes, signature: Optional[str]) -> int:
+        # returns how many uploads were accepted; bad signatures are dropped silently, as
+        # WebSub requires (the hub still gets a 2xx)
+        if channel_id not in self.subscriptions:
+            websub_notifications_total.labels(result="unknown_topic").inc()
+            return 0
+        algo, _, digest = (signature or "").partition("=")
+        if algo not in ("sha1", "sha256", "sha384", "sha512") or len(body) > MAX_BODY:
+            websub_notifications_total.labels(result="bad_signature").inc()
+            return 0
+        expected = hmac.new(self._topic_secret(topic_url(channel_id)).encode(), body, algo).hexdigest()
+        if not hmac.compare_digest(expected, digest):
+            websub_notifications_total.labels(result="bad_signature").inc()
+            return 0
+        try:
+            entries = parse_feed(body)
+        except ET.ParseError:
+            websub_notifications_total.labels(result="parse_error").inc()
+            return 0
+        accepted = 0
+        for cid, video_id in entries:
+            if cid != channel_id:
+                continue
+            accepted += 1
+            self.on_notify(cid, video_id)
+        websub_notifications_total.labels(result="ok" if accepted else "empty").inc()
+        return accepted
+
+    def _save_soon(self):
+        task = asyncio.get_running_loop().create_task(asyncio.to_thread(self._save))
+        task.add_done_callback(lambda t: t.exception() and log.warning("Saving WebSub state failed: %s", t.exception()))
+
+    def report(self) -> List[dict]:
+        return [asdict(s) for s in sorted(self.subscriptions.values(), key=lambda s: s.channel_id)]
+
+    async def run(self):
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                log.warning("WebSub reconcile failed: %s", e)
+            await asyncio.sleep(RECONCILE_SEC)
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()